@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Runs scilla-checker over every contract in contracts/ and writes the CSVs
+# behind the analysis figures: `timing` (Figure 12) times the parse, typecheck
+# and sharding analysis phases over many runs per contract, and `goodenough`
+# (Figure 13) records the "good enough" signatures. Contracts are spread over
+# a process pool, one worker pinned to each CPU, and every contract gets a few
+# discarded warmup runs before the timed ones. Results are cached by the hash
+# of the contract, the checker binary and its stdlib, so only changed inputs
+# run again.
+#
+#   ./timing.py timing -o timing.csv
+#   ./timing.py goodenough -o goodenough.csv
+#   ./timing.py timing --runs 20 --workers 4 --fresh
+import argparse
+import datetime
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCILLA_PATH = os.path.join(HERE, "..", "scilla")
+CONTRACTS_PATH = os.path.join(HERE, "..", "contracts")
+CACHE_FILE = os.path.join(HERE, "timing-cache.json")
+GAS_LIMIT = "10000"
+NUM_RUNS = 100
+WARMUP = 3
+CONFIDENCE = 0.95
+
+PHASES = [("Parse", "[Parse] "), ("Typecheck", "[Typecheck] "), ("Analysis", "[Sharding] ")]
+TIMING_HEADER = "Name,LOC,Parse_min,Parse_avg,Parse_max,Typecheck_min,Typecheck_avg,Typecheck_max,Analysis_min,Analysis_avg,Analysis_max"
+# Appended after the columns timing.tex reads
+STATS_HEADER = ",".join("{}_{}".format(p, s) for p, _ in PHASES for s in ("median", "iqr", "ci_lo", "ci_hi")) + ",Runs"
+GOODENOUGH_HEADER = ("Name,Line count,Trans,MaxGESize,ShardingRatio,MaxGENum,SEP,"
+    + ",".join("GE-{}".format(i) for i in range(1, 20)) + ",SEP,Maximal selections")
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def tree_hash(directory):
+    # Names and contents of every file under directory
+    h = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(directory)):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            h.update(os.path.relpath(path, directory).encode())
+            h.update(file_hash(path).encode())
+    return h.hexdigest()
+
+def checker_command(scilla, contract, mode):
+    flag = "-sa-timings" if mode == "timing" else "-sa-ge"
+    return [os.path.join(scilla, "bin", "scilla-checker"), "-gaslimit", GAS_LIMIT,
+        "-libdir", os.path.join(scilla, "src", "stdlib"), contract, "-sa", flag]
+
+def pin(cpus):
+    # Pool initializer: each worker takes one CPU; the checkers it starts inherit it
+    cpu = cpus.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+def run_checker(cmd):
+    r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    return r.returncode, r.stdout.splitlines()
+
+def parse_timings(lines):
+    # [parse, typecheck, sharding] from the first three lines, or None
+    values = []
+    for (_, prefix), line in zip(PHASES, lines):
+        if not line.startswith(prefix):
+            return None
+        values.append(float(line[len(prefix):]))
+    return values if len(values) == len(PHASES) else None
+
+def time_contract(cmd, runs, warmup):
+    # Returns (samples, None) or (None, error)
+    for _ in range(warmup):
+        code, lines = run_checker(cmd)
+        if code != 0 or parse_timings(lines) is None:
+            return None, "exit status {}".format(code) if code != 0 else "no timings in output"
+    samples = []
+    for _ in range(runs):
+        code, lines = run_checker(cmd)
+        values = parse_timings(lines)
+        if code != 0 or values is None:
+            return None, "exit status {}".format(code) if code != 0 else "no timings in output"
+        samples.append(values)
+    return samples, None
+
+def good_enough(cmd):
+    # Contracts the analysis fails on still get a row; goodenough_plots.r drops them
+    code, lines = run_checker(cmd)
+    return (lines[0].replace("[GoodEnough] ", "", 1) if lines else ""), None
+
+def median_ci(values, confidence=CONFIDENCE):
+    # Distribution-free interval for the median: the order statistics around
+    # it that cover it with binomial(n, 1/2) probability at least confidence
+    values = sorted(values)
+    n = len(values)
+    pmf = [math.comb(n, i) / 2 ** n for i in range(n + 1)]
+    lo = 1
+    while lo + 1 <= n - lo and sum(pmf[lo + 1:n - lo]) >= confidence:
+        lo += 1
+    return values[lo - 1], values[n - lo]
+
+def phase_stats(values):
+    q1, median, q3 = statistics.quantiles(values, n=4) if len(values) > 1 else values * 3
+    return {"min": min(values), "avg": statistics.mean(values), "max": max(values), "median": median,
+        "iqr": q3 - q1, "ci": median_ci(values)}
+
+def latex_name(path):
+    # Underscores break the LaTeX plot, so they are escaped
+    return os.path.basename(path).split("~")[0].replace("_", "\\_")
+
+def line_count(path):
+    with open(path, 'rb') as f:
+        return f.read().count(b"\n")
+
+def timing_row(path, samples):
+    stats = [phase_stats([s[i] for s in samples]) for i in range(len(PHASES))]
+    cols = [latex_name(path), str(line_count(path))]
+    for s in stats:
+        cols += ["{:g}".format(s[k]) for k in ("min", "avg", "max")]
+    for s in stats:
+        cols += ["{:g}".format(v) for v in (s["median"], s["iqr"], s["ci"][0], s["ci"][1])]
+    return stats[0]["avg"], ",".join(cols + [str(len(samples))])
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_cache(cache, path):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(cache, f)
+    os.replace(path + ".tmp", path)
+
+def default_cpus():
+    # Every CPU this process may use but the first, left to the system
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    return cpus[1:] if len(cpus) > 1 else cpus
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CoSplit analysis over the contract dataset")
+    parser.add_argument("mode", choices=["timing", "goodenough"])
+    parser.add_argument("-o", "--output", default=None, help="CSV to write (default: stdout)")
+    parser.add_argument("--scilla", default=SCILLA_PATH, help="Scilla checkout with bin/scilla-checker")
+    parser.add_argument("--contracts", default=CONTRACTS_PATH)
+    parser.add_argument("--runs", type=int, default=NUM_RUNS, help="timed runs per contract")
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="discarded runs per contract before the timed ones")
+    parser.add_argument("--cpus", default=None, help="comma-separated CPUs to pin workers to (default: all but the first)")
+    parser.add_argument("--workers", type=int, default=None, help="number of workers (default: one per CPU)")
+    parser.add_argument("--cache", default=CACHE_FILE)
+    parser.add_argument("--fresh", action="store_true", help="ignore cached results")
+    args = parser.parse_args()
+
+    cpus = [int(c) for c in args.cpus.split(",")] if args.cpus else default_cpus()
+    if hasattr(os, "sched_getaffinity") and not set(cpus) <= os.sched_getaffinity(0):
+        parser.error("CPUs available: {}".format(",".join(map(str, sorted(os.sched_getaffinity(0))))))
+    workers = min(args.workers or len(cpus), len(cpus))
+    cmd0 = checker_command(args.scilla, "", args.mode)
+    if not os.path.exists(cmd0[0]):
+        parser.error("no checker at {}; build Scilla or pass --scilla".format(cmd0[0]))
+    # The checker and its stdlib are part of every cache key
+    toolchain = [args.mode, GAS_LIMIT, file_hash(cmd0[0]), tree_hash(cmd0[4])]
+    cache = load_cache(args.cache)
+    if args.fresh:
+        cache = {k: v for k, v in cache.items() if v.get("mode") != args.mode}
+
+    contracts = sorted(os.path.join(args.contracts, f) for f in os.listdir(args.contracts))
+    keys = {path: hashlib.sha256(json.dumps(toolchain + [file_hash(path)]).encode()).hexdigest() for path in contracts}
+    todo = []
+    # Copies of a contract share their key and run once
+    for path in {keys[p]: p for p in reversed(contracts)}.values():
+        entry = cache.get(keys[path])
+        if entry is None:
+            todo.append((path, args.runs))
+        elif args.mode == "timing" and "error" not in entry and len(entry["samples"]) < args.runs:
+            todo.append((path, args.runs - len(entry["samples"])))
+    print("{} contracts, {} to run on CPUs {}".format(len(contracts), len(todo), ",".join(map(str, cpus[:workers]))),
+        file=sys.stderr, flush=True)
+
+    start = datetime.datetime.now()
+    queue = multiprocessing.Queue()
+    for cpu in cpus[:workers]:
+        queue.put(cpu)
+    with ProcessPoolExecutor(max_workers=workers, initializer=pin, initargs=(queue,)) as pool:
+        futures = {}
+        for path, runs in todo:
+            cmd = checker_command(args.scilla, path, args.mode)
+            if args.mode == "timing":
+                futures[pool.submit(time_contract, cmd, runs, args.warmup)] = path
+            else:
+                futures[pool.submit(good_enough, cmd)] = path
+        for n, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            result, error = future.result()
+            entry = {"mode": args.mode, "name": os.path.basename(path)}
+            if error is not None:
+                entry["error"] = error
+                print("[{}/{}] {}: skipped, {}".format(n, len(futures), os.path.basename(path), error), file=sys.stderr, flush=True)
+            elif args.mode == "timing":
+                old = cache.get(keys[path], {})
+                entry["samples"] = old.get("samples", []) + result
+            else:
+                entry["output"] = result
+            cache[keys[path]] = entry
+            save_cache(cache, args.cache)
+            if error is None:
+                print("[{}/{}] {}".format(n, len(futures), os.path.basename(path)), file=sys.stderr, flush=True)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    if args.mode == "timing":
+        # Slowest parse first, as timing.tex plots them
+        rows = [timing_row(path, cache[keys[path]]["samples"][:args.runs])
+            for path in contracts if "error" not in cache[keys[path]]]
+        print(TIMING_HEADER + "," + STATS_HEADER, file=out)
+        for _, row in sorted(rows, key=lambda r: -r[0]):
+            print(row, file=out)
+    else:
+        print(GOODENOUGH_HEADER, file=out)
+        for path in contracts:
+            entry = cache[keys[path]]
+            if "error" not in entry:
+                name = os.path.basename(path)
+                name = name[:-len(".scilla")] if name.endswith(".scilla") else name
+                print("{}, {}, {}".format(name, line_count(path), entry["output"]), file=out)
+    if out is not sys.stdout:
+        out.close()
+    print("Done in {}".format(datetime.datetime.now() - start), file=sys.stderr)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# Asyncio submission engine: a bounded number of in-flight JSON-RPC requests
+# multiplexed over a small pool of keep-alive HTTP connections, optionally
+# spread over a few worker processes (one event loop each).
+import asyncio
+import json
+import sys
+import datetime
+import itertools
+import time
+from urllib.parse import urlsplit
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from tracefile import sender_bucket
+from batch_submit import TRANSPORT_ERRORS
+from endpoints import endpoint_list, get_pool
+
+MAX_IN_FLIGHT = 256
+NUM_CONNECTIONS = 32
+PRINT_INTERVAL = 5.0
+
+class RPCError(Exception):
+    pass
+
+class HTTPStatusError(RPCError):
+    # The endpoint answered with something other than 200; counted against it
+    pass
+
+class KeepAliveConnection:
+    def __init__(self, host, port, path, use_ssl=False):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.use_ssl = use_ssl
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.use_ssl or None)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, body):
+        if self.writer is None:
+            await self.open()
+        head = ("POST {} HTTP/1.1\r\nHost: {}:{}\r\nContent-Type: application/json\r\n"
+                "Content-Length: {}\r\nConnection: keep-alive\r\n\r\n").format(self.path, self.host, self.port, len(body))
+        self.writer.write(head.encode('ascii') + body)
+        await self.writer.drain()
+
+        status = await self.reader.readline()
+        if not status:
+            raise ConnectionResetError("connection closed by server")
+        code = int(status.split(b' ', 2)[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            headers[k.strip().lower()] = v.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            # No length and no chunks: the body runs until the server closes
+            data = await self.reader.read()
+            self.close()
+
+        keep_alive = 'keep-alive' if status.startswith(b'HTTP/1.1') else 'close'
+        if headers.get('connection', keep_alive).lower() == 'close':
+            self.close()
+        if code != 200:
+            raise HTTPStatusError("HTTP {}: {}".format(code, data[:200]))
+        return data
+
+class AsyncZilliqaAPI:
+    def __init__(self, endpoint, num_connections=NUM_CONNECTIONS, health=None):
+        url = urlsplit(endpoint)
+        use_ssl = url.scheme == 'https'
+        port = url.port or (443 if use_ssl else 80)
+        self.endpoint = endpoint
+        self.pool = asyncio.Queue()
+        for _ in range(num_connections):
+            self.pool.put_nowait(KeepAliveConnection(url.hostname, port, url.path or '/', use_ssl))
+        self.ids = itertools.count(1)
+        self.health = health
+
+    async def post_json(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        conn = await self.pool.get()
+        start = time.time()
+        ok = False
+        try:
+            try:
+                data = await conn.post(body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Server dropped an idle keep-alive connection; retry once on a fresh one
+                conn.close()
+                data = await conn.post(body)
+            ok = True
+        except BaseException:
+            conn.close()
+            raise
+        finally:
+            metrics.rpc_latency(self.endpoint, time.time() - start)
+            if self.health is not None:
+                self.health.record(ok)
+            self.pool.put_nowait(conn)
+        return json.loads(data)
+
+    async def call(self, method, *params):
+        resp = await self.post_json({"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": list(params)})
+        if "error" in resp:
+            raise RPCError(resp["error"].get("message", resp["error"]))
+        return resp.get("result")
+
+    async def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+class RoutedAsyncAPI:
+    # Several endpoints with a connection pool each (see endpoints.py):
+    # CreateTransaction goes to the sender's endpoint, other calls to the first
+    def __init__(self, endpoints, num_connections=NUM_CONNECTIONS):
+        self.pool = get_pool(endpoints)
+        self.apis = {e: AsyncZilliqaAPI(e.url, num_connections, health=e) for e in self.pool.endpoints}
+        self.first = self.apis[self.pool.endpoints[0]]
+
+    async def call(self, method, *params):
+        if method != "CreateTransaction":
+            return await self.first.call(method, *params)
+        sender = params[0]["pubKey"]
+        e = self.pool.route(sender)
+        try:
+            return await self.apis[e].call(method, *params)
+        except (HTTPStatusError,) + TRANSPORT_ERRORS:
+            # Resent once if the endpoint has been taken out in the meantime
+            other = self.pool.route(sender)
+            if other is e:
+                raise
+            return await self.apis[other].call(method, *params)
+
+    async def close(self):
+        for api in self.apis.values():
+            await api.close()
+
+def async_api(endpoint, num_connections=NUM_CONNECTIONS):
+    # For one endpoint or a list of them
+    urls = endpoint_list(endpoint)
+    if len(urls) == 1:
+        return AsyncZilliqaAPI(urls[0], num_connections)
+    return RoutedAsyncAPI(urls, num_connections)
+
+async def submit_all(tx_list, endpoint, max_in_flight=MAX_IN_FLIGHT, num_connections=NUM_CONNECTIONS, chunk_id=0, on_result=None):
+    api = async_api(endpoint, num_connections)
+    sem = asyncio.Semaphore(max_in_flight)
+    stats = {"sent": 0, "failed": 0}
+    interval = {"start": datetime.datetime.now(), "sent": 0}
+    # Latest task of each sender with one still running
+    last = {}
+
+    async def send(tx, prev):
+        if prev is not None:
+            # The sender's previous nonce must be acknowledged first
+            await asyncio.wait([prev])
+        metrics.submitted()
+        try:
+            txn_info = await api.call("CreateTransaction", tx)
+            metrics.accepted()
+            stats["sent"] += 1
+            interval["sent"] += 1
+            if on_result is not None:
+                on_result(tx, txn_info, None)
+        except Exception as e:
+            metrics.rejected(e)
+            stats["failed"] += 1
+            print("Exception from lookup: {}".format(e))
+            if on_result is not None:
+                on_result(tx, None, e)
+        finally:
+            sem.release()
+
+        td = datetime.datetime.now() - interval["start"]
+        if td.total_seconds() >= PRINT_INTERVAL:
+            print("Chunk {}: replayed {} transactions in {} => {:.2f} TPS".format(chunk_id, interval["sent"], td, interval["sent"]/td.total_seconds()), file=sys.stderr)
+            interval["start"] = datetime.datetime.now()
+            interval["sent"] = 0
+
+    def done(task, sender):
+        tasks.discard(task)
+        if last.get(sender) is task:
+            del last[sender]
+
+    # Issue requests in trace order. Different senders run concurrently over the
+    # connections, but each sender's transactions go out one after the other in
+    # trace (nonce) order. The semaphore keeps at most max_in_flight outstanding,
+    # and only those are held on to, so a streamed trace runs in constant memory
+    tasks = set()
+    for tx in tx_list:
+        await sem.acquire()
+        sender = tx["pubKey"]
+        task = last[sender] = asyncio.ensure_future(send(tx, last.get(sender)))
+        tasks.add(task)
+        task.add_done_callback(lambda task, sender=sender: done(task, sender))
+    if tasks:
+        await asyncio.gather(*tasks)
+    await api.close()
+    return stats
+
+def submit_chunk_async(tx_list, endpoint, max_in_flight=MAX_IN_FLIGHT, num_connections=NUM_CONNECTIONS, chunk_id=0, journal_path=None):
+    if journal_path is None:
+        return asyncio.run(submit_all(tx_list, endpoint, max_in_flight, num_connections, chunk_id))
+    from journal import get_journal, recorder
+    try:
+        return asyncio.run(submit_all(tx_list, endpoint, max_in_flight, num_connections, chunk_id, recorder(journal_path, "replay")))
+    finally:
+        get_journal(journal_path).flush()
+
+def partition_by_sender(tx_list, num_buckets):
+    # Keep all transactions from one sender in the same process so they go out in nonce order
+    part = {b: [] for b in range(num_buckets)}
+    for tx in tx_list:
+        part[sender_bucket(tx, num_buckets)].append(tx)
+    return part
+
+def replay_async(tx_list, endpoint, num_procs=1, max_in_flight=MAX_IN_FLIGHT, num_connections=NUM_CONNECTIONS, journal_path=None,
+                 shared_metrics=None):
+    if num_procs <= 1:
+        return submit_chunk_async(tx_list, endpoint, max_in_flight, num_connections, journal_path=journal_path)
+
+    part = partition_by_sender(tx_list, num_procs)
+    stats = {"sent": 0, "failed": 0}
+    with ProcessPoolExecutor(max_workers=num_procs, initializer=metrics.attach, initargs=(shared_metrics,)) as pool:
+        all_tasks = [pool.submit(submit_chunk_async, part[chunk_id], endpoint,
+                max_in_flight // num_procs or 1, num_connections // num_procs or 1, chunk_id, journal_path) for chunk_id in part.keys()]
+        for future in futures.as_completed(all_tasks):
+            try:
+                r = future.result()
+                stats["sent"] += r["sent"]
+                stats["failed"] += r["failed"]
+            except Exception as e:
+                print("Async worker error: {}".format(e))
+    return stats
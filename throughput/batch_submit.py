@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# JSON-RPC batch submission: packs many CreateTransaction calls into a single
+# HTTP request and maps every per-item result or error back to its transaction.
+# Falls back to one call per transaction if the endpoint rejects batches; a
+# server error (5xx) is retried and does not turn batching off. A transaction
+# whose fate is unknown (the request failed in transit, or a retried batch
+# reports an error for it) is reported as sent, under the hash the node gives
+# it, so confirmation tracking decides whether it landed and its nonce is not
+# handed out again.
+import os
+import time
+import requests
+
+from pyzil.zilliqa.api import APIError
+
+import metrics
+from txparams import txn_hash
+
+BATCH_SIZE = 100
+HTTP_TIMEOUT = 60
+# Retries of a batch the server failed with a 5xx, doubling the delay each time
+BATCH_RETRIES = 3
+RETRY_DELAY = 0.5
+
+# Transport problems, as opposed to JSON-RPC errors such as a bad nonce
+TRANSPORT_ERRORS = (OSError, EOFError)
+
+# One keep-alive session per (process, endpoint). Sessions must never be shared
+# across a fork, otherwise processes end up writing to the same TCP connection.
+_sessions = {}
+
+def get_session(endpoint):
+    key = (os.getpid(), endpoint)
+    session = _sessions.get(key)
+    if session is None:
+        session = requests.Session()
+        _sessions[key] = session
+    return session
+
+class BatchNotSupported(Exception):
+    pass
+
+class OutcomeUnknown(Exception):
+    # The node may or may not have acted on the call
+    pass
+
+def outcome_unknown(params, error):
+    # txn_info for a transaction that may have been taken
+    print("Outcome of transaction {} with nonce {} unknown ({}); tracking it by hash".format(
+        params["pubKey"], params["nonce"], error))
+    return {"TranID": txn_hash(params), "Info": "outcome unknown: {}".format(error), "unknown": True}
+
+class BatchZilliqaAPI:
+    def __init__(self, endpoint, batch_size=BATCH_SIZE, timeout=HTTP_TIMEOUT, health=None):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.batch_ok = batch_size > 1
+        # Told whether every call got an answer (see endpoints.py)
+        self.health = health
+
+    def post(self, payload):
+        start = time.time()
+        ok = False
+        try:
+            r = get_session(self.endpoint).post(self.endpoint, json=payload, timeout=self.timeout)
+            ok = r.status_code < 500
+        finally:
+            metrics.rpc_latency(self.endpoint, time.time() - start)
+            if self.health is not None:
+                self.health.record(ok)
+        r.raise_for_status()
+        return r.json()
+
+    def call(self, method, *params):
+        resp = self.post({"jsonrpc": "2.0", "id": "1", "method": method, "params": list(params)})
+        if "error" in resp:
+            raise APIError(resp["error"].get("message", resp["error"]))
+        return resp.get("result")
+
+    def batch_call(self, method, params_list):
+        # Each item is the single parameter of one call, or a list of parameters
+        payload = [{"jsonrpc": "2.0", "id": str(i), "method": method, "params": p if isinstance(p, list) else [p]}
+                for i, p in enumerate(params_list)]
+        for attempt in range(BATCH_RETRIES + 1):
+            try:
+                resp = self.post(payload)
+                break
+            except requests.HTTPError as e:
+                # Only a client error means the endpoint refuses batches; a server
+                # or proxy error (502, 503, ...) is a transport problem
+                status = e.response.status_code if e.response is not None else 500
+                if status < 500:
+                    raise BatchNotSupported(e)
+                if attempt == BATCH_RETRIES:
+                    raise
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+        if not isinstance(resp, list):
+            raise BatchNotSupported(resp)
+
+        by_id = {str(r.get("id")): r for r in resp}
+        results = []
+        for i in range(len(params_list)):
+            r = by_id.get(str(i))
+            if r is None:
+                results.append((None, OutcomeUnknown("no response for batch item {}".format(i))))
+            elif "error" in r:
+                message = r["error"].get("message", r["error"])
+                # An earlier attempt may have gone through, and this error
+                # (already present, nonce too low) be about that
+                results.append((None, OutcomeUnknown(message) if attempt else APIError(message)))
+            else:
+                results.append((r.get("result"), None))
+        return results
+
+    def single_calls(self, method, params_list):
+        results = []
+        for p in params_list:
+            try:
+                results.append((self.call(method, *(p if isinstance(p, list) else [p])), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    # Yields (params, txn_info, error) for every transaction, in submission order
+    def create_transactions(self, params_list):
+        step = max(1, self.batch_size)
+        for i in range(0, len(params_list), step):
+            chunk = params_list[i:i + step]
+            metrics.submitted(len(chunk))
+            results = None
+            if self.batch_ok and len(chunk) > 1:
+                try:
+                    results = self.batch_call("CreateTransaction", chunk)
+                except BatchNotSupported as e:
+                    print("Endpoint does not accept batches ({}); falling back to single calls".format(e))
+                    self.batch_ok = False
+                except Exception as e:
+                    # We cannot tell which items made it
+                    results = [(None, OutcomeUnknown(e))] * len(chunk)
+            if results is None:
+                results = self.single_calls("CreateTransaction", chunk)
+            for params, (txn_info, error) in zip(chunk, results):
+                if isinstance(error, (OutcomeUnknown,) + TRANSPORT_ERRORS):
+                    metrics.rejected(error)
+                    yield params, outcome_unknown(params, error), None
+                    continue
+                if error is None:
+                    metrics.accepted()
+                else:
+                    metrics.rejected(error)
+                yield params, txn_info, error
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# Submitting through several lookup/seed nodes at once. Every sender is pinned
+# to one endpoint (weighted rendezvous hashing), so its transactions reach the
+# network through a single lookup and stay in nonce order. Endpoints are
+# health-checked with GetBlockchainInfo from a background thread, and failed
+# calls count against them too. An endpoint that keeps failing is taken out of
+# rotation for a while, and one that gets much slower than the fastest gets no
+# senders; in both cases its senders move to the others. A sender is re-pinned
+# at once, without draining what the old endpoint already accepted, so around a
+# move its nonces can reach the network out of order (see README.md).
+#
+#   ./replay-trace.py --endpoint http://lookup1:4201 --endpoint http://lookup2:4201 trace.txt
+import argparse
+import math
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pprint import pprint
+
+import requests
+
+from batch_submit import BatchZilliqaAPI, BATCH_SIZE, HTTP_TIMEOUT
+
+HEALTH_INTERVAL = 5.0
+HEALTH_TIMEOUT = 5.0
+# Consecutive failed calls after which an endpoint is taken out of rotation
+MAX_FAILURES = 3
+# Seconds it then stays out, extended by every further failure
+EJECT_TIME = 30.0
+# Slower than this many times the fastest endpoint: no senders are routed to it
+SLOW_FACTOR = 4.0
+# Latencies below this count as equal, so a fast local network does not look uneven
+LATENCY_FLOOR = 0.05
+LATENCY_ALPHA = 0.3
+# Seconds the set of usable endpoints is reused for, unless one is taken out
+ROUTE_CACHE = 0.5
+
+def endpoint_list(endpoint):
+    # A single URL or a list of them
+    return [endpoint] if isinstance(endpoint, str) else list(endpoint)
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        # Round-trip time of health checks (EWMA, seconds)
+        self.latency = None
+        self.failures = 0
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, ok):
+        # Outcome of a real call
+        with self.lock:
+            if ok:
+                if time.time() >= self.down_until:
+                    self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= MAX_FAILURES:
+                if time.time() >= self.down_until:
+                    print("Endpoint {} failed {} times in a row; out of rotation for {:.0f}s".format(
+                        self.url, self.failures, EJECT_TIME), flush=True)
+                self.down_until = time.time() + EJECT_TIME
+
+    def probe(self, seconds, ok):
+        if ok:
+            with self.lock:
+                self.latency = seconds if self.latency is None else (1 - LATENCY_ALPHA) * self.latency + LATENCY_ALPHA * seconds
+        self.record(ok)
+
+    def up(self, now):
+        return now >= self.down_until
+
+def rendezvous_score(sender, endpoint, weight):
+    # Weighted rendezvous hashing: the sender goes to the endpoint with the
+    # highest score, and only the senders of an endpoint that drops out move
+    h = zlib.crc32("{}|{}".format(sender, endpoint.url).encode('ascii'))
+    return -weight / math.log((h + 0.5) / 2 ** 32)
+
+class EndpointPool:
+    def __init__(self, urls, health_interval=HEALTH_INTERVAL):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.health_interval = health_interval
+        self.assigned = {}
+        self.cached = None
+        self.cached_at = 0.0
+        self.cached_down = None
+        self.lock = threading.Lock()
+        self.checker = None
+
+    def usable(self):
+        # Endpoint -> routing weight, for the endpoints that are up and not slow;
+        # all of them if none are
+        now = time.time()
+        down = [e.down_until for e in self.endpoints]
+        if self.cached is not None and now - self.cached_at < ROUTE_CACHE and down == self.cached_down:
+            return self.cached
+        up = [e for e in self.endpoints if e.up(now)] or self.endpoints
+        known = [max(e.latency, LATENCY_FLOOR) for e in up if e.latency is not None]
+        best = min(known) if known else LATENCY_FLOOR
+        usable = {}
+        for e in up:
+            latency = best if e.latency is None else max(e.latency, LATENCY_FLOOR)
+            if latency <= SLOW_FACTOR * best:
+                usable[e] = best / latency
+        self.cached, self.cached_at, self.cached_down = usable, now, down
+        return usable
+
+    def route(self, sender):
+        usable = self.usable()
+        with self.lock:
+            e = self.assigned.get(sender)
+            if e is None or e not in usable:
+                e = max(usable, key=lambda e: rendezvous_score(sender, e, usable[e]))
+                self.assigned[sender] = e
+        return e
+
+    def check(self, session):
+        payload = {"jsonrpc": "2.0", "id": "1", "method": "GetBlockchainInfo", "params": []}
+        for e in self.endpoints:
+            start = time.time()
+            try:
+                r = session.post(e.url, json=payload, timeout=HEALTH_TIMEOUT)
+                r.raise_for_status()
+                ok = "result" in r.json()
+            except Exception:
+                ok = False
+            e.probe(time.time() - start, ok)
+        self.cached = None
+
+    def check_loop(self):
+        # Own session: the sending threads' sessions are not shared
+        session = requests.Session()
+        while True:
+            self.check(session)
+            time.sleep(self.health_interval)
+
+    def start(self):
+        if self.checker is None and self.health_interval:
+            self.checker = threading.Thread(target=self.check_loop, daemon=True)
+            self.checker.start()
+
+    def status(self):
+        now = time.time()
+        usable = self.usable()
+        return [{"url": e.url, "up": e.up(now), "routed": e in usable, "failures": e.failures,
+            "latency_ms": None if e.latency is None else round(e.latency * 1000, 1),
+            "senders": sum(1 for a in self.assigned.values() if a is e)} for e in self.endpoints]
+
+# One pool per (process, endpoint list), so every process has its own health checker
+_pools = {}
+
+def get_pool(urls):
+    key = (os.getpid(), tuple(urls))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = EndpointPool(urls)
+        pool.start()
+    return pool
+
+class MultiEndpointAPI:
+    # BatchZilliqaAPI.create_transactions over several endpoints: transactions
+    # are grouped by their sender's endpoint and the groups are sent in
+    # parallel, one keep-alive session per endpoint, so each endpoint has at
+    # most one batch in flight. Results come back grouped by endpoint.
+    def __init__(self, urls, batch_size=BATCH_SIZE, timeout=HTTP_TIMEOUT):
+        self.pool = get_pool(urls)
+        self.apis = {e: BatchZilliqaAPI(e.url, batch_size, timeout, health=e) for e in self.pool.endpoints}
+        self.executor = ThreadPoolExecutor(max_workers=len(self.pool.endpoints))
+
+    def send_groups(self, params_list):
+        groups = OrderedDict()
+        for params in params_list:
+            groups.setdefault(self.pool.route(params["pubKey"]), []).append(params)
+        return groups, self.executor.map(lambda e: list(self.apis[e].create_transactions(groups[e])), list(groups))
+
+    def create_transactions(self, params_list):
+        groups, results = self.send_groups(params_list)
+        retry = {}
+        for e, group in zip(groups, results):
+            for params, txn_info, error in group:
+                # Resent once if the endpoint has been taken out in the meantime.
+                # The signed transaction is the same, so at most one copy lands.
+                if txn_info is not None and txn_info.get("unknown") and self.pool.route(params["pubKey"]) is not e:
+                    retry[id(params)] = txn_info
+                    continue
+                yield params, txn_info, error
+        if retry:
+            print("Resending {} transactions through other endpoints".format(len(retry)), flush=True)
+            _, results = self.send_groups([params for params in params_list if id(params) in retry])
+            for group in results:
+                for params, txn_info, error in group:
+                    # An error now may be about the first copy, so it stays unknown
+                    yield params, txn_info if error is None else retry[id(params)], None
+
+_apis = {}
+
+def get_api(urls, batch_size=BATCH_SIZE):
+    key = (os.getpid(), tuple(urls), batch_size)
+    api = _apis.get(key)
+    if api is None:
+        api = _apis[key] = MultiEndpointAPI(urls, batch_size)
+    return api
+
+def submit_api(endpoint, batch_size=BATCH_SIZE):
+    # Something with create_transactions for one endpoint or a list of them
+    urls = endpoint_list(endpoint)
+    if len(urls) == 1:
+        return BatchZilliqaAPI(urls[0], batch_size=batch_size)
+    return get_api(urls, batch_size)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Health-check a set of endpoints")
+    parser.add_argument("endpoints", nargs="+")
+    args = parser.parse_args()
+    pool = EndpointPool(args.endpoints)
+    pool.check(requests.Session())
+    pprint(pool.status())
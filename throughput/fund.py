@@ -12,15 +12,35 @@ import os.path
 import random
 import time, datetime
 import math
+import threading
 import sys
 from collections import Counter
-from subprocess import Popen, PIPE
 from copy import copy
 from concurrent import futures
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import hashlib
 
+import workloads
+
+import loadgen
+from async_submit import HTTPStatusError
+from batch_submit import TRANSPORT_ERRORS, outcome_unknown
+from endpoints import submit_api
+from txparams import transfer_params, call_params
+from tracker import ConfirmationTracker, norm_hash
+from keystore import get_keystore, account_handle
+from nonce_alloc import NonceAllocator, attach, get_allocator
+from workers import WorkerPool, get_contract
+from sharding import get_num_shards, locality_txn_map, locality_report
+from journal import Journal
+import tracefile
+from results import RunResults
+import metrics
+
 API_ENDPOINT = "http://localhost:4201"
+# Lookups transactions are sent through, each sender always through the same
+# one (see endpoints.py); everything else goes to API_ENDPOINT
+API_ENDPOINTS = [API_ENDPOINT]
 ZILLIQA_PATH = "/home/pldi21/cosplit-artefact/Zilliqa"
 CONFIG_FILE = "config.json"
 
@@ -32,10 +52,27 @@ BIN_PATH = os.path.join(BUILD_PATH, 'bin/')
 CONTRACTS_PATH = "contracts/"
 ACCOUNTS_FILE = "accounts.csv"
 PENDING_FILE = "pending.txt"
+RESULTS_FILE = "results.csv"
+# Run journal used to resume after a crash; None turns it off
+JOURNAL_FILE = "journal.db"
 
 NUM_ACCOUNTS = 25000
 ACC_BATCH_SIZE = 1000
 TX_TIMEOUT = 300
+# Number of CreateTransaction calls packed into one JSON-RPC batch; 1 sends them one by one
+TX_BATCH_SIZE = 100
+# TPS offered by each worker process in open-loop mode; None sends as fast as possible
+OPEN_LOOP_RATE = None
+# Fraction of account-to-account transactions kept within the sender's shard;
+# None pairs senders and recipients at random
+INTRA_SHARD_FRACTION = None
+# Port to serve live Prometheus metrics on while sending; None turns them off
+METRICS_PORT = None
+# Every run writes the transactions it sent to a new directory in here, one
+# file per worker process (merge them with tracefile.py); None turns it off
+TRACE_DIR = "trace"
+# "gzip", "zstd" (needs the zstandard package) or None
+TRACE_COMPRESSION = "gzip"
 
 ACC_MIN_BALANCE = 1000
 TOKEN_MIN_BALANCE = 1000000
@@ -44,33 +81,196 @@ LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
 chain.set_active_chain(LocalNet)
 api = ZilliqaAPI(API_ENDPOINT)
 
-saved_accs = []
-nonces = {}
 sent_by = {}
+# First TxBlock that may contain transactions we are about to wait for
+send_start_block = None
+# Scenario steps send from several threads; guards sent_by and send_start_block
+send_lock = threading.Lock()
+# Sender processes, kept alive across phases
+pool = None
+num_shards = None
+run_journal = None
+run_trace_dir = None
 
 with open(CONFIG_FILE) as f:
     conf = json.load(f)
 
-genesis = Account(private_key=conf['genesis']['privkey'])
+class GenesisAccount(Account):
+    # fastecdsa key points do not pickle; every process loads genesis from the
+    # config, so it is sent to workers by name
+    def __reduce__(self):
+        return get_genesis, ()
+
+def get_genesis():
+    return genesis
+
+genesis = GenesisAccount(private_key=conf['genesis']['privkey'])
+
+def nonce_allocator():
+    # Created in the parent and handed to the pool through its initializer,
+    # so all workers draw nonces from the same shared counters
+    alloc = get_allocator()
+    if alloc is None:
+        alloc = NonceAllocator(max(NUM_ACCOUNTS + 1, len(get_keystore())), genesis.address)
+        attach(alloc)
+        seed_nonces(alloc)
+    return alloc
+
+def get_journal():
+    global run_journal
+    if run_journal is None and JOURNAL_FILE is not None:
+        run_journal = Journal(JOURNAL_FILE)
+    return run_journal
+
+def trace_dir():
+    # Decided in the parent and passed to the workers with their work
+    global run_trace_dir
+    if run_trace_dir is None and TRACE_DIR is not None:
+        run_trace_dir = os.path.join(TRACE_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+    return run_trace_dir
+
+def get_trace(directory, phase=None):
+    # This process's trace writer, switched to phase; None if tracing is off
+    if directory is None:
+        return None
+    writer = tracefile.get_writer(directory, TRACE_COMPRESSION)
+    writer.set_phase(phase)
+    return writer
+
+def seed_nonces(alloc):
+    # Senders whose journalled transactions were all confirmed continue after
+    # the last of them; the others are left for the batched sync from the chain
+    journal = get_journal()
+    if journal is None:
+        return
+    keystore = get_keystore()
+    seeded = 0
+    for sender, index, first, last, unconfirmed in journal.nonce_state():
+        if unconfirmed:
+            continue
+        if index is None:
+            acc = genesis if sender == genesis.public_key.lower() else None
+        else:
+            # Only if the keystore still holds the same key at that index
+            acc = account_handle(index) if index < min(len(keystore), alloc.capacity) else None
+            if acc is not None and acc.public_key.lower() != sender:
+                acc = None
+        if acc is not None:
+            alloc.set(acc, last)
+            seeded += 1
+    if seeded:
+        print("Restored the nonces of {} accounts from {}".format(seeded, JOURNAL_FILE), flush=True)
+
+def shard_count():
+    global num_shards
+    if num_shards is None:
+        num_shards = get_num_shards(api)
+    return num_shards
+
+def get_pool(max_workers):
+    global pool
+    if pool is not None and pool.max_workers != max_workers:
+        pool.shutdown()
+        pool = None
+    if pool is None:
+        pool = WorkerPool(API_ENDPOINT, max_workers, nonce_allocator(), shared_metrics=shared_metrics())
+    return pool
+
+def shared_metrics():
+    # Created and served once by the parent; every pool worker gets a row
+    if METRICS_PORT is not None and metrics.get_metrics() is None:
+        metrics.attach(metrics.Metrics(API_ENDPOINTS))
+        metrics.serve(metrics.get_metrics(), METRICS_PORT)
+    return metrics.get_metrics()
+
+def shutdown_pool():
+    global pool
+    if pool is not None:
+        pool.shutdown()
+        pool = None
 
 def new_nonce(acc):
-    addr = acc.bech32_address
-    nn = nonces.get(addr, acc.get_nonce()) + 1
-    nonces[addr] = nn
-    return nn
-
-def assign_nonce(acc, nonce):
-    addr = acc.bech32_address
-    nonces[addr] = nonce
+    return get_allocator().next(acc)
 
 def sync_nonce_to_blockchain(acc):
-    addr = acc.bech32_address
-    nonces[addr] = acc.get_nonce()
-
-def register_send(acc, txn_info):
+    get_allocator().resync(acc)
+
+def release_nonces(rejected):
+    # Nonces the node did not take are reused by their sender's next
+    # transactions, so the gaps close; the chain tells which were used up
+    for acc in get_allocator().release_rejected(rejected, API_ENDPOINT):
+        print("Too many rejected nonces to reuse; {} will be re-synced after waiting".format(acc.address0x))
+
+def mark_send_start():
+    global send_start_block
+    with send_lock:
+        if send_start_block is None:
+            send_start_block = int(api.GetBlockchainInfo()["NumTxBlocks"]) - 1
+
+def reset_send_start():
+    global send_start_block
+    with send_lock:
+        send_start_block = None
+
+def register_send(acc, txn_info, phase=None):
     if txn_info is not None:
         tran_id = txn_info["TranID"]
-        sent_by[tran_id] = acc
+        with send_lock:
+            sent_by[tran_id] = acc
+        journal = get_journal()
+        if journal is not None:
+            journal.sent(tran_id, acc.public_key, txn_info["nonce"], txn_info.get("submitted"), phase,
+                txn_info.get("item"), getattr(acc, "index", None))
+
+def transition_params(contract, builder, src_acc, dest_acc, amount, nonce):
+    method, params, zils = builder(src_acc, dest_acc, amount)
+    return call_params(src_acc, contract.address, method, params, nonce=nonce, zils=zils)
+
+def submit_params_open_loop(params_list):
+    results = []
+    loadgen.run_open_loop(params_list, API_ENDPOINTS, OPEN_LOOP_RATE, track_inclusion=False,
+            on_result=lambda *r: results.append(r), label="worker {}".format(os.getpid()))
+    return results
+
+# Returns (txn_info, sender) for every accepted transaction
+def submit_params(params_list, senders, tags=None, trace=None):
+    tags = tags or {}
+    by_key = {acc.public_key.lower(): acc for acc in senders}
+    txn_info_list = []
+    rejected = []
+    if OPEN_LOOP_RATE is not None:
+        results = submit_params_open_loop(params_list)
+    else:
+        results = submit_api(API_ENDPOINTS, TX_BATCH_SIZE).create_transactions(params_list)
+    for params, txn_info, error in results:
+        if isinstance(error, TRANSPORT_ERRORS + (HTTPStatusError,)):
+            # The node may have taken it: track it rather than reuse its nonce
+            txn_info, error = outcome_unknown(params, error), None
+        if error is not None or txn_info is None:
+            print("Could not send transaction from {} with nonce {}: {}".format(params["pubKey"], params["nonce"], error))
+            rejected.append((by_key[params["pubKey"].lower()], params["nonce"]))
+            continue
+        # Submit time, nonce and item key travel with the txn_info back to the parent process
+        txn_info["submitted"] = time.time()
+        txn_info["nonce"] = params["nonce"]
+        txn_info["item"] = tags.get(id(params))
+        sender = by_key[params["pubKey"].lower()]
+        txn_info_list.append((txn_info, sender))
+        if trace is not None:
+            trace.write(params, acc_key(sender))
+    if rejected:
+        release_nonces(rejected)
+    print("Created {} transactions".format(len(txn_info_list)))
+    return txn_info_list
+
+def prepare_accounts(n):
+    # Makes sure the keystore holds the next n accounts gen_account hands out.
+    # Every missing keypair is generated in one parallel batch, and the old
+    # accounts file is converted the first time the keystore is used.
+    keystore = get_keystore()
+    if len(keystore) == 0 and os.path.exists(ACCOUNTS_FILE):
+        keystore.import_csv(ACCOUNTS_FILE)
+    keystore.extend_to(getattr(gen_account, "counter", 0) + n + 1)
 
 def gen_account():
     try:
@@ -81,52 +281,9 @@ def gen_account():
     if gen_account.counter % ACC_BATCH_SIZE == 0:
         print("Account #{}".format(gen_account.counter))
 
-    # Populate pregen_accs if it is empty
-    if len(saved_accs) == 0:
-        i = 0
-        with open(ACCOUNTS_FILE, 'r') as af:
-            for line in af:
-                pub, priv, _ = tuple(line.split(','))
-                saved_accs.append((pub, priv))
-
-    # Don't generate a new keypair if we already have enough in accounts file
-    if gen_account.counter < len(saved_accs):
-        pub, priv = saved_accs[gen_account.counter]
-        return Account(public_key=pub, private_key=priv)
-    else:
-        process = Popen([os.path.join(BUILD_PATH, "tests/Zilliqa/genkeypair")], stdout=PIPE, universal_newlines=True)
-        (output, _) = process.communicate()
-        _ = process.wait()
-        pub, priv = output.strip().split(' ')
-        acc = Account(public_key=pub, private_key=priv)
-        with open(ACCOUNTS_FILE, "a") as af:
-            af.write("{},{},{}\n".format(pub, priv, acc.address))
-        return acc
-
-def wait_txn_confirm(txn_id, max_block, timeout=TX_TIMEOUT, sleep=5):
-    start = time.time()
-    this_block = int(api.GetBlockchainInfo()["CurrentMiniEpoch"])
-    while (time.time() - start <= timeout) and (this_block <= max_block):
-        this_block = int(api.GetBlockchainInfo()["CurrentMiniEpoch"])
-        try:
-            return api.GetTransaction(txn_id)
-        except APIError as e:
-            time.sleep(sleep)
-    return None
-
-def get_sharding(txn_info_list):
-    ss = api.GetBlockchainInfo()["ShardingStructure"]
-    num_shards = 0
-    c = Counter()
-
-    if len(txn_info_list) > 0:
-        txn_info = txn_info_list[-1]
-        num_shards = txn_info["num_shards"]
-
-    for txn_info in txn_info_list:
-        c.update([txn_info["proc_shard"]])
-
-    return (ss, c)
+    if gen_account.counter >= len(get_keystore()):
+        raise IndexError("account {} is not in the keystore; call prepare_accounts first".format(gen_account.counter))
+    return account_handle(gen_account.counter)
 
 def wait_for_txs(txn_info_list):
     num = len(txn_info_list)
@@ -135,27 +292,43 @@ def wait_for_txs(txn_info_list):
         for tx in txn_info_list:
             f.write("{}\n".format(tx["TranID"]))
 
-    tx_block = int(api.GetBlockchainInfo()["CurrentMiniEpoch"])
+    # Catch up on every block since sending started, then follow new ones
+    tracker = ConfirmationTracker(start_block=send_start_block)
+    results = RunResults()
+    tracker.on_confirm(results.confirmed)
+    if get_journal() is not None:
+        tracker.on_confirm(get_journal().confirmed)
+    for txn_info in txn_info_list:
+        tracker.add(txn_info["TranID"])
+        results.add_submission(txn_info)
+    tx_block = tracker.poll(api, time.time())
     cutoff_block = tx_block + WAIT_BLOCKS
     print("Waiting to confirm {} transactions; cut-off block: {}".format(num, cutoff_block), flush=True)
     start = datetime.datetime.now()
-    for txn_info in txn_info_list:
-        wait_txn_confirm(txn_info["TranID"], cutoff_block)
+    tracker.wait(api, cutoff_block, timeout=TX_TIMEOUT, sleep=WAIT_TIME)
     end = datetime.datetime.now()
     td = end - start
 
-    not_confirmed = 0
+    # Re-sync each sender with an unconfirmed transaction once, not once per transaction
+    not_confirmed = len(tracker.pending)
+    stale = {}
     for txn_info in txn_info_list:
         txn_id = txn_info["TranID"]
-        try:
-            r = api.GetPendingTxn(txn_id)
-            if bool(r["confirmed"]) == False:
-                not_confirmed += 1
-                sync_nonce_to_blockchain(sent_by[txn_id])
-        except Exception as e:
-            print("{}".format(e))
+        if norm_hash(txn_id) in tracker.pending and txn_id in sent_by:
+            acc = sent_by[txn_id]
+            stale[acc.bech32_address] = acc
+    for acc in stale.values():
+        sync_nonce_to_blockchain(acc)
+    reset_send_start()
 
-    pprint(get_sharding(txn_info_list))
+    ss = api.GetBlockchainInfo()["ShardingStructure"]
+    pprint(ss)
+    if results.num_shards is None:
+        results.num_shards = len(ss["NumPeers"])
+    results.write_csv(RESULTS_FILE)
+    results.print_summary()
+    if get_journal() is not None:
+        get_journal().flush()
     print("CONFIRMED {}/{} transactions in {}".format(num - not_confirmed, num, td), flush=True)
 
 def deploy_contract(acc, file, init_params=[]):
@@ -164,492 +337,133 @@ def deploy_contract(acc, file, init_params=[]):
     contract = Contract.new_from_code(code)
     contract.account = acc
     txn_info = contract.deploy(timeout=TX_TIMEOUT, sleep=10, confirm=True,
-        init_params=init_params, gas_limit=20000
+        init_params=init_params, gas_limit=20000, nonce=nonce_allocator().next(acc)
     )
-    print(json.dumps(acc.last_params), file=sys.stderr, flush=True)
+    trace = get_trace(trace_dir(), "deploy:{}".format(file))
+    if trace is not None:
+        trace.write(acc.last_params, acc_key(acc))
+        trace.flush()
     pprint(contract)
     return contract
 
 def get_txn_map(from_accounts, to_accounts):
-    txn_map = {}
-    acc_map = {}
+    # List of (from_account, [to_accounts]); pyzil Accounts are not hashable,
+    # so senders are matched up by position rather than used as dict keys
+    if INTRA_SHARD_FRACTION is not None:
+        return locality_txn_map(from_accounts, to_accounts, shard_count(), INTRA_SHARD_FRACTION)
     from_accounts = random.sample(from_accounts, len(from_accounts))
     to_accounts = random.sample(to_accounts, len(to_accounts))
-    for i, fa in enumerate(from_accounts):
-        acc_map[i] = fa
-        txn_map[fa] = []
+    txn_map = [(fa, []) for fa in from_accounts]
     # Determine which from_account sends to which to_accounts
     for i, dest_acc in enumerate(to_accounts):
-        src_idx = i % len(acc_map)
-        src_acc = acc_map[src_idx]
-        txn_map[src_acc].append(dest_acc)
+        src_idx = i % len(txn_map)
+        txn_map[src_idx][1].append(dest_acc)
     return txn_map
 
-def iat_create_txns(src_acc, dest_accs, zils):
-        # Clear any cached sessions. This is needed to ensure multiple processes
-        # don't try to reuse the same TCP connection, which would lead to havoc
-        LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
-        chain.set_active_chain(LocalNet)
-        src_acc = Account(private_key=src_acc.private_key)
-
-        txn_info_list = []
-        src_addr = src_acc.bech32_address
-        orig_nonce = nonces.get(src_addr, src_acc.get_nonce())
-        for dest_acc in dest_accs:
-            try:
-                dest = dest_acc.bech32_address
-                txn_info = src_acc.transfer(to_addr=dest, zils=zils, nonce=new_nonce(src_acc), gas_price=100)
-                txn_info_list.append(txn_info)
-                print(json.dumps(src_acc.last_params), file=sys.stderr)
-                print("Created {} transactions".format(len(txn_info_list)))
-            except Exception as e:
-                print("Could not send from {} to {}: {}".format(src_addr, dest, e))
-
-        nonce_now = nonces.get(src_addr, src_acc.get_nonce())
-        # print("{}: created {} transactions; nonce went from {} to {}".format(src_acc.bech32_address, len(txn_info_list), orig_nonce, nonce_now))
-        return txn_info_list, src_acc, nonce_now
-
-def inter_account_transactions(from_accounts, to_accounts, zils, max_workers=8):
-    assert len(from_accounts) > 0
-    txn_map = get_txn_map(from_accounts, to_accounts)
+def txn_pairs(txn_map):
+    return [(src_acc, dest_acc) for src_acc, dests in txn_map for dest_acc in dests]
+
+def unique_senders(items):
+    # By identity: pyzil Accounts are not hashable
+    return list({id(item[0]): item[0] for item in items}.values())
+
+def acc_key(acc):
+    if acc is None:
+        return "-"
+    index = getattr(acc, "index", None)
+    return "genesis" if index is None else str(index)
+
+def tag_items(items, phase=None):
+    # Adds a key to every item that is the same in every run of the phase (its
+    # position and accounts), and drops the items the journal has seen confirmed
+    tagged = [tuple(item[:5]) + ("{}:{}>{}".format(i, acc_key(item[0]), acc_key(item[1])),) for i, item in enumerate(items)]
+    journal = get_journal()
+    if phase is None or journal is None:
+        return tagged
+    done = journal.confirmed_items(phase)
+    todo = [item for item in tagged if item[5] not in done]
+    if len(todo) < len(tagged):
+        print("{}: skipping {} transactions confirmed in an earlier run".format(phase, len(tagged) - len(todo)), flush=True)
+    return todo
+
+def create_txns(items, phase=None, directory=None):
+    # Runs in a pool worker on one chunk of (sender, destination, builder,
+    # contract address, amount, key) items; a builder of None is a native transfer.
+    # Accepted transactions go to the worker's trace file in directory.
+    params_list = []
+    tags = {}
+    for src_acc, dest_acc, builder, contract_addr, amount, key in items:
+        try:
+            if builder is None:
+                params = transfer_params(src_acc, dest_acc.bech32_address, amount, new_nonce(src_acc))
+            else:
+                contract = get_contract(contract_addr)
+                params = transition_params(contract, builder, src_acc, dest_acc, amount, new_nonce(src_acc))
+            params_list.append(params)
+            tags[id(params)] = key
+        except Exception as e:
+            print("Could not create transaction from {}: {}".format(src_acc.address0x, e))
+    return submit_params(params_list, unique_senders(items), tags, get_trace(directory, phase))
 
+def send_items(items, max_workers, phase=None):
+    # Items may come tagged already (see tag_items)
+    if items and len(items[0]) == 5:
+        items = tag_items(items, phase)
     txn_info_list = []
+    mark_send_start()
+    nonce_allocator().sync(unique_senders(items), API_ENDPOINT)
+    if INTRA_SHARD_FRACTION is not None:
+        locality_report([(item[0], item[1]) for item in items], shard_count())
     start = datetime.datetime.now()
 
-    with ProcessPoolExecutor(max_workers=max_workers) as pool:
-        all_tasks = [pool.submit(iat_create_txns, src_acc, txn_map[src_acc], zils) for src_acc in txn_map]
-
-        for future in futures.as_completed(all_tasks):
-            try:
-                txns, src_acc, new_nonce = future.result()
-                for tx in txns:
-                    register_send(src_acc, tx)
-                txn_info_list.extend(txns)
-                assign_nonce(src_acc, new_nonce)
-            except Exception as e:
-                print("IAT Error: {}".format(e))
+    for txns in get_pool(max_workers).map_chunks(create_txns, items, phase, trace_dir()):
+        for txn_info, src_acc in txns:
+            register_send(src_acc, txn_info, phase)
+            txn_info_list.append(txn_info)
 
     end = datetime.datetime.now()
     td = end - start
     print("Produced {} transactions in {} => {:.2f} TPS".format(len(txn_info_list), td, len(txn_info_list)/td.total_seconds()), flush=True)
     return txn_info_list
 
-def tiat_create_txns(contract, src_acc, dest_accs, amount):
-        # Clear any cached sessions. This is needed to ensure multiple processes
-        # don't try to reuse the same TCP connection, which would lead to havoc
-        LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
-        chain.set_active_chain(LocalNet)
-        src_acc = Account(private_key=src_acc.private_key)
-        contract = Contract.load_from_address(contract.address, load_state=False)
-
-        txn_info_list = []
-        contract.account = src_acc
-        src_addr = src_acc.bech32_address
-        orig_nonce = nonces.get(src_addr, src_acc.get_nonce())
-        for dest_acc in dest_accs:
-            try:
-                dest = dest_acc.address0x
-                txn_info = contract.call(method="Transfer", params=[Contract.value_dict("to", "ByStr20", dest),
-                        Contract.value_dict("tokens", "Uint128", str(amount))], nonce=new_nonce(src_acc), confirm=False)
-                txn_info_list.append(txn_info)
-                print(json.dumps(src_acc.last_params), file=sys.stderr)
-                print("Created {} transactions".format(len(txn_info_list)))
-            except Exception as e:
-                print("Could not send from {} to {}: {}".format(src_acc.address0x, dest, e))
-        nonce_now = nonces.get(src_addr, src_acc.get_nonce())
-        # print("{}: created {} transactions; nonce went from {} to {}".format(src_acc.bech32_address, len(txn_info_list), orig_nonce, nonce_now))
-        return txn_info_list, src_acc, nonce_now
+def send_transactions(pairs, builder, contract, amount, max_workers):
+    contract_addr = contract.address if contract is not None else None
+    return send_items([(src_acc, dest_acc, builder, contract_addr, amount) for src_acc, dest_acc in pairs], max_workers)
 
-def token_inter_account_transactions(contract, from_accounts, to_accounts, amount, max_workers=8):
+def inter_account_transactions(from_accounts, to_accounts, zils, max_workers=8):
     assert len(from_accounts) > 0
-    txn_map = get_txn_map(from_accounts, to_accounts)
-
-    txn_info_list = []
-    start = datetime.datetime.now()
-
-    with ProcessPoolExecutor(max_workers=max_workers) as pool:
-        all_tasks = [pool.submit(tiat_create_txns, contract, src_acc, txn_map[src_acc], amount) for src_acc in txn_map]
-
-        for future in futures.as_completed(all_tasks):
-            try:
-                txns, src_acc, new_nonce = future.result()
-                for tx in txns:
-                    register_send(src_acc, tx)
-                txn_info_list.extend(txns)
-                assign_nonce(src_acc, new_nonce)
-            except Exception as e:
-                print("Error: {}".format(e))
-
-    end = datetime.datetime.now()
-    td = end - start
-    print("Produced {} transactions in {} => {:.2f} TPS".format(len(txn_info_list), td, len(txn_info_list)/td.total_seconds()), flush=True)
-    return txn_info_list
+    pairs = txn_pairs(get_txn_map(from_accounts, to_accounts))
+    return send_transactions(pairs, None, None, zils, max_workers)
 
-def crowd_create_txns(contract, src_accs, amount):
-        # Clear any cached sessions. This is needed to ensure multiple processes
-        # don't try to reuse the same TCP connection, which would lead to havoc
-        LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
-        chain.set_active_chain(LocalNet)
-        contract = Contract.load_from_address(contract.address, load_state=False)
-
-        txn_info_list = []
-        for src_acc in src_accs:
-            contract.account = src_acc
-            src_addr = src_acc.bech32_address
-            try:
-                txn_info = contract.call(method="Donate", params=[], zils=amount, nonce=1, confirm=False)
-                txn_info_list.append(txn_info)
-                print(json.dumps(src_acc.last_params), file=sys.stderr)
-                print("Created {} transactions".format(len(txn_info_list)))
-            except Exception as e:
-                print("Crowdfund exception: {}".format(e))
-        # nonce_now = nonces.get(src_addr, src_acc.get_nonce())
-        return txn_info_list, src_acc, None
+def token_inter_account_transactions(contract, from_accounts, to_accounts, amount, max_workers=8):
+    assert len(from_accounts) > 0
+    pairs = txn_pairs(get_txn_map(from_accounts, to_accounts))
+    return send_transactions(pairs, workloads.ft_transfer, contract, amount, max_workers)
 
 def crowd_transactions(contract, src_accs, amount, max_workers=8):
-    txn_info_list = []
-    with ProcessPoolExecutor(max_workers=max_workers) as pool:
-        all_tasks = [pool.submit(crowd_create_txns, contract, [ src_acc ], amount) for src_acc in src_accs]
-        for future in futures.as_completed(all_tasks):
-            try:
-                txns, src_acc, new_nonce = future.result()
-                for tx in txns:
-                    register_send(src_acc, tx)
-                txn_info_list.extend(txns)
-                # assign_nonce(src_acc, new_nonce)
-            except Exception as e:
-                print("Error: {}".format(e))
-
-
-def get_token_id(owner):
-    return str(int(hashlib.md5(owner.encode('utf-8')).hexdigest(), 16))
-
-def nft_create_txns(contract, src_acc, dest_accs, type='mint'):
-        # Clear any cached sessions. This is needed to ensure multiple processes
-        # don't try to reuse the same TCP connection, which would lead to havoc
-        LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
-        chain.set_active_chain(LocalNet)
-        src_acc = Account(private_key=src_acc.private_key)
-        contract = Contract.load_from_address(contract.address, load_state=False)
-
-        txn_info_list = []
-        contract.account = src_acc
-        src_addr = src_acc.bech32_address
-        for dest_acc in dest_accs:
-            try:
-                src = src_acc.address0x
-                dest = dest_acc.address0x
-                txn_info = None
-                if type == 'mint':
-                    txn_info = contract.call(method="mint", params=[Contract.value_dict("to", "ByStr20", dest),
-                            Contract.value_dict("tokenId", "Uint256", get_token_id(dest))], nonce=1, confirm=False)
-                elif type == 'transfer':
-                    txn_info = contract.call(method="transfer", params=[
-                            Contract.value_dict("tokenOwner", "ByStr20", src),
-                            Contract.value_dict("to", "ByStr20", dest),
-                            Contract.value_dict("tokenId", "Uint256", get_token_id(src))], nonce=1, confirm=False)
-                txn_info_list.append(txn_info)
-                print(json.dumps(src_acc.last_params), file=sys.stderr)
-                print("Created {} transactions".format(len(txn_info_list)))
-            except Exception as e:
-                print("Could not send from {} to {}: {}".format(src_acc.address0x, dest, e))
-        return txn_info_list, src_acc, None
+    pairs = [(src_acc, None) for src_acc in src_accs]
+    return send_transactions(pairs, workloads.donate, contract, amount, max_workers)
 
 def nft_transactions(contract, from_accounts, to_accounts, type='mint', max_workers=8):
     assert len(from_accounts) > 0
-    txn_map = get_txn_map(from_accounts, to_accounts)
-
-    txn_info_list = []
-    start = datetime.datetime.now()
-
-    with ProcessPoolExecutor(max_workers=max_workers) as pool:
-        all_tasks = [pool.submit(nft_create_txns, contract, src_acc, txn_map[src_acc], type) for src_acc in txn_map]
-
-        for future in futures.as_completed(all_tasks):
-            try:
-                txns, src_acc, new_nonce = future.result()
-                for tx in txns:
-                    register_send(src_acc, tx)
-                txn_info_list.extend(txns)
-                # assign_nonce(src_acc, new_nonce)
-            except Exception as e:
-                print("Error: {}".format(e))
-
-    end = datetime.datetime.now()
-    td = end - start
-    print("Produced {} transactions in {} => {:.2f} TPS".format(len(txn_info_list), td, len(txn_info_list)/td.total_seconds()), flush=True)
-    return txn_info_list
-
-def parentLabelToNode(parentNode, label):
-    label_hash = hashlib.sha256(label.encode('utf-8')).hexdigest()
-    parentNode = parentNode[2:]
-    concat = bytes.fromhex(parentNode + label_hash)
-    node = hashlib.sha256(concat).hexdigest()
-    return '0x' + node
-
-rootNode = "0x0000000000000000000000000000000000000000000000000000000000000000"
-
-def contract_create_multidest_txns(contract, src_acc, dest_accs, method):
-        # Clear any cached sessions. This is needed to ensure multiple processes
-        # don't try to reuse the same TCP connection, which would lead to havoc
-        LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
-        chain.set_active_chain(LocalNet)
-        src_acc = Account(private_key=src_acc.private_key)
-        contract = Contract.load_from_address(contract.address, load_state=False)
-
-        txn_info_list = []
-        contract.account = src_acc
-        src_addr = src_acc.bech32_address
-        for dest_acc in dest_accs:
-            try:
-                dest = dest_acc.address0x
-                txn_info = None
-                if method == 'bestow':
-                    label = dest_acc.bech32_address
-                    txn_info = contract.call(method="bestow", params=[
-                        Contract.value_dict("node", "ByStr32", parentLabelToNode(rootNode, label)),
-                        Contract.value_dict("label", "String", label),
-                        Contract.value_dict("owner", "ByStr20", dest),
-                        Contract.value_dict("resolver", "ByStr20", "0x0000000000000000000000000000000000000000")], nonce=1, confirm=False)
-                txn_info_list.append(txn_info)
-                print(json.dumps(src_acc.last_params), file=sys.stderr)
-                print("Created {} transactions".format(len(txn_info_list)))
-            except Exception as e:
-                print("Could not send from {} to {}: {}".format(src_acc.address0x, dest, e))
-        return txn_info_list, src_acc, None
-
+    builder = workloads.nft_mint if type == 'mint' else workloads.nft_transfer
+    pairs = txn_pairs(get_txn_map(from_accounts, to_accounts))
+    return send_transactions(pairs, builder, contract, None, max_workers)
 
 def contract_multidest_transactions(contract, from_accounts, to_accounts, method, max_workers=8):
     assert len(from_accounts) > 0
-    txn_map = get_txn_map(from_accounts, to_accounts)
-
-    txn_info_list = []
-    start = datetime.datetime.now()
-
-    with ProcessPoolExecutor(max_workers=max_workers) as pool:
-        all_tasks = [pool.submit(contract_create_multidest_txns, contract, src_acc, txn_map[src_acc], method) for src_acc in txn_map]
-
-        for future in futures.as_completed(all_tasks):
-            try:
-                txns, src_acc, new_nonce = future.result()
-                for tx in txns:
-                    register_send(src_acc, tx)
-                txn_info_list.extend(txns)
-                # assign_nonce(src_acc, new_nonce)
-            except Exception as e:
-                print("Error: {}".format(e))
-
-    end = datetime.datetime.now()
-    td = end - start
-    print("Produced {} transactions in {} => {:.2f} TPS".format(len(txn_info_list), td, len(txn_info_list)/td.total_seconds()), flush=True)
-    return txn_info_list
-
-def contract_create_txns(contract, src_accs, method):
-        # Clear any cached sessions. This is needed to ensure multiple processes
-        # don't try to reuse the same TCP connection, which would lead to havoc
-        LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
-        chain.set_active_chain(LocalNet)
-        contract = Contract.load_from_address(contract.address, load_state=False)
-
-        txn_info_list = []
-        for src_acc in src_accs:
-            contract.account = src_acc
-            src_addr = src_acc.bech32_address
-            try:
-                txn_info = None
-                if method == 'registerOwnership':
-                    txn_info = contract.call(method="registerOwnership", params=[
-                        Contract.value_dict("ipfs_cid", "String", src_addr)], nonce=1, confirm=False)
-                elif method == 'configureResolver':
-                    label = src_addr
-                    txn_info = contract.call(method="configureResolver", params=[
-                        Contract.value_dict("recordOwner", "ByStr20", src_acc.address0x),
-                        Contract.value_dict("node", "ByStr32", parentLabelToNode(rootNode, label)),
-                        Contract.value_dict("resolver", "ByStr20", src_acc.address0x)], nonce=1, confirm=False)
-                txn_info_list.append(txn_info)
-                print(json.dumps(src_acc.last_params), file=sys.stderr)
-                print("Created {} transactions".format(len(txn_info_list)))
-            except Exception as e:
-                print("Crowdfund exception: {}".format(e))
-        # nonce_now = nonces.get(src_addr, src_acc.get_nonce())
-        return txn_info_list, src_acc, None
+    pairs = txn_pairs(get_txn_map(from_accounts, to_accounts))
+    return send_transactions(pairs, workloads.WORKLOADS[method][0], contract, None, max_workers)
 
 def contract_transactions(contract, src_accs, method, max_workers=8):
-    txn_info_list = []
-    with ProcessPoolExecutor(max_workers=max_workers) as pool:
-        all_tasks = [pool.submit(contract_create_txns, contract, [ src_acc ], method) for src_acc in src_accs]
-        for future in futures.as_completed(all_tasks):
-            try:
-                txns, src_acc, new_nonce = future.result()
-                for tx in txns:
-                    register_send(src_acc, tx)
-                txn_info_list.extend(txns)
-                # assign_nonce(src_acc, new_nonce)
-            except Exception as e:
-                print("Error: {}".format(e))
+    pairs = [(src_acc, None) for src_acc in src_accs]
+    return send_transactions(pairs, workloads.WORKLOADS[method][0], contract, None, max_workers)
 
 def main_run():
-
-    # # # Dry run
-    # funded_accounts = 1
-    # level = 1
-    # level_bal = {level: int(genesis.get_balance())}
-    # prev_batch_size = 1
-
-    # num_levels = math.ceil(math.log(NUM_ACCOUNTS, ACC_BATCH_SIZE))
-
-    # while funded_accounts < NUM_ACCOUNTS:
-    #     batch_size = min(ACC_BATCH_SIZE ** level, NUM_ACCOUNTS - funded_accounts)
-    #     amount_to_transfer = math.ceil(1.1 * NUM_ACCOUNTS * ACC_MIN_BALANCE) if level == 1 else (level_bal[level]  - ACC_MIN_BALANCE)/ batch_size
-
-    #     print("{} accounts at level {}".format(batch_size, level + 1))
-    #     for l, bal in level_bal.items():
-    #         print("Level {} balance: {} ZILs".format(l, bal))
-
-    #     total_to_transfer = amount_to_transfer * batch_size
-    #     print("Transferring {} ZILs ({}x balance) from each account account @L{} to accounts @L{}".format(total_to_transfer, total_to_transfer/level_bal[level], level, level + 1))
-
-    #     level_bal[level + 1] = amount_to_transfer
-    #     level += 1
-    #     prev_batch_size = batch_size
-    #     funded_accounts += batch_size
-
-    #     print("----------------")
-
-    # exit(0)
-
-    # Simple distribution from genesis to accounts
-
-    # print(genesis.get_nonce())
-
-    # batch_accs = []
-    # for _ in range(NUM_ACCOUNTS):
-    #     acc = gen_account()
-    #     batch_accs.append(acc)
-    # nativet = inter_account_transactions( [ genesis ], batch_accs, zils=ACC_MIN_BALANCE)
-
-    # exit(0)
-
-    # token = deploy_contract(genesis,
-    #     "fungible.scilla", [
-    #     Contract.value_dict("owner", "ByStr20", genesis.address0x),
-    #     # Contract.value_dict("_sharding_input", "String",
-    #     # "{\"transitions\" : [\"Transfer\", \"TransferFrom\", \"Mint\"], \"weak_reads\": [\"Transfer:balances[_sender]\", \"TransferFrom:balances[from]\"]}"),
-    #     Contract.value_dict("init_supply", "Uint128", "1000000000000000000000000000000000"),
-    #     Contract.value_dict("decimals", "Uint32", "0"),
-    #     Contract.value_dict("name", "String", "Megabux"),
-    #     Contract.value_dict("symbol", "String", "MGBX"),
-    #     Contract.value_dict("default_operators", "List ByStr20", "[]")])
-
-    # exit(0)
-
-    # Transfers between accounts
-
-    # token = Contract.load_from_address("0xf3a8bc908694DDd2d92c86317827a8A55476a700", load_state=False)
-
-    # batch_accs = []
-    # for _ in range(NUM_ACCOUNTS):
-    #     acc = gen_account()
-    #     batch_accs.append(acc)
-    # tokent = token_inter_account_transactions(token, batch_accs, batch_accs, amount=100)
-
-    # crowd = deploy_contract(genesis, "CrowdFunding.scilla", [
-    #     Contract.value_dict("owner", "ByStr20", genesis.address0x),
-    #     Contract.value_dict("max_block", "BNum", "1000"),
-    #     Contract.value_dict("goal", "Uint128", "5000")])
-
-    # pprint(crowd.get_state())
-
-    # nonfung = deploy_contract(genesis, "nonfungible-rewritten.scilla", [
-    #     Contract.value_dict("_sharding_input", "String",
-    #     "{\"transitions\" : [\"mint\", \"transfer\"]}"),
-    #     Contract.value_dict("contractOwner", "ByStr20", genesis.address0x),
-    #     Contract.value_dict("name", "String", "CryptoKatz"),
-    #     Contract.value_dict("symbol", "String", "KATZ"),
-    # ])
-
-    # pprint(nonfung.get_state())
-
-
-    # proof = deploy_contract(genesis, "ProofIPFS.scilla", [
-    #     Contract.value_dict("_sharding_input", "String",
-    #     "{\"transitions\" : [\"registerOwnership\"]}"),
-    #     Contract.value_dict("owner", "ByStr20", genesis.address0x),
-    # ])
-
-    # pprint(proof.get_state())
-
-    # registry = deploy_contract(genesis, "registry-rewritten.scilla", [
-    #     Contract.value_dict("_sharding_input", "String",
-    #     "{\"transitions\" : [\"configureResolver\", \"bestow\"]}"),
-    #     Contract.value_dict("initialOwner", "ByStr20", genesis.address0x),
-    #     Contract.value_dict("rootNode", "ByStr32", "0x0000000000000000000000000000000000000000000000000000000000000000"),
-    # ])
-
-    # pprint(registry.get_state())
-
-    # exit(0)
-
-    # crowd = Contract.load_from_address("0xe1e16bf479a754f8b1010e6f908bdd5c98f8ff6f", load_state=False)
-    # nonfung = Contract.load_from_address("0x25f8fb3dcd66ef086fb69c27c9b7b01c88a7c28d", load_state=False)
-    # proof = Contract.load_from_address("0x555395974120a87b73dbc367a01e3f8a9de790f6", load_state=False)
-    registry = Contract.load_from_address("0xf4661d40eadcaab4d7547df30a04344558d8e15c", load_state=False)
-
-    batch_accs = []
-    for _ in range(NUM_ACCOUNTS):
-        acc = gen_account()
-        batch_accs.append(acc)
-
-    contract_multidest_transactions(registry, [ genesis ], batch_accs, 'bestow')
-    print("XXXXX", file=sys.stderr, flush=True)
-    contract_transactions(registry, batch_accs, 'configureResolver')
-
-    # print("XXXXX", file=sys.stderr, flush=True)
-
-    # nft_transactions(nonfung, [genesis], batch_accs, type='mint')
-    # print("XXXXX", file=sys.stderr, flush=True)
-    # nft_transactions(nonfung, batch_accs, batch_accs, type='transfer')
-
-    exit(0)
-
-    # Fancy distribution
-    funded_accounts = 1
-    accounts = [ genesis ]
-    prev_batch = accounts
-    # Keep representative account for each level to check balance
-    level = 1
-    level_acc = {level: genesis}
-    while funded_accounts < NUM_ACCOUNTS:
-        # Aim to increase with every batch, until we hit the desired NUM_ACCOUNTS
-        batch_size = min(max(ACC_BATCH_SIZE, len(prev_batch) ** 100), NUM_ACCOUNTS - funded_accounts)
-
-        acc = level_acc[level]
-        # amount_to_transfer = math.ceil(1.1 * NUM_ACCOUNTS * ACC_MIN_BALANCE) if level == 1 else (acc.get_balance() - ACC_MIN_BALANCE) / batch_size
-        tokens_to_transfer = math.ceil(1.1 * NUM_ACCOUNTS * TOKEN_MIN_BALANCE) if level == 1 else (int(token.get_state()["balances"][acc.address0x]) - TOKEN_MIN_BALANCE) // batch_size
-
-        tx_batch = []
-        batch_accs = []
-        for _ in range(batch_size):
-            acc = gen_account()
-            batch_accs.append(acc)
-
-        for l, acc in level_acc.items():
-            print("Level {} balance: {} ZILs, {} MGBX".format(l, acc.get_balance(), token.get_state()["balances"][acc.address0x]))
-        # print("Transferring {} ZILs and {} MGBX from each of {} account(s) @L{} to each of {} account(s) @L{}".format(amount_to_transfer, tokens_to_transfer, len(prev_batch), level, len(batch_accs), level + 1))
-
-        # nativet = inter_account_transactions(prev_batch, batch_accs, zils=amount_to_transfer)
-        tokent = token_inter_account_transactions(token, prev_batch, batch_accs, amount=tokens_to_transfer)
-
-        prev_batch = batch_accs
-        accounts.extend(batch_accs)
-        funded_accounts += len(batch_accs)
-        level += 1
-        level_acc[level] = batch_accs[0]
-
-        # tx_batch.extend(nativet)
-        tx_batch.extend(tokent)
-        wait_for_txs(tx_batch)
-        print("Total accounts funded: {}".format(funded_accounts))
+    # Deployments and workloads that used to be commented in and out here are
+    # now scenario files (scenarios/*.json) run by scenario.py
+    from scenario import Engine, load_scenario, DEFAULT_SCENARIO
+    Engine(load_scenario(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SCENARIO)).run()
 
 if __name__ == "__main__":
     main_run()
\ No newline at end of file
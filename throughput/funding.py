@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Tree funding: genesis funds FANOUT accounts, each of which funds FANOUT more,
+# and so on, so N accounts are funded in O(log N) rounds with every level
+# sending in parallel. Each transfer carries enough for the recipient's whole
+# subtree plus the fees of its own transfers. ZIL and token balances are spread
+# along the same tree. After a round is confirmed a sample of the recipients is
+# checked, and the last fully confirmed level is saved so a run can resume.
+#
+#   ./funding.py --accounts 100000 --zils 1000
+#   ./funding.py --accounts 100000 --zils 1000 --token 0xf3a8... --tokens 1000000
+import argparse
+import datetime
+import json
+import os
+import random
+
+from pyzil.zilliqa.units import Qa
+
+import fund
+import workloads
+from batch_submit import BatchZilliqaAPI
+from tracker import ConfirmationTracker, norm_hash
+from txparams import min_gas_price, TRANSFER_GAS_LIMIT, CALL_GAS_LIMIT, to_qa
+
+FANOUT = 100
+SAMPLE_SIZE = 20
+ROUND_RETRIES = 3
+STATE_FILE = "funding.json"
+# What unfunded() reports a recipient is short of
+ZIL = "zil"
+TOKEN = "token"
+
+class FundingTree:
+    # Node 0 is genesis and node i is accounts[i - 1]; the children of node u
+    # are nodes u * fanout + 1 ... u * fanout + fanout, as in a heap
+    def __init__(self, accounts, fanout, zils, tokens=0, token=None):
+        self.nodes = [fund.genesis] + list(accounts)
+        self.fanout = fanout
+        self.token = token
+        self.tokens = tokens if token is not None else 0
+        n = len(self.nodes)
+
+        gas_price = min_gas_price()
+        fee = gas_price * TRANSFER_GAS_LIMIT + (gas_price * CALL_GAS_LIMIT if self.tokens else 0)
+        keep = int(to_qa(zils))
+        # Subtree sizes and amounts needed, from the leaves up
+        self.size = [1] * n
+        self.need = [keep] * n
+        self.need[0] = 0
+        for u in range(n - 1, 0, -1):
+            p = self.parent(u)
+            self.size[p] += self.size[u]
+            self.need[p] += self.need[u] + fee
+
+    def parent(self, u):
+        return (u - 1) // self.fanout
+
+    def children(self, u):
+        return range(u * self.fanout + 1, min(u * self.fanout + self.fanout, len(self.nodes) - 1) + 1)
+
+    def levels(self):
+        level = [0]
+        while level:
+            yield level
+            level = [c for u in level for c in self.children(u)]
+
+    def token_need(self, u):
+        return self.tokens * self.size[u]
+
+    def items(self, level, missing=None):
+        # (sender, recipient, builder, contract, amount) for every transfer of a
+        # round; given missing (from unfunded), only the transfers of the assets
+        # each recipient is short of
+        out = []
+        for u in level:
+            for c in self.children(u):
+                assets = {ZIL, TOKEN} if missing is None else missing.get(c, ())
+                if ZIL in assets:
+                    out.append((self.nodes[u], self.nodes[c], None, None, Qa(self.need[c])))
+                if self.tokens and TOKEN in assets:
+                    out.append((self.nodes[u], self.nodes[c], workloads.ft_transfer, self.token, self.token_need(c)))
+        return out
+
+    def unfunded(self, recipients):
+        # Maps each recipient whose ZIL or token balance is below what it should
+        # have to the set of assets it is short of
+        api = BatchZilliqaAPI(fund.API_ENDPOINT)
+        recipients = list(recipients)
+        missing = {}
+        for i in range(0, len(recipients), api.batch_size):
+            chunk = recipients[i:i + api.batch_size]
+            results = api.batch_call("GetBalance", [self.nodes[c].address for c in chunk])
+            for c, (resp, error) in zip(chunk, results):
+                if error is not None or int(resp["balance"]) < self.need[c]:
+                    missing.setdefault(c, set()).add(ZIL)
+            if self.tokens:
+                token_addr = self.token.lower().replace("0x", "")
+                results = api.batch_call("GetSmartContractSubState",
+                        [[token_addr, "balances", [self.nodes[c].address0x]] for c in chunk])
+                for c, (resp, error) in zip(chunk, results):
+                    balances = (resp or {}).get("balances", {})
+                    if error is not None or int(balances.get(self.nodes[c].address0x, 0)) < self.token_need(c):
+                        missing.setdefault(c, set()).add(TOKEN)
+        return missing
+
+def confirm(txn_info_list, start_block):
+    # Returns the hashes of the transactions still unconfirmed at the cut-off
+    tracker = ConfirmationTracker(start_block=start_block)
+    if fund.get_journal() is not None:
+        tracker.on_confirm(fund.get_journal().confirmed)
+    for txn_info in txn_info_list:
+        tracker.add(txn_info["TranID"])
+    latest = tracker.poll(fund.api)
+    tracker.wait(fund.api, latest + fund.WAIT_BLOCKS, timeout=fund.TX_TIMEOUT, sleep=fund.WAIT_TIME)
+    fund.reset_send_start()
+    return set(tracker.pending)
+
+def load_state(params):
+    if not os.path.exists(STATE_FILE):
+        return 0
+    with open(STATE_FILE) as f:
+        state = json.load(f)
+    if state.get("params") != params:
+        print("{} is for a different funding run; starting over".format(STATE_FILE), flush=True)
+        return 0
+    return state["levels_done"]
+
+def save_state(params, levels_done):
+    with open(STATE_FILE + ".tmp", 'w') as f:
+        json.dump({"params": params, "levels_done": levels_done}, f)
+    os.replace(STATE_FILE + ".tmp", STATE_FILE)
+
+def fund_tree(accounts, zils, tokens=0, token=None, fanout=FANOUT, max_workers=8, resume=True):
+    tree = FundingTree(accounts, fanout, zils, tokens, token)
+    params = {"accounts": len(accounts), "first": getattr(accounts[0], "index", None), "fanout": fanout,
+        "zils": str(zils), "tokens": tree.tokens, "token": token}
+    levels = list(tree.levels())
+    done = load_state(params) if resume else 0
+    print("Funding {} accounts in {} rounds (fan-out {}); genesis needs {} ZILs{}".format(
+        len(accounts), len(levels) - 1, fanout, Qa(tree.need[0]).toZil(),
+        ", resuming at round {}".format(done + 1) if done else ""), flush=True)
+
+    start = datetime.datetime.now()
+    for d in range(done, len(levels) - 1):
+        recipients = set(levels[d + 1])
+        # A resumed round may have partly gone through before the crash
+        items = tree.items(levels[d], tree.unfunded(recipients) if d == done and done > 0 else None)
+        round_start = int(fund.api.GetBlockchainInfo()["NumTxBlocks"]) - 1
+        sent = []
+        for attempt in range(ROUND_RETRIES):
+            if not items:
+                break
+            senders = sum(1 for u in levels[d] if len(tree.children(u)))
+            print("Round {}: {} senders, {} transfers{}".format(d + 1, senders, len(items),
+                " (retry {})".format(attempt) if attempt else ""), flush=True)
+            # Journalled, but not filtered by it: balances tell what is left to send
+            tagged = fund.tag_items(items)
+            txn_info_list = fund.send_items(tagged, max_workers, "funding:{}".format(d + 1))
+            sent += txn_info_list
+            pending = confirm(sent, round_start)
+            # A rejected transfer leaves a gap in its sender's nonces that holds
+            # back the sender's later transfers. Sending it again reuses the
+            # rejected nonce, which lets them through, so they are not re-sent.
+            accepted = {txn_info["item"] for txn_info in txn_info_list}
+            items = [item[:5] for item in tagged if item[5] not in accepted]
+            if pending and not items:
+                # Stuck without a gap: the node dropped them. Re-sync their
+                # senders and send again only what did not arrive.
+                stuck = [txn_info for txn_info in sent if norm_hash(txn_info["TranID"]) in pending]
+                for acc in {id(fund.sent_by[t["TranID"]]): fund.sent_by[t["TranID"]] for t in stuck}.values():
+                    fund.sync_nonce_to_blockchain(acc)
+                sent = [txn_info for txn_info in sent if norm_hash(txn_info["TranID"]) not in pending]
+                items = tree.items(levels[d], tree.unfunded(recipients))
+        else:
+            if items:
+                raise RuntimeError("round {}: {} transfers still not confirmed".format(d + 1, len(items)))
+
+        sample = random.sample(levels[d + 1], min(SAMPLE_SIZE, len(levels[d + 1])))
+        missing = tree.unfunded(sample)
+        if missing:
+            raise RuntimeError("round {}: {} of {} sampled accounts are underfunded".format(d + 1, len(missing), len(sample)))
+        save_state(params, d + 1)
+        print("Round {} confirmed; sampled {} balances ({})".format(d + 1, len(sample), datetime.datetime.now() - start), flush=True)
+    return tree
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fund test accounts from genesis as a tree")
+    parser.add_argument("--accounts", type=int, default=fund.NUM_ACCOUNTS)
+    parser.add_argument("--zils", default=str(fund.ACC_MIN_BALANCE), help="ZILs left in every account")
+    parser.add_argument("--token", default=None, help="FungibleToken contract to spread as well")
+    parser.add_argument("--tokens", type=int, default=fund.TOKEN_MIN_BALANCE, help="tokens left in every account")
+    parser.add_argument("--fanout", type=int, default=FANOUT)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-resume", action="store_true", help="ignore {}".format(STATE_FILE))
+    args = parser.parse_args()
+
+    fund.prepare_accounts(args.accounts)
+    accounts = [fund.gen_account() for _ in range(args.accounts)]
+    fund_tree(accounts, args.zils, args.tokens, args.token, args.fanout, args.workers, not args.no_resume)
+    fund.shutdown_pool()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# HDR-style log-linear latency histogram. Values (integers, e.g. microseconds)
+# are kept with a relative error below 2^-(SUB_BITS-1) over any range, in a
+# sparse dict of bucket counts, so histograms are cheap to merge and reset.
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+
+def bucket_index(v):
+    if v < SUB_COUNT:
+        return v
+    shift = v.bit_length() - SUB_BITS
+    return SUB_COUNT + (shift - 1) * HALF_COUNT + ((v >> shift) - HALF_COUNT)
+
+def bucket_value(idx):
+    # Midpoint of the range of values that land in bucket idx
+    if idx < SUB_COUNT:
+        return idx
+    shift = (idx - SUB_COUNT) // HALF_COUNT + 1
+    top = (idx - SUB_COUNT) % HALF_COUNT + HALF_COUNT
+    return (top << shift) + (1 << (shift - 1))
+
+class Histogram:
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def record(self, v):
+        v = max(0, int(v))
+        idx = bucket_index(v)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.count += 1
+        if self.min is None or v < self.min:
+            self.min = v
+        if self.max is None or v > self.max:
+            self.max = v
+
+    def merge(self, other):
+        for idx, c in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + c
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def reset(self):
+        self.__init__()
+
+    def percentile(self, p):
+        if self.count == 0:
+            return None
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(max(bucket_value(idx), self.min), self.max)
+        return self.max
+
+    def summary(self, percentiles=(50, 99, 99.9)):
+        return {p: self.percentile(p) for p in percentiles}
+
+def format_us(v):
+    if v is None:
+        return "-"
+    if v >= 1000000:
+        return "{:.2f}s".format(v / 1000000)
+    if v >= 1000:
+        return "{:.1f}ms".format(v / 1000)
+    return "{}us".format(v)
+
+def format_summary(hist, percentiles=(50, 99, 99.9)):
+    return " ".join("p{:g} {}".format(p, format_us(v)) for p, v in hist.summary(percentiles).items())
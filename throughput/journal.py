@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Run journal: every accepted transaction is appended to an SQLite database in
+# WAL mode with its sender, nonce, phase and submit time, and updated when it is
+# confirmed. Rows are buffered and written in one transaction per batch, so the
+# journal keeps up with the senders. After a crash, fund.py and replay-trace.py
+# read it back to skip confirmed work and to restore nonces without asking the
+# chain about every account.
+#
+#   ./journal.py journal.db
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from tracker import norm_hash
+
+JOURNAL_FILE = "journal.db"
+# Buffered rows are written once there are this many, or this many seconds after the last write
+FLUSH_ROWS = 1000
+FLUSH_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS txns (
+    txn_id TEXT PRIMARY KEY,
+    sender TEXT NOT NULL,
+    sender_index INTEGER,
+    nonce INTEGER NOT NULL,
+    phase TEXT,
+    item TEXT,
+    submitted REAL,
+    status TEXT NOT NULL DEFAULT 'sent',
+    block INTEGER,
+    mb_index INTEGER,
+    confirmed REAL
+);
+CREATE INDEX IF NOT EXISTS txns_phase ON txns (phase, status);
+CREATE INDEX IF NOT EXISTS txns_sender ON txns (sender, nonce);
+CREATE TABLE IF NOT EXISTS steps (
+    name TEXT PRIMARY KEY,
+    value TEXT,
+    finished REAL
+);
+"""
+
+class Journal:
+    def __init__(self, path=JOURNAL_FILE, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        # Shared by the sending and block-following threads; the lock serialises them
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.sent_rows = []
+        self.confirmed_rows = []
+        self.last_flush = time.time()
+
+    def sent(self, txn_id, sender, nonce, submitted=None, phase=None, item=None, sender_index=None):
+        with self.lock:
+            self.sent_rows.append((norm_hash(txn_id), sender.lower(), sender_index, int(nonce), phase, item, submitted))
+            self.maybe_flush()
+
+    def confirmed(self, txn_id, submitted, block, mb_index, now):
+        # Same signature as a ConfirmationTracker listener
+        with self.lock:
+            self.confirmed_rows.append((block, mb_index, now, norm_hash(txn_id)))
+            self.maybe_flush()
+
+    def maybe_flush(self):
+        if len(self.sent_rows) + len(self.confirmed_rows) >= self.flush_rows or time.time() - self.last_flush >= self.flush_interval:
+            self.write()
+
+    def write(self):
+        # Sent rows go first, so a confirmation never arrives before its transaction
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO txns (txn_id, sender, sender_index, nonce, phase, item, submitted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", self.sent_rows)
+            self.db.executemany("UPDATE txns SET status = 'confirmed', block = ?, mb_index = ?, confirmed = ? "
+                "WHERE txn_id = ?", self.confirmed_rows)
+        self.sent_rows = []
+        self.confirmed_rows = []
+        self.last_flush = time.time()
+
+    def flush(self):
+        with self.lock:
+            self.write()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def step_done(self, name, value=None):
+        self.flush()
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO steps VALUES (?, ?, ?)", (name, value, time.time()))
+
+    def done_steps(self):
+        # Step name -> value recorded with it
+        with self.lock:
+            return dict(self.db.execute("SELECT name, value FROM steps"))
+
+    def confirmed_items(self, phase):
+        with self.lock:
+            return {row[0] for row in self.db.execute(
+                "SELECT item FROM txns WHERE phase = ? AND status = 'confirmed'", (phase,))}
+
+    def accepted(self):
+        # (sender, nonce) of every transaction the network accepted, confirmed or not
+        with self.lock:
+            return set(self.db.execute("SELECT sender, nonce FROM txns"))
+
+    def unconfirmed(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT txn_id FROM txns WHERE status != 'confirmed'")]
+
+    def nonce_state(self):
+        # Per sender: (sender, sender_index, first nonce, last nonce, unconfirmed count)
+        with self.lock:
+            return list(self.db.execute("SELECT sender, MAX(sender_index), MIN(nonce), MAX(nonce), "
+                "SUM(status != 'confirmed') FROM txns GROUP BY sender"))
+
+    def summary(self):
+        with self.lock:
+            rows = list(self.db.execute("SELECT phase, status, COUNT(*), MIN(submitted), MAX(confirmed) "
+                "FROM txns GROUP BY phase, status ORDER BY MIN(submitted)"))
+            steps = self.db.execute("SELECT COUNT(*) FROM steps").fetchone()[0]
+        for phase, status, count, first, last in rows:
+            print("{:<40} {:<10} {:>8}".format(phase or "-", status, count))
+        print("{} transactions, {} steps done".format(sum(r[2] for r in rows), steps))
+
+# One journal per process and path, for worker processes that write on their
+# own; keyed by pid too, since a forked worker must not reuse its parent's connection
+_journals = {}
+
+def get_journal(path=JOURNAL_FILE):
+    key = (os.getpid(), path)
+    journal = _journals.get(key)
+    if journal is None:
+        journal = _journals[key] = Journal(path)
+    return journal
+
+def recorder(path, phase=None):
+    # on_result(tx, txn_info, error) callback that journals accepted transactions
+    journal = get_journal(path)
+    def on_result(tx, txn_info, error):
+        if error is None and txn_info:
+            journal.sent(txn_info["TranID"], tx["pubKey"], tx["nonce"], time.time(), phase)
+    return on_result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a run journal")
+    parser.add_argument("journal", nargs="?", default=JOURNAL_FILE)
+    args = parser.parse_args()
+    Journal(args.journal).summary()
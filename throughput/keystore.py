@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# Compact keystore for test accounts: a fixed-width binary file that is
+# memory-mapped and indexed by account number. Public key, private key, address
+# and bech32 address are all stored up front, so opening a keystore with a
+# million accounts is a single mmap and looking one up is a slice.
+#
+#   ./keystore.py generate 100000        # extend accounts.ks to 100k accounts
+#   ./keystore.py import accounts.csv    # convert the old CSV format
+#   ./keystore.py export accounts.csv    # write the CSV format back out
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import datetime
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from fastecdsa import keys as ec_keys
+from pyzil.account import Account
+from pyzil.crypto import schnorr, zilkey
+
+KEYSTORE_FILE = "accounts.ks"
+MAGIC = b"ZKS1"
+HEADER = struct.Struct("<4sIQ")
+PUB_SIZE = 33
+PRIV_SIZE = 32
+ADDR_SIZE = 20
+BECH32_SIZE = 42
+RECORD_SIZE = 128
+GEN_CHUNK_SIZE = 1000
+
+class KeyRecord(namedtuple("KeyRecord", ["public_key", "private_key", "address", "bech32_address"])):
+    __slots__ = ()
+
+    @property
+    def address0x(self):
+        return "0x" + self.address
+
+def pack_record(pub, priv, addr, bech32):
+    rec = pub + priv + addr + bech32.encode('ascii')
+    return rec + b"\0" * (RECORD_SIZE - len(rec))
+
+def derive_record(priv_int):
+    pub_point = ec_keys.get_public_key(priv_int, schnorr.CURVE)
+    pub = schnorr.encode_public(pub_point.x, pub_point.y)
+    addr = hashlib.sha256(pub).digest()[-ADDR_SIZE:]
+    bech32 = zilkey.to_bech32_address(addr.hex())
+    return pack_record(pub, priv_int.to_bytes(PRIV_SIZE, "big"), addr, bech32)
+
+def gen_chunk(n):
+    return b"".join(derive_record(schnorr.gen_private_key()) for _ in range(n))
+
+def csv_chunk(lines):
+    out = []
+    for line in lines:
+        pub, priv, _ = line.strip().split(',')[:3]
+        rec = derive_record(int(priv, 16))
+        # The stored public key must match the one in the CSV
+        assert rec[:PUB_SIZE] == bytes.fromhex(pub), "public/private key mismatch in CSV"
+        out.append(rec)
+    return b"".join(out)
+
+class Keystore:
+    def __init__(self, path=KEYSTORE_FILE):
+        self.path = path
+        self.mm = None
+        self.count = 0
+        if os.path.exists(path):
+            self.open()
+
+    def open(self):
+        with open(self.path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            raise ValueError("{} is not a keystore".format(self.path))
+        self.count = count
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError("account {} not in keystore ({} accounts)".format(idx, self.count))
+        off = HEADER.size + idx * RECORD_SIZE
+        return self.mm[off:off + RECORD_SIZE]
+
+    def __getitem__(self, idx):
+        rec = self.raw(idx)
+        pub = rec[:PUB_SIZE]
+        priv = rec[PUB_SIZE:PUB_SIZE + PRIV_SIZE]
+        addr = rec[PUB_SIZE + PRIV_SIZE:PUB_SIZE + PRIV_SIZE + ADDR_SIZE]
+        bech32 = rec[PUB_SIZE + PRIV_SIZE + ADDR_SIZE:PUB_SIZE + PRIV_SIZE + ADDR_SIZE + BECH32_SIZE]
+        return KeyRecord(pub.hex(), priv.hex(), addr.hex(), bech32.decode('ascii'))
+
+    def append(self, records):
+        # records is a bytes object holding whole records; the header count is
+        # updated last so a crash mid-append leaves a consistent keystore
+        self.close()
+        n = len(records) // RECORD_SIZE
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        with open(self.path, mode) as f:
+            if mode == 'w+b':
+                f.write(HEADER.pack(MAGIC, RECORD_SIZE, 0))
+            f.seek(HEADER.size + self.count * RECORD_SIZE)
+            f.write(records)
+            f.flush()
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, RECORD_SIZE, self.count + n))
+        self.open()
+
+    def extend_to(self, n, max_workers=None):
+        # Generate keys in parallel until the keystore holds at least n accounts
+        missing = n - self.count
+        if missing <= 0:
+            return
+        sizes = [min(GEN_CHUNK_SIZE, missing - i) for i in range(0, missing, GEN_CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for block in pool.map(gen_chunk, sizes):
+                self.append(block)
+                print("Keystore: {} accounts".format(self.count), flush=True)
+
+    def import_csv(self, csv_path, max_workers=None):
+        with open(csv_path, 'r') as f:
+            lines = [l for l in f if l.strip()]
+        chunks = [lines[i:i + GEN_CHUNK_SIZE] for i in range(0, len(lines), GEN_CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for block in pool.map(csv_chunk, chunks):
+                self.append(block)
+
+    def export_csv(self, csv_path):
+        with open(csv_path, 'w') as f:
+            for i in range(self.count):
+                r = self[i]
+                f.write("{},{},{}\n".format(r.public_key.upper(), r.private_key.upper(), r.address))
+
+# One keystore and one handle per account index in each process
+_keystore = None
+_handles = {}
+
+def get_keystore(path=KEYSTORE_FILE):
+    global _keystore
+    if _keystore is None:
+        _keystore = Keystore(path)
+    return _keystore
+
+def make_account(rec):
+    # Derives the public key (~0.4ms); AccountHandle builds each account once per process
+    return Account(address=rec.address, private_key=rec.private_key)
+
+def account_handle(index):
+    h = _handles.get(index)
+    if h is None:
+        h = _handles[index] = AccountHandle(index)
+    return h
+
+class AccountHandle:
+    # Account number in the keystore. Addresses are read from the record and
+    # the pyzil Account is only built when signing or querying the chain; both
+    # are cached for the life of the process. Pickles as just the index.
+    __slots__ = ("index", "_record", "_account")
+
+    def __init__(self, index):
+        self.index = index
+        self._record = None
+        self._account = None
+
+    def __reduce__(self):
+        return account_handle, (self.index,)
+
+    def __eq__(self, other):
+        return isinstance(other, AccountHandle) and self.index == other.index
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def __repr__(self):
+        return "<AccountHandle #{}>".format(self.index)
+
+    @property
+    def record(self):
+        if self._record is None:
+            self._record = get_keystore()[self.index]
+        return self._record
+
+    @property
+    def account(self):
+        if self._account is None:
+            self._account = make_account(self.record)
+        return self._account
+
+    @property
+    def public_key(self):
+        return self.record.public_key
+
+    @property
+    def private_key(self):
+        return self.record.private_key
+
+    @property
+    def address(self):
+        return self.record.address
+
+    @property
+    def address0x(self):
+        return self.record.address0x
+
+    @property
+    def bech32_address(self):
+        return self.record.bech32_address
+
+    @property
+    def zil_key(self):
+        return self.account.zil_key
+
+    def get_nonce(self):
+        return self.account.get_nonce()
+
+    def get_balance(self):
+        return self.account.get_balance()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the binary account keystore")
+    parser.add_argument("--keystore", default=KEYSTORE_FILE)
+    parser.add_argument("--procs", type=int, default=None)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("generate").add_argument("count", type=int)
+    sub.add_parser("import").add_argument("csv")
+    sub.add_parser("export").add_argument("csv")
+    args = parser.parse_args()
+
+    ks = Keystore(args.keystore)
+    start = datetime.datetime.now()
+    if args.cmd == "generate":
+        ks.extend_to(args.count, args.procs)
+    elif args.cmd == "import":
+        ks.import_csv(args.csv, args.procs)
+    elif args.cmd == "export":
+        ks.export_csv(args.csv)
+    print("{} now holds {} accounts ({})".format(args.keystore, len(ks), datetime.datetime.now() - start), file=sys.stderr)
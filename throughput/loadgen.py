@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# Open-loop load generation: transactions are sent on a fixed schedule (constant
+# rate or Poisson arrivals) that does not depend on how fast the node answers.
+# Latencies are measured from the scheduled send time, so queueing in the client
+# or the lookup shows up in the numbers instead of silently lowering the rate.
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+
+from async_submit import NUM_CONNECTIONS, async_api
+import metrics
+from histogram import Histogram, format_summary
+from ratecontrol import format_plateau
+from tracker import ConfirmationTracker
+from results import RunResults
+
+REPORT_INTERVAL = 5.0
+POLL_INTERVAL = 2.0
+INCLUSION_TIMEOUT = 300
+
+def arrival_offsets(rate, arrivals='constant', seed=None):
+    # Seconds since the start of the run at which each transaction is due;
+    # rate may be a function, read again for every gap (see ratecontrol.py)
+    current = rate if callable(rate) else lambda: rate
+    rng = random.Random(seed)
+    t = 0.0
+    while True:
+        yield t
+        t += rng.expovariate(current()) if arrivals == 'poisson' else 1.0 / current()
+
+class LoadStats:
+    def __init__(self):
+        self.sent = 0
+        self.accepted = 0
+        self.rejected = Counter()
+        self.included = 0
+        # Per-interval histograms are folded into the totals on every report
+        self.submit = Histogram()
+        self.inclusion = Histogram()
+        self.total_submit = Histogram()
+        self.total_inclusion = Histogram()
+        # Set by an adaptive run
+        self.plateau = None
+
+    def record_submit(self, latency_s):
+        self.submit.record(latency_s * 1e6)
+
+    def record_inclusion(self, latency_s):
+        self.included += 1
+        self.inclusion.record(latency_s * 1e6)
+
+    def roll_interval(self):
+        self.total_submit.merge(self.submit)
+        self.total_inclusion.merge(self.inclusion)
+        self.submit.reset()
+        self.inclusion.reset()
+
+def rejection_reason(e):
+    return str(e).split(':')[0][:60]
+
+class OpenLoop:
+    def __init__(self, endpoint, rate, arrivals='constant', report_interval=REPORT_INTERVAL,
+                 track_inclusion=True, on_result=None, num_connections=NUM_CONNECTIONS, label="open-loop", results_file=None,
+                 on_confirm=None, controller=None):
+        self.endpoint = endpoint
+        self.rate = rate
+        self.arrivals = arrivals
+        self.report_interval = report_interval
+        self.track_inclusion = track_inclusion
+        self.on_result = on_result
+        self.num_connections = num_connections
+        self.label = label
+        self.stats = LoadStats()
+        # Pending set maps TranID -> scheduled send time, for transactions not yet seen in a block
+        self.tracker = ConfirmationTracker()
+        self.tracker.on_confirm(self.included)
+        self.results = RunResults()
+        self.results_file = results_file
+        self.tracker.on_confirm(self.results.confirmed)
+        if on_confirm is not None:
+            self.tracker.on_confirm(on_confirm)
+        self.pending = self.tracker.pending
+        self.sending = True
+        # An AIMDController that sets the rate instead of the fixed one
+        self.controller = controller
+
+    def included(self, txn_id, scheduled, block, mb_index, now):
+        self.stats.record_inclusion(asyncio.get_running_loop().time() - scheduled)
+
+    async def send(self, tx, scheduled):
+        loop = asyncio.get_running_loop()
+        metrics.submitted()
+        try:
+            txn_info = await self.api.call("CreateTransaction", tx)
+            metrics.accepted()
+            self.stats.accepted += 1
+            self.stats.record_submit(loop.time() - scheduled)
+            if self.controller is not None:
+                self.controller.record(loop.time() - scheduled)
+            if self.track_inclusion and txn_info:
+                self.tracker.add(txn_info["TranID"], scheduled)
+                self.results.add_submission(txn_info, time.time() - (loop.time() - scheduled))
+            error = None
+        except Exception as e:
+            txn_info = None
+            error = e
+            metrics.rejected(e)
+            self.stats.rejected.update([rejection_reason(e)])
+            if self.controller is not None:
+                self.controller.record(loop.time() - scheduled, e)
+        if self.on_result is not None:
+            self.on_result(tx, txn_info, error)
+
+    async def poll_inclusion(self):
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while self.sending or self.pending:
+            if not self.sending:
+                deadline = deadline or loop.time() + INCLUSION_TIMEOUT
+                if loop.time() > deadline:
+                    break
+            try:
+                await self.tracker.poll_async(self.api)
+            except Exception as e:
+                print("[{}] block tracker: {}".format(self.label, e), file=sys.stderr)
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def report(self, elapsed, interval_sent, interval_len):
+        s = self.stats
+        print("[{}] t={:.0f}s offered {:.1f} TPS, sent {}, accepted {}, rejected {}, awaiting inclusion {} | submit {} | inclusion {}".format(
+            self.label, elapsed, interval_sent / interval_len, s.sent, s.accepted, sum(s.rejected.values()), len(self.pending),
+            format_summary(s.submit), format_summary(s.inclusion)), file=sys.stderr, flush=True)
+        s.roll_interval()
+
+    async def reporter(self, t0):
+        loop = asyncio.get_running_loop()
+        last_sent = 0
+        last = t0
+        while True:
+            await asyncio.sleep(self.report_interval)
+            now = loop.time()
+            self.report(now - t0, self.stats.sent - last_sent, now - last)
+            last_sent = self.stats.sent
+            last = now
+
+    async def control(self):
+        loop = asyncio.get_running_loop()
+        c = self.controller
+        c.start(loop.time(), self.stats.included)
+        while True:
+            await asyncio.sleep(c.window)
+            if self.track_inclusion:
+                row = c.update(loop.time(), len(self.pending), self.stats.included)
+            else:
+                row = c.update(loop.time())
+            print("[{}] rate {rate} -> {next_rate} TPS: accepted {accepted_tps} TPS, rejected {reject_rate} "
+                "(overloaded {overload_rate}), p90 {p90}s, awaiting inclusion {pending} {signal}".format(self.label, **row), file=sys.stderr, flush=True)
+
+    async def run(self, tx_iter):
+        self.api = async_api(self.endpoint, self.num_connections)
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        reporter = asyncio.ensure_future(self.reporter(t0))
+        poller = asyncio.ensure_future(self.poll_inclusion()) if self.track_inclusion else None
+        rate = self.rate
+        controller = None
+        if self.controller is not None:
+            rate = lambda: self.controller.rate
+            controller = asyncio.ensure_future(self.control())
+
+        tasks = set()
+        for tx, offset in zip(tx_iter, arrival_offsets(rate, self.arrivals)):
+            scheduled = t0 + offset
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Never wait for earlier requests: the schedule is independent of responses
+            task = asyncio.ensure_future(self.send(tx, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            self.stats.sent += 1
+            if self.controller is not None:
+                self.controller.record_send()
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        self.sending = False
+        if controller is not None:
+            controller.cancel()
+            self.stats.plateau = self.controller.plateau()
+            self.controller.close()
+        if poller is not None:
+            await poller
+        reporter.cancel()
+        self.stats.roll_interval()
+        await self.api.close()
+
+        s = self.stats
+        print("[{}] done: sent {} in {:.1f}s, accepted {}, included {}; rejected {}".format(
+            self.label, s.sent, loop.time() - t0, s.accepted, s.included, dict(s.rejected)), file=sys.stderr)
+        print("[{}] submit latency: {}".format(self.label, format_summary(s.total_submit)), file=sys.stderr, flush=True)
+        if self.controller is not None:
+            print("[{}] plateau: {}".format(self.label, format_plateau(s.plateau)), file=sys.stderr, flush=True)
+        if self.track_inclusion:
+            print("[{}] inclusion latency: {}".format(self.label, format_summary(s.total_inclusion)), file=sys.stderr, flush=True)
+            self.results.print_summary()
+            if self.results_file is not None:
+                self.results.write_csv(self.results_file)
+        return s
+
+def run_open_loop(tx_iter, endpoint, rate, arrivals='constant', report_interval=REPORT_INTERVAL,
+                  track_inclusion=True, on_result=None, num_connections=NUM_CONNECTIONS, label="open-loop", results_file=None,
+                  on_confirm=None, controller=None):
+    gen = OpenLoop(endpoint, rate, arrivals, report_interval, track_inclusion, on_result, num_connections, label, results_file,
+            on_confirm, controller)
+    return asyncio.run(gen.run(tx_iter))
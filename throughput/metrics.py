@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Live load-generator metrics in Prometheus text format. Every sending process
+# claims its own row of shared-memory counters once, when it attaches, and from
+# then on is the only process writing that row. Its threads (endpoint pools,
+# scenario steps) share the row, so updates take a lock local to the process,
+# never one shared with the other workers. The process serving /metrics reads all rows and reports each one labelled by
+# worker; sums across workers are left to Prometheus.
+#
+#   ./replay-trace.py --metrics-port 9100 trace.txt
+#   curl localhost:9100/metrics
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Lock, RawArray, RawValue
+
+MAX_WORKERS = 256
+# Upper bounds (seconds) of the RPC latency buckets; the last bucket is +Inf
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Rejection reasons, matched against the error message in this order
+REASONS = [
+    ("nonce", ("nonce",)),
+    ("balance", ("balance",)),
+    ("gas", ("gas",)),
+    ("duplicate", ("already", "duplicate")),
+    ("timeout", ("timeout", "timed out")),
+    ("connection", ("connection", "refused", "reset")),
+    ("other", ()),
+]
+
+SUBMITTED, ACCEPTED, IN_FLIGHT = range(3)
+REJECTED = 3
+NUM_COUNTERS = REJECTED + len(REASONS)
+# Per (worker, endpoint): one count per bucket, then the sum in microseconds and the count
+HIST_SIZE = len(LATENCY_BUCKETS) + 3
+
+def reason_index(error):
+    msg = str(error).lower()
+    for i, (_, words) in enumerate(REASONS):
+        if any(w in msg for w in words) or not words:
+            return i
+
+class Metrics:
+    def __init__(self, endpoints, max_workers=MAX_WORKERS):
+        # Latencies for endpoints not listed here are reported under the last one
+        self.endpoints = list(endpoints)
+        self.num_slots = max_workers + 1
+        self.counters = RawArray('q', self.num_slots * NUM_COUNTERS)
+        self.hist = RawArray('q', self.num_slots * len(self.endpoints) * HIST_SIZE)
+        self.claimed = RawValue('i', 0)
+        self.lock = Lock()
+        self.started = time.time()
+
+    def claim(self):
+        # Once per process; beyond max_workers processes share the last row,
+        # which then loses the odd update
+        with self.lock:
+            slot = min(self.claimed.value, self.num_slots - 1)
+            self.claimed.value = max(self.claimed.value, slot + 1)
+        return slot
+
+    def render(self):
+        out = []
+        slots = range(self.claimed.value)
+
+        def counter(name, kind, help, index):
+            out.append("# HELP loadgen_{} {}".format(name, help))
+            out.append("# TYPE loadgen_{} {}".format(name, kind))
+            for s in slots:
+                out.append('loadgen_{}{{worker="{}"}} {}'.format(name, s, self.counters[s * NUM_COUNTERS + index]))
+
+        counter("submitted_total", "counter", "Transactions sent to a lookup", SUBMITTED)
+        counter("accepted_total", "counter", "Transactions the lookup accepted", ACCEPTED)
+        counter("in_flight", "gauge", "Transactions sent and not yet answered", IN_FLIGHT)
+        out.append("# HELP loadgen_rejected_total Transactions the lookup rejected, by reason")
+        out.append("# TYPE loadgen_rejected_total counter")
+        for s in slots:
+            for i, (reason, _) in enumerate(REASONS):
+                out.append('loadgen_rejected_total{{worker="{}",reason="{}"}} {}'.format(
+                    s, reason, self.counters[s * NUM_COUNTERS + REJECTED + i]))
+
+        out.append("# HELP loadgen_rpc_latency_seconds JSON-RPC round-trip time")
+        out.append("# TYPE loadgen_rpc_latency_seconds histogram")
+        for s in slots:
+            for e, endpoint in enumerate(self.endpoints):
+                base = (s * len(self.endpoints) + e) * HIST_SIZE
+                labels = 'endpoint="{}",worker="{}"'.format(endpoint, s)
+                total = 0
+                for b, le in enumerate(LATENCY_BUCKETS + ["+Inf"]):
+                    total += self.hist[base + b]
+                    out.append('loadgen_rpc_latency_seconds_bucket{{{},le="{}"}} {}'.format(labels, le, total))
+                out.append('loadgen_rpc_latency_seconds_sum{{{}}} {:.6f}'.format(labels, self.hist[base + HIST_SIZE - 2] / 1e6))
+                out.append('loadgen_rpc_latency_seconds_count{{{}}} {}'.format(labels, self.hist[base + HIST_SIZE - 1]))
+
+        out.append("# HELP loadgen_uptime_seconds Seconds since the metrics were created")
+        out.append("# TYPE loadgen_uptime_seconds gauge")
+        out.append("loadgen_uptime_seconds {:.1f}".format(time.time() - self.started))
+        return "\n".join(out) + "\n"
+
+def serve(metrics, port, host=""):
+    # Serves /metrics from a daemon thread of the calling process
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print("Serving metrics on http://{}:{}/metrics".format(host or "localhost", port), flush=True)
+    return server
+
+# Per process: the shared metrics, this process's row, endpoint -> histogram
+# offset, and the lock its threads take to update the row
+_metrics = None
+_slot = None
+_endpoints = {}
+_row_lock = threading.Lock()
+
+def attach(metrics):
+    # Also the pool initializer of worker processes
+    global _metrics, _slot, _endpoints, _row_lock
+    if metrics is None:
+        return
+    _row_lock = threading.Lock()
+    _metrics = metrics
+    _slot = metrics.claim()
+    n = len(metrics.endpoints)
+    _endpoints = {endpoint: (_slot * n + e) * HIST_SIZE for e, endpoint in enumerate(metrics.endpoints)}
+
+def get_metrics():
+    return _metrics
+
+def submitted(n=1):
+    if _metrics is not None:
+        base = _slot * NUM_COUNTERS
+        with _row_lock:
+            _metrics.counters[base + SUBMITTED] += n
+            _metrics.counters[base + IN_FLIGHT] += n
+
+def accepted(n=1):
+    if _metrics is not None:
+        base = _slot * NUM_COUNTERS
+        with _row_lock:
+            _metrics.counters[base + ACCEPTED] += n
+            _metrics.counters[base + IN_FLIGHT] -= n
+
+def rejected(error):
+    if _metrics is not None:
+        base = _slot * NUM_COUNTERS
+        index = base + REJECTED + reason_index(error)
+        with _row_lock:
+            _metrics.counters[index] += 1
+            _metrics.counters[base + IN_FLIGHT] -= 1
+
+def rpc_latency(endpoint, seconds):
+    if _metrics is not None:
+        base = _endpoints.get(endpoint)
+        if base is None:
+            base = (_slot * len(_metrics.endpoints) + len(_metrics.endpoints) - 1) * HIST_SIZE
+        hist = _metrics.hist
+        bucket = base + bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with _row_lock:
+            hist[bucket] += 1
+            hist[base + HIST_SIZE - 2] += int(seconds * 1e6)
+            hist[base + HIST_SIZE - 1] += 1
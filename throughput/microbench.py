@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# Microbenchmarks of the client side of one transaction, stage by stage, so a
+# "Produced N transactions => X TPS" figure can be split into what the client
+# costs and what the node costs. For every workload in workloads.WORKLOADS the
+# stages are: building the transition parameters (Contract.value_dict), the
+# protobuf serialization that is signed, Schnorr signing, the whole signed
+# CreateTransaction parameters, and the json.dumps trace write. Account
+# construction and the RPC round trip to --endpoint (e.g. simulator.py) are
+# measured once. Results are saved as JSON and compared with a baseline.
+#
+#   ./microbench.py --save-baseline
+#   ./microbench.py                     # exits with 1 on a regression
+#   ./microbench.py --filter sign --no-rpc
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from pyzil.account import Account
+from pyzil.zilliqa import chain
+from pyzil.common import utils
+from pyzil.zilliqa.proto import messages_pb2 as pb2
+
+import workloads
+from batch_submit import BatchZilliqaAPI
+from keystore import Keystore, gen_chunk, make_account
+from txparams import transfer_params, call_params, GAS_PRICE
+
+API_ENDPOINT = "http://localhost:4201"
+CHAIN_VERSION = 1
+RESULTS_FILE = "microbench.json"
+BASELINE_FILE = "microbench-baseline.json"
+REPEAT = 5
+# Slower than the baseline median by more than this fraction is a regression
+THRESHOLD = 0.10
+RPC_BATCH_SIZE = 100
+CONTRACT = "0x" + "ab" * 20
+
+def bench(fn, repeat=REPEAT):
+    # timeit picks how many calls make one ~0.2 s run; the result is the
+    # median and best time per call over repeat runs, in microseconds
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    times = [t / number * 1e6 for t in timer.repeat(repeat, number)]
+    return {"median_us": statistics.median(times), "min_us": min(times), "calls": number * repeat}
+
+def data_to_sign(key, params):
+    # The part of build_transaction_params that serializes the transaction
+    txn_proto = pb2.ProtoTransactionCoreInfo()
+    txn_proto.version = CHAIN_VERSION
+    txn_proto.nonce = int(params["nonce"])
+    txn_proto.toaddr = utils.hex_str_to_bytes(params["toAddr"])
+    txn_proto.senderpubkey.data = key.keypair_bytes.public
+    txn_proto.amount.data = utils.int_to_bytes(int(params["amount"]), n_bytes=16)
+    txn_proto.gasprice.data = utils.int_to_bytes(int(params["gasPrice"]), n_bytes=16)
+    txn_proto.gaslimit = int(params["gasLimit"])
+    if params["data"]:
+        txn_proto.data = params["data"].encode("utf-8")
+    return txn_proto.SerializeToString()
+
+def test_accounts():
+    # Two throwaway keystore records, so handles are built as in a real run
+    with tempfile.TemporaryDirectory() as d:
+        ks = Keystore(os.path.join(d, "bench.ks"))
+        ks.append(gen_chunk(2))
+        records = [ks[0], ks[1]]
+        ks.close()
+    return records
+
+def benchmarks(endpoint=None):
+    # Yields (name, function) pairs
+    records = test_accounts()
+    src, dest = make_account(records[0]), make_account(records[1])
+    trace = open(os.devnull, 'w')
+    yield "account.pyzil", lambda: Account(private_key=records[0].private_key)
+    yield "account.keystore", lambda: make_account(records[0])
+
+    for name, (builder, _) in workloads.WORKLOADS.items():
+        if builder is None:
+            make = lambda: transfer_params(src, dest.bech32_address, 1, 1, gas_price=GAS_PRICE)
+        else:
+            yield "params.{}".format(name), lambda builder=builder: builder(src, dest, 1)
+            method, args, zils = builder(src, dest, 1)
+            make = lambda method=method, args=args, zils=zils: call_params(src, CONTRACT, method, args, 1, zils=zils, gas_price=GAS_PRICE)
+        params = make()
+        message = data_to_sign(src.zil_key, params)
+        yield "serialize.{}".format(name), lambda params=params: data_to_sign(src.zil_key, params)
+        yield "sign.{}".format(name), lambda message=message: src.zil_key.sign_str(message)
+        yield "build.{}".format(name), make
+        yield "trace.{}".format(name), lambda params=params: print(json.dumps(params), file=trace)
+
+    if endpoint is not None:
+        api = BatchZilliqaAPI(endpoint, batch_size=RPC_BATCH_SIZE)
+        params = transfer_params(src, dest.bech32_address, 1, 1, gas_price=GAS_PRICE)
+        # Rejections are fine: the round trip is what is measured
+        yield "rpc.GetBlockchainInfo", lambda: api.call("GetBlockchainInfo")
+        yield "rpc.CreateTransaction", lambda: api.single_calls("CreateTransaction", [params])
+        yield "rpc.batch{}".format(RPC_BATCH_SIZE), lambda: api.batch_call("CreateTransaction", [params] * RPC_BATCH_SIZE)
+
+def compare(results, baseline, threshold=THRESHOLD):
+    # Returns the names of the benchmarks that got slower than the baseline
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        change = r["median_us"] / b["median_us"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<36} {:>12.1f} us  baseline {:>12.1f} us  {:+6.1f}%{}".format(
+            name, r["median_us"], b["median_us"], 100 * change, flag))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the client-side transaction hot path")
+    parser.add_argument("--endpoint", default=API_ENDPOINT, help="JSON-RPC endpoint for the round-trip benchmarks")
+    parser.add_argument("--no-rpc", action="store_true", help="skip the round-trip benchmarks")
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--out", default=RESULTS_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="slow-down counted as a regression")
+    args = parser.parse_args()
+
+    chain.set_active_chain(chain.BlockChain(args.endpoint, version=CHAIN_VERSION, network_id=0))
+    results = {}
+    for name, fn in benchmarks(None if args.no_rpc else args.endpoint):
+        if args.filter and args.filter not in name:
+            continue
+        r = results[name] = bench(fn, args.repeat)
+        print("{:<36} {:>12.1f} us  (best {:.1f} us, {:.0f}/s)".format(name, r["median_us"], r["min_us"], 1e6 / r["median_us"]), flush=True)
+
+    meta = {"time": datetime.datetime.now().isoformat(), "python": platform.python_version(),
+        "machine": platform.machine(), "node": platform.node()}
+    with open(args.out, 'w') as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1)
+        print("Saved baseline to {}".format(args.baseline))
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("Compared with {} ({}):".format(args.baseline, baseline["meta"]["time"]))
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("{} regressions: {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# Nonce allocation shared by all worker processes. Each account has a slot in a
+# shared-memory array holding the last nonce handed out, so several workers can
+# send from the same account at once without stitching nonces back together in
+# the parent. Keystore accounts use their index as slot; genesis, which is not
+# in the keystore, uses the extra slot at the end. The nonces
+# of rejected transactions are handed out again before new ones, so the gap a
+# rejection leaves is refilled by the sender's next transaction.
+from multiprocessing import Lock, RawArray, RawValue
+
+from pyzil.zilliqa.api import APIError
+
+from batch_submit import BatchZilliqaAPI, BatchNotSupported
+
+UNKNOWN = -1
+NUM_STRIPES = 64
+# Rejected nonces waiting to be reused, over all accounts
+MAX_HOLES = 4096
+
+class NonceAllocator:
+    def __init__(self, capacity, genesis_address):
+        self.capacity = capacity
+        self.genesis_address = genesis_address.lower()
+        self.last = RawArray('q', [UNKNOWN] * (capacity + 1))
+        # Striped locks: one lock per account would be too many semaphores
+        self.locks = [Lock() for _ in range(NUM_STRIPES)]
+        # (slot, nonce) pairs; holes_lock is taken after a stripe lock, never before
+        self.holes = RawArray('q', 2 * MAX_HOLES)
+        self.num_holes = RawValue('i', 0)
+        self.holes_lock = Lock()
+
+    def slot(self, acc):
+        index = getattr(acc, "index", None)
+        if index is None:
+            if acc.address.lower() != self.genesis_address:
+                raise ValueError("account {} has no keystore index".format(acc.address))
+            return self.capacity
+        if not 0 <= index < self.capacity:
+            raise IndexError("account {} outside nonce allocator ({} slots)".format(index, self.capacity))
+        return index
+
+    def reserve(self, acc, count=1):
+        # Returns the first of count consecutive nonces for acc
+        slot = self.slot(acc)
+        lock = self.locks[slot % NUM_STRIPES]
+        if self.last[slot] == UNKNOWN:
+            # Read the chain outside the lock, so the RPC does not hold up the
+            # other accounts on the stripe; the first reader to finish installs it
+            nonce = acc.get_nonce()
+            with lock:
+                if self.last[slot] == UNKNOWN:
+                    self.last[slot] = nonce
+        with lock:
+            if count == 1 and self.num_holes.value:
+                nonce = self.take_hole(slot)
+                if nonce is not None:
+                    return nonce
+            first = self.last[slot] + 1
+            self.last[slot] += count
+        return first
+
+    def take_hole(self, slot):
+        # Lowest rejected nonce of slot, or None
+        with self.holes_lock:
+            best = None
+            for i in range(self.num_holes.value):
+                if self.holes[2 * i] == slot and (best is None or self.holes[2 * i + 1] < self.holes[2 * best + 1]):
+                    best = i
+            if best is None:
+                return None
+            nonce = self.holes[2 * best + 1]
+            self.drop_hole(best)
+            return nonce
+
+    def drop_hole(self, i):
+        last = self.num_holes.value - 1
+        self.holes[2 * i], self.holes[2 * i + 1] = self.holes[2 * last], self.holes[2 * last + 1]
+        self.num_holes.value = last
+
+    def release(self, acc, nonce):
+        # nonce was rejected: the node never took it, so the next reserve for acc
+        # hands it out again. Returns False if there is no room to remember it.
+        slot = self.slot(acc)
+        with self.locks[slot % NUM_STRIPES], self.holes_lock:
+            if self.last[slot] == UNKNOWN or nonce > self.last[slot]:
+                return True
+            n = self.num_holes.value
+            if n == MAX_HOLES:
+                return False
+            self.holes[2 * n], self.holes[2 * n + 1] = slot, nonce
+            self.num_holes.value = n + 1
+        return True
+
+    def next(self, acc):
+        return self.reserve(acc, 1)
+
+    def get(self, acc):
+        slot = self.slot(acc)
+        return None if self.last[slot] == UNKNOWN else self.last[slot]
+
+    def set(self, acc, nonce):
+        slot = self.slot(acc)
+        with self.locks[slot % NUM_STRIPES]:
+            self.last[slot] = nonce
+            if self.num_holes.value:
+                with self.holes_lock:
+                    for i in reversed(range(self.num_holes.value)):
+                        if self.holes[2 * i] == slot:
+                            self.drop_hole(i)
+
+    def resync(self, acc):
+        # Restart from the chain, forgetting any rejected nonces. Only safe
+        # once none of the account's transactions are pending.
+        nonce = acc.get_nonce()
+        self.set(acc, nonce)
+        return nonce
+
+    def sync(self, accs, endpoint, batch_size=None):
+        # Read the chain nonce of every account whose slot is still unknown,
+        # in batches, so workers do not each issue a GetBalance per account
+        todo = [acc for acc in accs if self.last[self.slot(acc)] == UNKNOWN]
+        for acc, nonce in zip(todo, chain_nonces(todo, endpoint, batch_size)):
+            if nonce is not None:
+                self.set(acc, nonce)
+        return len(todo)
+
+    def release_rejected(self, rejected, endpoint, batch_size=None):
+        # rejected holds (acc, nonce) for transactions the node answered with an
+        # error. Only a nonce above the account's chain nonce is still unused and
+        # handed out again; one the chain has used up (nonce too low, or the
+        # same transaction already in) is not. Returns the accounts whose nonce
+        # could not be remembered.
+        full = []
+        nonces = chain_nonces([acc for acc, _ in rejected], endpoint, batch_size)
+        for (acc, nonce), chain_nonce in zip(rejected, nonces):
+            if chain_nonce is not None and nonce > chain_nonce and not self.release(acc, nonce):
+                full.append(acc)
+        return full
+
+def chain_nonces(accs, endpoint, batch_size=None):
+    # Nonce of each account on the chain, None where it could not be read,
+    # fetched with batched GetBalance calls
+    api = BatchZilliqaAPI(endpoint) if batch_size is None else BatchZilliqaAPI(endpoint, batch_size=batch_size)
+    step = max(1, api.batch_size)
+    nonces = []
+    for i in range(0, len(accs), step):
+        addrs = [acc.address for acc in accs[i:i + step]]
+        try:
+            results = api.batch_call("GetBalance", addrs)
+        except BatchNotSupported:
+            results = api.single_calls("GetBalance", addrs)
+        for resp, error in results:
+            if error is None:
+                nonces.append(int(resp["nonce"]))
+            elif isinstance(error, APIError) and str(error) == "Account is not created":
+                nonces.append(0)
+            else:
+                nonces.append(None)
+    return nonces
+
+# The allocator is handed to worker processes through the pool initializer
+_allocator = None
+
+def attach(allocator):
+    global _allocator
+    _allocator = allocator
+
+def get_allocator():
+    return _allocator
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# Offline trace generator: builds signed transaction traces for a workload
+# without talking to a node. Nonces are computed locally and signing is spread
+# over all cores, so replaying the resulting trace measures only the node.
+#
+#   ./presign.py bestow --accounts 25000 --contract 0xf466... -o bestow.trace
+#
+# Accounts come from the keystore (see keystore.py); like fund.py's gen_account,
+# the first account used is #1 by default.
+import argparse
+import json
+import os
+import random
+import sys
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from pyzil.crypto import zilkey
+from pyzil.zilliqa import chain
+
+from txparams import GAS_PRICE, TRANSFER_GAS_LIMIT, CALL_GAS_LIMIT, to_qa
+from workloads import WORKLOADS
+from keystore import KeyRecord, KEYSTORE_FILE, get_keystore, account_handle
+from tracefile import record_writer
+
+CONFIG_FILE = "config.json"
+CHAIN_VERSION = 1
+SIGN_CHUNK_SIZE = 500
+
+def load_accounts(n, first=1):
+    ks = get_keystore()
+    if len(ks) < first + n:
+        raise ValueError("{} has only {} accounts, {} requested".format(KEYSTORE_FILE, len(ks), first + n))
+    return [account_handle(i) for i in range(first, first + n)]
+
+def load_genesis():
+    with open(CONFIG_FILE) as f:
+        g = json.load(f)['genesis']
+    addr = g['address'].lower()
+    return KeyRecord(g['pubkey'], g['privkey'], addr, zilkey.to_bech32_address(addr))
+
+# Signing happens in worker processes; ZilKey construction derives the public
+# key, so keys are cached per process and work is chunked by sender.
+_keys = {}
+_gas_price = GAS_PRICE
+
+def init_signer(version, gas_price):
+    global _gas_price
+    _gas_price = gas_price
+    chain.set_active_chain(chain.BlockChain("http://localhost", version=version, network_id=0))
+
+def sign_chunk(items):
+    out = []
+    for priv, to_addr, amount, nonce, gas_limit, data, priority in items:
+        key = _keys.get(priv)
+        if key is None:
+            key = _keys[priv] = zilkey.ZilKey(private_key=priv)
+        out.append(chain.active_chain.build_transaction_params(key, to_addr, amount, nonce,
+                _gas_price, gas_limit, "", data, priority))
+    return out
+
+def work_items(workload, genesis, accs, contract, amount, txs_per_account, genesis_nonce, start_nonce, seed):
+    builder, senders = WORKLOADS[workload]
+    rng = random.Random(seed)
+    if contract is not None:
+        contract = zilkey.to_checksum_address(contract)
+
+    if senders == "genesis":
+        pairs = [(genesis, dest) for dest in accs]
+    elif senders == "self":
+        pairs = [(src, None) for src in accs]
+    else:
+        pairs = []
+        for src in accs:
+            pairs.extend((src, dest) for dest in rng.sample(accs, txs_per_account))
+
+    nonces = {genesis.address: genesis_nonce}
+    items = []
+    for src, dest in pairs:
+        nonce = nonces.get(src.address, start_nonce)
+        nonces[src.address] = nonce + 1
+        if builder is None:
+            to_addr = zilkey.to_checksum_address(dest.address)
+            items.append((src.private_key, to_addr, to_qa(amount), nonce, TRANSFER_GAS_LIMIT, "", False))
+        else:
+            method, params, zils = builder(src, dest, amount)
+            data = json.dumps({"_tag": method, "params": params})
+            items.append((src.private_key, contract, to_qa(zils), nonce, CALL_GAS_LIMIT, data, True))
+    return items
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate signed transaction traces offline")
+    parser.add_argument("workload", choices=sorted(WORKLOADS))
+    parser.add_argument("--accounts", type=int, required=True, help="number of accounts from {}".format(KEYSTORE_FILE))
+    parser.add_argument("--first-account", type=int, default=1, help="index of the first keystore account to use")
+    parser.add_argument("--contract", default=None, help="address of the target contract (not needed for native transfers)")
+    parser.add_argument("--amount", default="1", help="ZILs (native, Donate) or tokens (FungibleToken) per transaction")
+    parser.add_argument("--txs-per-account", type=int, default=1, help="transactions per sender for account-to-account workloads")
+    parser.add_argument("--genesis-nonce", type=int, default=1, help="first nonce used by the genesis account")
+    parser.add_argument("--start-nonce", type=int, default=1, help="first nonce used by every other account")
+    parser.add_argument("--procs", type=int, default=os.cpu_count(), help="signing processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed for sender/recipient pairing")
+    parser.add_argument("--gas-price", type=int, default=GAS_PRICE, help="gas price in Qa; no node is asked, so pass the chain's minimum if it differs")
+    parser.add_argument("-o", "--output", default=None, help="output trace, e.g. x.trace, x.trace.gz or x.ztrace (default: stdout)")
+    args = parser.parse_args()
+
+    if WORKLOADS[args.workload][0] is not None and args.contract is None:
+        parser.error("workload {} needs --contract".format(args.workload))
+
+    start = datetime.datetime.now()
+    items = work_items(args.workload, load_genesis(), load_accounts(args.accounts, args.first_account), args.contract,
+            args.amount, args.txs_per_account, args.genesis_nonce, args.start_nonce, args.seed)
+
+    # .gz, .zst and .ztrace outputs are compressed or compact (see tracefile.py)
+    out = record_writer(args.output) if args.output else None
+    with ProcessPoolExecutor(max_workers=args.procs, initializer=init_signer, initargs=(CHAIN_VERSION, args.gas_price)) as pool:
+        for signed in pool.map(sign_chunk, chunks(items, SIGN_CHUNK_SIZE)):
+            for params in signed:
+                if out is None:
+                    sys.stdout.write(json.dumps(params) + "\n")
+                else:
+                    out.write(params)
+    if out is not None:
+        out.close()
+
+    td = datetime.datetime.now() - start
+    print("Signed {} transactions in {} => {:.2f} TPS".format(len(items), td, len(items)/td.total_seconds()), file=sys.stderr)
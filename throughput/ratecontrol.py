@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# Additive-increase/multiplicative-decrease control of the offered rate, to find
+# the rate a node can sustain. Every window the controller looks at what the
+# lookup did with the transactions sent in it: the fraction rejected because it
+# is overloaded (not for a bad nonce or balance, which happens at any rate), the p90
+# submit latency (against the best median seen so far), and how fast the set
+# of accepted transactions still waiting for a block grows. If none of them
+# signals congestion the rate goes up by a fixed step, otherwise it is cut by a
+# factor. The rates it was cut at settle into a sawtooth; once the last few are
+# close, the goodput (accepted, and included, TPS) over those windows is the
+# plateau reported.
+#
+#   ./replay-trace.py --rate 100 --adaptive --control-log control.csv trace.txt
+import csv
+import statistics
+
+from async_submit import HTTPStatusError
+from batch_submit import TRANSPORT_ERRORS
+from histogram import Histogram
+
+WINDOW = 5.0
+INCREASE = 25.0
+DECREASE = 0.7
+MIN_RATE = 1.0
+MAX_REJECT_RATE = 0.01
+# JSON-RPC error messages that mean the node is overloaded
+OVERLOAD_MESSAGES = ("busy", "full", "too many", "timeout", "timed out", "rate limit")
+# p90 submit latency above this multiple of the best window median is congestion
+LATENCY_FACTOR = 3.0
+# Latencies (seconds) below this never count as congestion
+LATENCY_FLOOR = 0.05
+# The waiting set may grow by at most this fraction of the accepted rate,
+# measured over GROWTH_WINDOWS windows so block boundaries average out
+MAX_PENDING_GROWTH = 0.1
+GROWTH_WINDOWS = 3
+# No further decrease for this many windows after one, so the cut can take effect
+HOLD_WINDOWS = 1
+# Converged once the last PEAKS cuts happened within PEAK_SPREAD of their median
+PEAKS = 3
+PEAK_SPREAD = 0.15
+
+COLUMNS = ["time", "rate", "offered", "accepted_tps", "included_tps", "reject_rate", "overload_rate", "p50", "p90",
+    "pending", "pending_growth", "signal", "next_rate"]
+
+def overloaded(error):
+    # Transport errors and HTTP errors count, as do overload messages
+    if isinstance(error, TRANSPORT_ERRORS + (HTTPStatusError,)):
+        return True
+    message = str(error).lower()
+    return any(m in message for m in OVERLOAD_MESSAGES)
+
+def slope(points):
+    # Least-squares slope of (t, y) points
+    if len(points) < 2:
+        return 0.0
+    mt = statistics.mean(t for t, _ in points)
+    my = statistics.mean(y for _, y in points)
+    den = sum((t - mt) ** 2 for t, _ in points)
+    return sum((t - mt) * (y - my) for t, y in points) / den if den else 0.0
+
+class AIMDController:
+    def __init__(self, rate, max_rate=None, min_rate=MIN_RATE, increase=INCREASE, decrease=DECREASE,
+                 window=WINDOW, log_file=None):
+        self.rate = float(rate)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.baseline = None
+        self.hold = 0
+        self.peaks = []
+        # Per window rows, and (time, waiting) samples for the growth estimate
+        self.history = []
+        self.waiting = []
+        self.window_start = None
+        self.included_start = 0
+        self.reset()
+        self.log = None
+        if log_file is not None:
+            self.log_file = open(log_file, 'w', newline='')
+            self.log = csv.DictWriter(self.log_file, fieldnames=COLUMNS)
+            self.log.writeheader()
+
+    def reset(self):
+        self.sent = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self.latency = Histogram()
+
+    def start(self, now, included=0):
+        self.window_start = now
+        self.included_start = included
+
+    def record_send(self):
+        self.sent += 1
+
+    def record(self, latency_s, error=None):
+        # One answer from the lookup; latency from the scheduled send time
+        if error is None:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+            if overloaded(error):
+                self.overloaded += 1
+        self.latency.record(latency_s * 1e6)
+
+    def signals(self, overload_rate, p90, growth, accepted_tps):
+        out = []
+        if overload_rate > MAX_REJECT_RATE:
+            out.append("rejections")
+        if p90 is not None and self.baseline is not None and p90 > max(LATENCY_FLOOR, LATENCY_FACTOR * self.baseline):
+            out.append("latency")
+        if len(self.waiting) >= GROWTH_WINDOWS and growth > MAX_PENDING_GROWTH * max(accepted_tps, self.min_rate):
+            out.append("backlog")
+        return out
+
+    def update(self, now, waiting=None, included=None):
+        # Called once per window; returns the row logged for it
+        elapsed = now - self.window_start
+        answered = self.accepted + self.rejected
+        reject_rate = self.rejected / answered if answered else 0.0
+        overload_rate = self.overloaded / answered if answered else 0.0
+        p50 = self.latency.percentile(50)
+        p90 = self.latency.percentile(90)
+        p50 = None if p50 is None else p50 / 1e6
+        p90 = None if p90 is None else p90 / 1e6
+        if p50 is not None:
+            self.baseline = p50 if self.baseline is None else min(self.baseline, p50)
+        accepted_tps = self.accepted / elapsed
+        included_tps = None if included is None else (included - self.included_start) / elapsed
+        growth = 0.0
+        if waiting is not None:
+            self.waiting = (self.waiting + [(now, waiting)])[-GROWTH_WINDOWS:]
+            growth = slope(self.waiting)
+
+        signals = self.signals(overload_rate, p90, growth, accepted_tps)
+        rate = self.rate
+        if signals and self.hold == 0:
+            self.peaks.append(rate)
+            self.rate = max(self.min_rate, rate * self.decrease)
+            self.hold = HOLD_WINDOWS
+            # Growth from before the cut says nothing about the new rate
+            self.waiting = self.waiting[-1:]
+        elif not signals:
+            self.rate = rate + self.increase
+            if self.max_rate is not None:
+                self.rate = min(self.rate, self.max_rate)
+            self.hold = max(0, self.hold - 1)
+        else:
+            self.hold -= 1
+
+        row = {"time": "{:.1f}".format(now), "rate": "{:.1f}".format(rate), "offered": "{:.1f}".format(self.sent / elapsed),
+            "accepted_tps": "{:.1f}".format(accepted_tps),
+            "included_tps": "" if included_tps is None else "{:.1f}".format(included_tps),
+            "reject_rate": "{:.4f}".format(reject_rate), "overload_rate": "{:.4f}".format(overload_rate),
+            "p50": "" if p50 is None else "{:.4f}".format(p50), "p90": "" if p90 is None else "{:.4f}".format(p90),
+            "pending": "" if waiting is None else waiting, "pending_growth": "{:.1f}".format(growth),
+            "signal": "+".join(signals), "next_rate": "{:.1f}".format(self.rate)}
+        self.history.append(dict(row, accepted=accepted_tps, included=included_tps, cut=bool(signals)))
+        if self.log is not None:
+            self.log.writerow(row)
+            self.log_file.flush()
+        self.reset()
+        self.start(now, included or 0)
+        return row
+
+    def converged(self):
+        if len(self.peaks) < PEAKS:
+            return False
+        last = self.peaks[-PEAKS:]
+        mid = statistics.median(last)
+        return all(abs(p - mid) <= PEAK_SPREAD * mid for p in last)
+
+    def plateau(self):
+        # Goodput over the windows since the first of the last PEAKS cuts, or
+        # over the second half of the run if it has not settled
+        cuts = [i for i, h in enumerate(self.history) if h["cut"]]
+        if len(cuts) >= PEAKS:
+            rows = self.history[cuts[-PEAKS]:]
+        else:
+            rows = self.history[len(self.history) // 2:]
+        if not rows:
+            return None
+        included = [h["included"] for h in rows if h["included"] is not None]
+        return {
+            "converged": self.converged(),
+            "peaks": [round(p, 1) for p in self.peaks[-PEAKS:]],
+            "offered_tps": statistics.mean(float(h["rate"]) for h in rows),
+            "accepted_tps": statistics.mean(h["accepted"] for h in rows),
+            "included_tps": statistics.mean(included) if included else None,
+            "windows": len(rows),
+        }
+
+    def close(self):
+        if self.log is not None:
+            self.log_file.close()
+            self.log = None
+
+def format_plateau(p):
+    if p is None:
+        return "no complete window"
+    return "{} at {:.1f} TPS offered: {:.1f} TPS accepted{} over {} windows (cut at {})".format(
+        "settled" if p["converged"] else "not settled", p["offered_tps"], p["accepted_tps"],
+        "" if p["included_tps"] is None else ", {:.1f} TPS included".format(p["included_tps"]),
+        p["windows"], ", ".join(str(x) for x in p["peaks"]) or "-")
@@ -6,11 +6,23 @@ from pyzil.zilliqa import chain
 from pyzil.account import Account
 import json
 import sys
+import time
 import datetime
 import math
+import argparse
+import multiprocessing
+from queue import Empty
 from concurrent import futures
 from concurrent.futures import ProcessPoolExecutor
 
+import async_submit
+import loadgen
+import metrics
+import ratecontrol
+from endpoints import submit_api
+from journal import get_journal, recorder
+from tracefile import iter_trace, sender_bucket
+
 API_ENDPOINT = "http://localhost:4201"
 
 LocalNet = chain.BlockChain(API_ENDPOINT, version=1, network_id=0)
@@ -19,8 +31,13 @@ chain.set_active_chain(LocalNet)
 MAX_NUM_WORKERS = 100
 TARGET_BUCKET_SIZE = 1000
 GET_CHAIN_NONCE = False
+# Per-worker queue bound in streaming mode; caps memory regardless of trace size
+STREAM_QUEUE_SIZE = 1000
+STREAM_PRINT_INTERVAL = 5.0
 
 nonces = {}
+# Sender -> first nonce journalled by an earlier run, used instead of asking the chain
+journal_bases = {}
 
 def partition(list, num_buckets):
     part = {}
@@ -32,19 +49,42 @@ def partition(list, num_buckets):
 
     return part
 
-def submit_chunk(tx_list, chunk_id=0):
+def journal_sent(journal_path, tx, txn_info):
+    if journal_path is not None:
+        get_journal(journal_path).sent(txn_info["TranID"], tx["pubKey"], tx["nonce"], time.time(), "replay")
+
+def flush_journal(journal_path):
+    if journal_path is not None:
+        get_journal(journal_path).flush()
+
+def submit_chunk(tx_list, chunk_id=0, batch_size=1, journal_path=None, endpoints=[API_ENDPOINT]):
+    try:
+        if batch_size > 1 or len(endpoints) > 1:
+            return submit_chunk_batched(tx_list, chunk_id, batch_size, journal_path, endpoints)
+        return submit_chunk_single(tx_list, chunk_id, journal_path)
+    finally:
+        flush_journal(journal_path)
+
+def submit_chunk_single(tx_list, chunk_id, journal_path):
     api = ZilliqaAPI(API_ENDPOINT)
     start = datetime.datetime.now()
     num_txs = 0
 
-    print_interval = int(0.1 * len(tx_list))
+    print_interval = max(1, int(0.1 * len(tx_list)))
     for i, tx in enumerate(tx_list):
+        metrics.submitted()
+        t = time.time()
         try:
             txn_info = api.CreateTransaction(tx)
+            metrics.rpc_latency(API_ENDPOINT, time.time() - t)
+            metrics.accepted()
             print(txn_info)
+            journal_sent(journal_path, tx, txn_info)
             num_txs += 1
         # Within a ProcessPool, we can print the exception, but not raise it to parent
         except Exception as e:
+            metrics.rpc_latency(API_ENDPOINT, time.time() - t)
+            metrics.rejected(e)
             print("Exception from lookup: {}".format(e))
 
         if i % print_interval == 0:
@@ -53,6 +93,86 @@ def submit_chunk(tx_list, chunk_id=0):
             start = datetime.datetime.now()
             num_txs = 0
 
+def submit_chunk_batched(tx_list, chunk_id, batch_size, journal_path=None, endpoints=[API_ENDPOINT]):
+    api = submit_api(endpoints, batch_size)
+    start = datetime.datetime.now()
+    num_txs = 0
+
+    print_interval = max(1, int(0.1 * len(tx_list)))
+    for i, (tx, txn_info, error) in enumerate(api.create_transactions(tx_list)):
+        if error is None:
+            print(txn_info)
+            journal_sent(journal_path, tx, txn_info)
+            num_txs += 1
+        else:
+            print("Exception from lookup for sender {} nonce {}: {}".format(tx["pubKey"], tx["nonce"], error))
+
+        if i % print_interval == 0:
+            td = datetime.datetime.now() - start
+            print("Chunk {}: replayed {} transactions in {} => {:.2f} TPS".format(chunk_id, num_txs, td, num_txs/td.total_seconds()), file=sys.stderr)
+            start = datetime.datetime.now()
+            num_txs = 0
+
+def queue_batches(queue, batch_size):
+    # Yield whatever is queued, up to batch_size transactions at a time, until the None sentinel
+    while True:
+        tx = queue.get()
+        if tx is None:
+            return
+        batch = [tx]
+        while len(batch) < batch_size:
+            try:
+                tx = queue.get_nowait()
+            except Empty:
+                break
+            if tx is None:
+                yield batch
+                return
+            batch.append(tx)
+        yield batch
+
+def stream_worker(queue, chunk_id, batch_size, journal_path=None, shared_metrics=None, endpoints=[API_ENDPOINT]):
+    metrics.attach(shared_metrics)
+    api = submit_api(endpoints, batch_size)
+    start = datetime.datetime.now()
+    num_txs = 0
+
+    for batch in queue_batches(queue, max(1, batch_size)):
+        for tx, txn_info, error in api.create_transactions(batch):
+            if error is None:
+                print(txn_info)
+                journal_sent(journal_path, tx, txn_info)
+                num_txs += 1
+            else:
+                print("Exception from lookup for sender {} nonce {}: {}".format(tx["pubKey"], tx["nonce"], error))
+
+        td = datetime.datetime.now() - start
+        if td.total_seconds() >= STREAM_PRINT_INTERVAL:
+            print("Chunk {}: replayed {} transactions in {} => {:.2f} TPS".format(chunk_id, num_txs, td, num_txs/td.total_seconds()), file=sys.stderr)
+            start = datetime.datetime.now()
+            num_txs = 0
+    flush_journal(journal_path)
+
+def replay_stream(tx_iter, num_workers, batch_size=1, queue_size=STREAM_QUEUE_SIZE, journal_path=None, shared_metrics=None,
+                  endpoints=[API_ENDPOINT]):
+    # Workers start submitting as soon as the first line is parsed. All transactions
+    # from one sender go to the same worker, so they are sent in nonce order.
+    queues = [multiprocessing.Queue(maxsize=queue_size) for _ in range(num_workers)]
+    workers = [multiprocessing.Process(target=stream_worker, args=(q, chunk_id, batch_size, journal_path, shared_metrics, endpoints)) for chunk_id, q in enumerate(queues)]
+    for w in workers:
+        w.start()
+
+    num_txs = 0
+    for tx in tx_iter:
+        queues[sender_bucket(tx, num_workers)].put(tx)
+        num_txs += 1
+
+    for q in queues:
+        q.put(None)
+    for w in workers:
+        w.join()
+    return num_txs
+
 def get_chain_nonce(sender_pubkey):
     acc = Account(public_key=sender_pubkey)
     return acc.get_nonce()
@@ -62,43 +182,126 @@ def new_nonce(sender_id):
     # Python has eager evaluation; don't want nonces.get(sender_id, get_chain_nonce(sender_id))!
     nn = nonces.get(sender_id, -1) + 1
     if nn == 0:
-        nn = get_chain_nonce(sender_id) + 1 if GET_CHAIN_NONCE else 1
+        if sender_id.lower() in journal_bases:
+            # Number the trace as the interrupted run did, so its transactions match the journal
+            nn = journal_bases[sender_id.lower()]
+        else:
+            nn = get_chain_nonce(sender_id) + 1 if GET_CHAIN_NONCE else 1
     nonces[sender_id] = nn
     return nn
 
+def skip_journalled(tx_iter, accepted, skipped):
+    for tx in tx_iter:
+        if (tx["pubKey"].lower(), int(tx["nonce"])) in accepted:
+            skipped[0] += 1
+            continue
+        yield tx
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Provide path to at least one input file!", file=sys.stderr)
-
-    txs = []
-
-    # Process input
-    num_args = len(sys.argv)
-    for idx in range(1, num_args):
-        with open(sys.argv[idx], 'r') as tf:
-            # Readjust nonces if getting multiple files as input
-            for line in tf:
-                try:
-                    tx = json.loads(line)
-                    sender_id = tx["pubKey"]
-                    tx["nonce"] = new_nonce(sender_id)
-                    txs.append(tx)
-                except Exception as e:
-                    print("Failed to parse transaction {}: {}".format(line, e))
+    parser = argparse.ArgumentParser(description="Replay transaction traces against a Zilliqa network")
+    parser.add_argument("traces", nargs="+", help="path(s) to trace files")
+    parser.add_argument("--endpoint", action="append", default=None,
+            help="lookup to send to; repeat to spread senders over several (default {})".format(API_ENDPOINT))
+    parser.add_argument("--phase", action="append", default=None,
+            help="only replay this phase of a merged trace (see tracefile.py); may be repeated")
+    parser.add_argument("--mode", choices=["process", "async"], default="process",
+            help="'process': one blocking client per worker process; 'async': pipelined asyncio submitter")
+    parser.add_argument("--procs", type=int, default=1, help="number of event-loop processes in async mode")
+    parser.add_argument("--in-flight", type=int, default=async_submit.MAX_IN_FLIGHT, help="max outstanding requests in async mode")
+    parser.add_argument("--batch-size", type=int, default=1, help="CreateTransaction calls per JSON-RPC batch in process mode")
+    parser.add_argument("--connections", type=int, default=async_submit.NUM_CONNECTIONS, help="keep-alive connections in async mode")
+    parser.add_argument("--workers", type=int, default=MAX_NUM_WORKERS, help="number of worker processes in process mode")
+    parser.add_argument("--stream", action="store_true",
+            help="start submitting while the trace is still being read, using bounded per-worker queues")
+    parser.add_argument("--queue-size", type=int, default=STREAM_QUEUE_SIZE, help="per-worker queue bound in streaming mode")
+    parser.add_argument("--rate", type=float, default=None,
+            help="open-loop mode: offer this many TPS on a fixed schedule, regardless of response times")
+    parser.add_argument("--arrivals", choices=["constant", "poisson"], default="constant", help="arrival process in open-loop mode")
+    parser.add_argument("--report-interval", type=float, default=loadgen.REPORT_INTERVAL, help="seconds between latency reports in open-loop mode")
+    parser.add_argument("--no-inclusion", action="store_true", help="do not track inclusion latency in open-loop mode")
+    parser.add_argument("--results", default=None, help="write per-transaction results (CSV) in open-loop mode")
+    parser.add_argument("--adaptive", action="store_true",
+            help="open-loop mode: start at --rate and adjust it (AIMD) to find the sustainable rate; see ratecontrol.py")
+    parser.add_argument("--max-rate", type=float, default=None, help="never offer more than this many TPS in adaptive mode")
+    parser.add_argument("--increase", type=float, default=ratecontrol.INCREASE, help="TPS added per uncongested window in adaptive mode")
+    parser.add_argument("--decrease", type=float, default=ratecontrol.DECREASE, help="factor the rate is cut by on congestion in adaptive mode")
+    parser.add_argument("--window", type=float, default=ratecontrol.WINDOW, help="seconds per control window in adaptive mode")
+    parser.add_argument("--control-log", default=None, help="write one CSV row per control window in adaptive mode")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve live Prometheus metrics on this port")
+    parser.add_argument("--journal", default=None,
+            help="record accepted transactions in this run journal and skip those it already holds")
+    args = parser.parse_args()
+    if args.stream and args.mode == "async" and args.procs > 1:
+        parser.error("--stream in async mode uses a single event loop; drop --procs")
+    if args.adaptive and args.rate is None:
+        parser.error("--adaptive needs a starting --rate")
 
-    # Send transactions
-    num_txs = len(txs)
-    print("Loaded {} transactions".format(num_txs))
-    # num_workers = min(math.ceil(num_txs / TARGET_BUCKET_SIZE), MAX_NUM_WORKERS)
-    num_workers = MAX_NUM_WORKERS
-    part = partition(txs, num_workers)
+    endpoints = args.endpoint or [API_ENDPOINT]
+    shared_metrics = None
+    if args.metrics_port is not None:
+        shared_metrics = metrics.Metrics(endpoints, max(args.workers, args.procs) + 1)
+        metrics.serve(shared_metrics, args.metrics_port)
+        # The parent sends itself in open-loop and single-process async mode
+        metrics.attach(shared_metrics)
+
+    skipped = [0]
+    journal = None
+    if args.journal is not None:
+        journal = get_journal(args.journal)
+        accepted = journal.accepted()
+        if GET_CHAIN_NONCE:
+            journal_bases.update((sender, first) for sender, _, first, _, _ in journal.nonce_state())
+        print("Journal {} holds {} accepted transactions".format(args.journal, len(accepted)))
+
+    # Readjust nonces if getting multiple files as input
+    tx_iter = iter_trace(args.traces, new_nonce, args.phase)
+    if journal is not None:
+        tx_iter = skip_journalled(tx_iter, accepted, skipped)
 
+    if args.rate is not None:
+        # Open loop consumes the trace lazily, so it never needs to load it fully
+        on_result = on_confirm = None
+        if journal is not None:
+            on_result = recorder(args.journal, "replay")
+            on_confirm = journal.confirmed
+        controller = None
+        if args.adaptive:
+            controller = ratecontrol.AIMDController(args.rate, args.max_rate, increase=args.increase,
+                    decrease=args.decrease, window=args.window, log_file=args.control_log)
+        loadgen.run_open_loop(tx_iter, endpoints, args.rate, args.arrivals, args.report_interval,
+                track_inclusion=not args.no_inclusion, on_result=on_result, num_connections=args.connections,
+                results_file=args.results, on_confirm=on_confirm, controller=controller)
+        if journal is not None:
+            journal.close()
+            print("Skipped {} transactions already in the journal".format(skipped[0]))
+        sys.exit(0)
+
+    if not args.stream:
+        txs = list(tx_iter)
+        num_txs = len(txs)
+        print("Loaded {} transactions".format(num_txs))
+
+    # Send transactions
     start = datetime.datetime.now()
-    with ProcessPoolExecutor(max_workers=num_workers) as pool:
-        all_tasks = [pool.submit(submit_chunk, part[chunk_id], chunk_id) for chunk_id in part.keys()]
-        for future in futures.as_completed(all_tasks):
-            pass
+    if args.stream and args.mode == "async":
+        stats = async_submit.submit_chunk_async(tx_iter, endpoints, args.in_flight, args.connections, journal_path=args.journal)
+        num_txs = stats["sent"] + stats["failed"]
+    elif args.stream:
+        num_txs = replay_stream(tx_iter, args.workers, args.batch_size, args.queue_size, args.journal, shared_metrics, endpoints)
+    elif args.mode == "async":
+        async_submit.replay_async(txs, endpoints, args.procs, args.in_flight, args.connections, args.journal, shared_metrics)
+    else:
+        # num_workers = min(math.ceil(num_txs / TARGET_BUCKET_SIZE), MAX_NUM_WORKERS)
+        num_workers = args.workers
+        part = partition(txs, num_workers)
+
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=metrics.attach, initargs=(shared_metrics,)) as pool:
+            all_tasks = [pool.submit(submit_chunk, part[chunk_id], chunk_id, args.batch_size, args.journal, endpoints) for chunk_id in part.keys()]
+            for future in futures.as_completed(all_tasks):
+                pass
 
     end = datetime.datetime.now()
     td = end - start
     print("Replayed {} transactions in {} => {:.2f} TPS".format(num_txs, td, num_txs/td.total_seconds()), file=sys.stderr)
+    if journal is not None:
+        print("Skipped {} transactions already in the journal".format(skipped[0]), file=sys.stderr)
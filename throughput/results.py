@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Per-transaction results of a run: when each transaction was submitted, which
+# shard the lookup dispatched it to, and in which epoch and micro-block it was
+# included. A micro-block index equal to the number of shards means the DS
+# committee processed the transaction instead of a shard.
+import csv
+import time
+from collections import Counter
+
+from histogram import Histogram, format_summary
+from tracker import norm_hash
+
+COLUMNS = ["txn_id", "submitted", "dispatch_shard", "num_shards", "epoch", "shard", "ds", "confirmed", "latency"]
+
+class TxnResult:
+    __slots__ = COLUMNS
+
+    def __init__(self, txn_id, submitted, dispatch_shard=None, num_shards=None):
+        self.txn_id = txn_id
+        self.submitted = submitted
+        self.dispatch_shard = dispatch_shard
+        self.num_shards = num_shards
+        self.epoch = None
+        self.shard = None
+        self.ds = None
+        self.confirmed = None
+        self.latency = None
+
+    def row(self):
+        return [getattr(self, c) for c in COLUMNS]
+
+class RunResults:
+    def __init__(self, num_shards=None):
+        self.num_shards = num_shards
+        self.txns = {}
+
+    def add_submission(self, txn_info, submitted=None):
+        if not txn_info:
+            return
+        txn_id = norm_hash(txn_info["TranID"])
+        num_shards = txn_info.get("num_shards", self.num_shards)
+        if num_shards is not None:
+            self.num_shards = num_shards
+        submitted = submitted or txn_info.get("submitted") or time.time()
+        self.txns[txn_id] = TxnResult(txn_id, submitted, txn_info.get("proc_shard"), num_shards)
+
+    # Signature matches ConfirmationTracker.on_confirm
+    def confirmed(self, txn_id, submitted, block, mb_index, now):
+        r = self.txns.get(txn_id)
+        if r is None:
+            return
+        r.epoch = block
+        r.shard = mb_index
+        r.confirmed = now
+        r.latency = now - r.submitted
+        num_shards = r.num_shards if r.num_shards is not None else self.num_shards
+        if num_shards is not None:
+            r.ds = mb_index >= num_shards
+
+    def write_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(COLUMNS)
+            for r in self.txns.values():
+                w.writerow(r.row())
+
+    def shard_label(self, shard):
+        if shard is None:
+            return "-"
+        if self.num_shards is not None and shard >= self.num_shards:
+            return "DS"
+        return str(shard)
+
+    def summary(self):
+        confirmed = [r for r in self.txns.values() if r.confirmed is not None]
+        dispatched = Counter(self.shard_label(r.dispatch_shard) for r in self.txns.values())
+        per_shard = {label: [] for label in dispatched if label != "-"}
+        for r in confirmed:
+            per_shard.setdefault(self.shard_label(r.shard), []).append(r)
+
+        # TPS over the whole run: from the first submission to the last confirmation
+        start = min((r.submitted for r in self.txns.values()), default=None)
+        end = max((r.confirmed for r in confirmed), default=None)
+        duration = (end - start) if start is not None and end is not None and end > start else None
+
+        rows = {}
+        for label, rs in list(per_shard.items()) + [("all", confirmed)]:
+            h = Histogram()
+            for r in rs:
+                h.record(r.latency * 1e6)
+            rows[label] = {
+                "dispatched": dispatched.get(label, 0) if label != "all" else len(self.txns),
+                "confirmed": len(rs),
+                "tps": len(rs) / duration if duration else 0.0,
+                "latency": h,
+            }
+        return rows
+
+    def print_summary(self):
+        rows = self.summary()
+        print("{:>6} {:>10} {:>10} {:>10}  {}".format("shard", "dispatched", "confirmed", "TPS", "latency"), flush=True)
+        for label in sorted(rows, key=lambda l: (l == "all", l == "DS", int(l) if l.isdigit() else 0)):
+            row = rows[label]
+            print("{:>6} {:>10} {:>10} {:>10.2f}  {}".format(label, row["dispatched"], row["confirmed"], row["tps"],
+                format_summary(row["latency"])), flush=True)
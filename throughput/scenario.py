@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# Scenario engine: runs a JSON scenario that lists the contracts to deploy or
+# load, how many accounts to fund, and the phases to run on them, each a
+# weighted mix of workloads. Accounts are processed in batches and every
+# (phase, batch) is a step that starts as soon as its dependencies are
+# confirmed, so funding of the next batch overlaps with the current batch's
+# transactions. Finished steps and confirmed transactions are kept in the run
+# journal, so running the same scenario again after a crash picks up where it
+# stopped.
+#
+#   ./scenario.py scenarios/registry.json
+import argparse
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+from pyzil.contract import Contract
+from pyzil.zilliqa.api import ZilliqaAPI
+
+import fund
+import funding
+import workloads
+from sharding import Locality, group_by_shard, balanced_senders, get_num_shards, locality_report
+from results import RunResults
+from tracker import ConfirmationTracker, norm_hash
+
+DEFAULT_SCENARIO = "scenarios/registry.json"
+# Steps submitting or waiting for confirmation at the same time
+STEP_THREADS = 4
+POLL_SLEEP = 2
+
+def load_scenario(path):
+    with open(path) as f:
+        sc = json.load(f)
+    sc.setdefault("accounts", fund.NUM_ACCOUNTS)
+    sc.setdefault("batch", fund.ACC_BATCH_SIZE)
+    sc.setdefault("workers", 8)
+    sc.setdefault("contracts", {})
+    sc.setdefault("fund", None)
+    sc.setdefault("phases", [])
+    sc.setdefault("seed", 0)
+    for phase in sc["phases"]:
+        if "workload" in phase:
+            phase["mix"] = [{"workload": phase["workload"], "contract": phase.get("contract"),
+                "amount": phase.get("amount"), "weight": 1}]
+        phase.setdefault("after", [])
+        phase.setdefault("txs_per_account", 1)
+        for entry in phase["mix"]:
+            if entry["workload"] not in workloads.WORKLOADS:
+                raise ValueError("unknown workload {} in phase {}".format(entry["workload"], phase["name"]))
+            entry.setdefault("weight", 1)
+    return sc
+
+def init_value(v):
+    # "$genesis" in an init parameter stands for the genesis address
+    return fund.genesis.address0x if v == "$genesis" else v
+
+def amount_gen(spec, rng):
+    # A number, or {"uniform": [lo, hi]} for a random integer per transaction
+    if isinstance(spec, dict) and "uniform" in spec:
+        lo, hi = spec["uniform"]
+        return lambda: rng.randint(lo, hi)
+    return lambda: spec
+
+def phase_items(phase, batch, contracts, rng, num_shards):
+    entries = phase["mix"]
+    weights = [e["weight"] for e in entries]
+    amounts = [amount_gen(e.get("amount"), rng) for e in entries]
+    n = len(batch) * phase["txs_per_account"]
+    locality = None
+    if phase.get("intra_shard") is not None:
+        # Senders balanced over shards; recipients picked for the wanted locality
+        senders_by_shard = balanced_senders(group_by_shard(batch, num_shards), n)
+        locality = Locality(batch, num_shards, phase["intra_shard"], rng)
+    items = []
+    for i in range(n):
+        k = rng.choices(range(len(entries)), weights)[0] if len(entries) > 1 else 0
+        e = entries[k]
+        builder, senders = workloads.WORKLOADS[e["workload"]]
+        acc = batch[i % len(batch)]
+        if senders == "genesis":
+            src, dest = fund.genesis, acc
+        elif senders == "self":
+            src, dest = acc, None
+        elif locality:
+            src = senders_by_shard[i]
+            dest = locality.pick(src)
+        else:
+            src, dest = acc, rng.choice(batch)
+        contract = contracts[e["contract"]].address if e.get("contract") else None
+        items.append((src, dest, builder, contract, amounts[k]()))
+    if locality:
+        locality_report([(src, dest) for src, dest, *_ in items], num_shards)
+    return items
+
+class Confirmations:
+    # One tracker for the whole run, followed by a background thread; steps
+    # block until their own transactions are confirmed or time out
+    def __init__(self, start_block):
+        self.api = ZilliqaAPI(fund.API_ENDPOINT)
+        self.tracker = ConfirmationTracker(start_block=start_block)
+        self.results = RunResults()
+        self.tracker.on_confirm(self.results.confirmed)
+        if fund.get_journal() is not None:
+            self.tracker.on_confirm(fund.get_journal().confirmed)
+        self.cond = threading.Condition()
+        self.latest = start_block
+        self.stopped = False
+        self.thread = threading.Thread(target=self.follow, daemon=True)
+        self.thread.start()
+
+    def follow(self):
+        while not self.stopped:
+            try:
+                latest = self.tracker.latest_block(self.api)
+                while self.tracker.next_block <= latest:
+                    hash_lists = self.tracker.fetch_block(self.api, self.tracker.next_block)
+                    with self.cond:
+                        self.tracker.process_block(self.tracker.next_block, hash_lists)
+                        self.tracker.next_block += 1
+                with self.cond:
+                    self.latest = latest
+                    self.cond.notify_all()
+            except Exception as e:
+                print("Block follower error: {}".format(e), flush=True)
+            time.sleep(POLL_SLEEP)
+
+    def wait(self, txn_info_list):
+        ids = [norm_hash(t["TranID"]) for t in txn_info_list]
+        with self.cond:
+            for t in txn_info_list:
+                self.tracker.add(t["TranID"], t.get("submitted"))
+                self.results.add_submission(t)
+            cutoff = self.latest + fund.WAIT_BLOCKS
+            deadline = time.time() + fund.TX_TIMEOUT
+            last_done = 0
+            while True:
+                done = sum(1 for i in ids if i in self.tracker.confirmed)
+                if done == len(ids) or self.latest > cutoff or time.time() > deadline:
+                    return done
+                # Push the cut-off out while blocks keep confirming our transactions
+                if done > last_done:
+                    cutoff = self.latest + fund.WAIT_BLOCKS
+                    last_done = done
+                self.cond.wait(POLL_SLEEP)
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
+
+class Step:
+    def __init__(self, name, deps, run):
+        self.name = name
+        self.deps = deps
+        self.run = run
+
+class Engine:
+    def __init__(self, sc):
+        self.sc = sc
+        self.contracts = {}
+        self.workers = sc["workers"]
+        # Journal entries are namespaced by scenario, so a changed scenario starts afresh
+        self.run_id = hashlib.sha1(json.dumps(sc, sort_keys=True).encode()).hexdigest()[:12]
+
+    def deploy(self, name, spec):
+        init = [Contract.value_dict(p["vname"], p["type"], init_value(p["value"])) for p in spec.get("init", [])]
+        self.contracts[name] = fund.deploy_contract(fund.genesis, spec["file"], init)
+
+    def fund_tree(self, accs, spec):
+        token = spec.get("token")
+        funding.fund_tree(accs, spec.get("zils", fund.ACC_MIN_BALANCE), spec.get("tokens", 0),
+            self.contracts[token].address if token else None, spec.get("fanout", funding.FANOUT), self.workers)
+
+    def journal_name(self, step):
+        return "{}/{}".format(self.run_id, step)
+
+    def send(self, items, step):
+        phase = self.journal_name(step)
+        todo = fund.tag_items(items, phase)
+        txn_info_list = fund.send_items(todo, self.workers, phase)
+        confirmed = self.confirmations.wait(txn_info_list)
+        return confirmed + len(items) - len(todo), len(items)
+
+    def steps(self, batches):
+        steps = []
+        for name, spec in self.sc["contracts"].items():
+            if "address" in spec:
+                self.contracts[name] = Contract.load_from_address(spec["address"], load_state=False)
+            else:
+                steps.append(Step("deploy:" + name, [], lambda name=name, spec=spec: self.deploy(name, spec)))
+
+        tree = isinstance(self.sc["fund"], dict)
+        if tree:
+            # Fund every account up front as a tree, then start all batches
+            spec = self.sc["fund"]
+            token = spec.get("token")
+            deps = ["deploy:" + token] if token and "address" not in self.sc["contracts"][token] else []
+            accs = [acc for batch in batches for acc in batch]
+            steps.append(Step("fund", deps, lambda: self.fund_tree(accs, spec)))
+
+        for i, batch in enumerate(batches):
+            fund_deps = ["fund"] if tree else []
+            if self.sc["fund"] is not None and not tree:
+                zils = self.sc["fund"]
+                # Funding goes batch by batch, independent of the phases
+                deps = ["fund:{}".format(i - 1)] if i > 0 else []
+                steps.append(Step("fund:{}".format(i), deps,
+                    lambda i=i, batch=batch, zils=zils: self.send([(fund.genesis, acc, None, None, zils) for acc in batch], "fund:{}".format(i))))
+                fund_deps = ["fund:{}".format(i)]
+            for phase in self.sc["phases"]:
+                deps = list(fund_deps)
+                deps += ["deploy:" + e["contract"] for e in phase["mix"]
+                        if e.get("contract") and "address" not in self.sc["contracts"][e["contract"]]]
+                deps += ["{}:{}".format(p, i) for p in phase["after"]]
+                # Each step draws from its own generator, so runs repeat whatever order steps start in
+                rng = random.Random("{}:{}:{}".format(self.sc["seed"], phase["name"], i))
+                name = "{}:{}".format(phase["name"], i)
+                steps.append(Step(name, deps,
+                    lambda name=name, phase=phase, batch=batch, rng=rng: self.send(phase_items(phase, batch, self.contracts, rng, self.num_shards), name)))
+        return steps
+
+    def run(self):
+        fund.prepare_accounts(self.sc["accounts"])
+        accs = [fund.gen_account() for _ in range(self.sc["accounts"])]
+        size = self.sc["batch"]
+        batches = [accs[i:i + size] for i in range(0, len(accs), size)]
+
+        # Start the pool and the block follower before anything is sent
+        fund.get_pool(self.workers)
+        self.num_shards = self.sc.get("shards") or get_num_shards(fund.api)
+        self.confirmations = Confirmations(int(fund.api.GetBlockchainInfo()["NumTxBlocks"]) - 1)
+
+        steps = self.steps(batches)
+        done, failed, running = set(), set(), {}
+        journal = fund.get_journal()
+        if journal is not None:
+            finished = journal.done_steps()
+            for s in list(steps):
+                if self.journal_name(s.name) not in finished:
+                    continue
+                if s.name.startswith("deploy:"):
+                    # Use the contract deployed by the earlier run
+                    address = finished[self.journal_name(s.name)]
+                    self.contracts[s.name[len("deploy:"):]] = Contract.load_from_address(address, load_state=False)
+                print("Skipping {}: done in an earlier run".format(s.name), flush=True)
+                done.add(s.name)
+                steps.remove(s)
+        start = datetime.datetime.now()
+        with ThreadPoolExecutor(max_workers=STEP_THREADS) as ex:
+            while steps or running:
+                for s in list(steps):
+                    if any(d in failed for d in s.deps):
+                        print("Skipping {}: a dependency failed".format(s.name), flush=True)
+                        failed.add(s.name)
+                        steps.remove(s)
+                    elif all(d in done for d in s.deps):
+                        print("Starting {}".format(s.name), flush=True)
+                        running[ex.submit(s.run)] = (s, time.time())
+                        steps.remove(s)
+                if not running:
+                    break
+                finished, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for f in finished:
+                    s, t = running.pop(f)
+                    try:
+                        r = f.result()
+                    except Exception as e:
+                        print("Step {} failed: {}".format(s.name, e), flush=True)
+                        failed.add(s.name)
+                        continue
+                    if r is not None:
+                        print("Step {}: confirmed {}/{} in {:.1f}s".format(s.name, r[0], r[1], time.time() - t), flush=True)
+                    done.add(s.name)
+                    if journal is not None and (r is None or r[0] == r[1]):
+                        value = self.contracts[s.name[len("deploy:"):]].address if s.name.startswith("deploy:") else None
+                        journal.step_done(self.journal_name(s.name), value)
+
+        self.confirmations.stop()
+        fund.shutdown_pool()
+        if journal is not None:
+            journal.flush()
+        if fund.run_trace_dir is not None:
+            print("Traced sent transactions to {0}; merge with ./tracefile.py merge {0} -o run.trace.gz".format(fund.run_trace_dir), flush=True)
+        res = self.confirmations.results
+        res.write_csv(fund.RESULTS_FILE)
+        res.print_summary()
+        print("Scenario finished in {}: {} steps done, {} failed".format(datetime.datetime.now() - start, len(done), len(failed)), flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a throughput scenario")
+    parser.add_argument("scenario", nargs="?", default=DEFAULT_SCENARIO)
+    args = parser.parse_args()
+    Engine(load_scenario(args.scenario)).run()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Shard-aware sender/recipient selection. A transaction's home shard is the
+# sender's shard, computed as in the node (Transaction::GetShardIndex): the last
+# four bytes of the address as a big-endian integer, modulo the number of shards.
+# Maps are built for a target fraction of intra-shard transactions, with senders
+# spread evenly over the shards, so throughput can be measured against locality.
+import random
+from collections import Counter
+
+def shard_of(address, num_shards):
+    address = address.lower()
+    if address.startswith("0x"):
+        address = address[2:]
+    return int(address[-8:], 16) % num_shards
+
+def get_num_shards(api):
+    return len(api.GetBlockchainInfo()["ShardingStructure"]["NumPeers"])
+
+def group_by_shard(accs, num_shards):
+    groups = {s: [] for s in range(num_shards)}
+    for acc in accs:
+        groups[shard_of(acc.address, num_shards)].append(acc)
+    return groups
+
+def interleave(groups):
+    # Round-robin over shards so that consecutive senders land in different shards
+    lists = [g for g in groups.values() if g]
+    out = []
+    for i in range(max((len(g) for g in lists), default=0)):
+        out.extend(g[i] for g in lists if i < len(g))
+    return out
+
+def balanced_senders(groups, n):
+    # n senders taking the shards in turn, and the accounts within a shard in
+    # turn, so every shard carries the same load however many accounts it has
+    shards = [s for s in groups if groups[s]]
+    out = []
+    for i in range(n):
+        group = groups[shards[i % len(shards)]]
+        out.append(group[(i // len(shards)) % len(group)])
+    return out
+
+def locality_txn_map(from_accounts, to_accounts, num_shards, intra_fraction, rng=random):
+    # Like get_txn_map (every to_account receives exactly once), but the
+    # recipient of each transaction is drawn from the sender's shard for
+    # intra_fraction of the transactions and from another shard otherwise
+    senders = group_by_shard(rng.sample(from_accounts, len(from_accounts)), num_shards)
+    receivers = group_by_shard(rng.sample(to_accounts, len(to_accounts)), num_shards)
+    n = len(to_accounts)
+    intra = [True] * round(intra_fraction * n) + [False] * (n - round(intra_fraction * n))
+    rng.shuffle(intra)
+
+    dests = {id(src): [] for g in senders.values() for src in g}
+    for src, want_intra in zip(balanced_senders(senders, n), intra):
+        src_shard = shard_of(src.address, num_shards)
+        if want_intra:
+            candidates = [src_shard]
+        else:
+            # The fullest other shard, which keeps recipients balanced across shards
+            candidates = sorted((s for s in receivers if s != src_shard), key=lambda s: -len(receivers[s]))
+        shard = next((s for s in candidates if receivers[s]), None)
+        if shard is None:
+            # Nothing left of the wanted kind; take whatever remains
+            shard = max(receivers, key=lambda s: len(receivers[s]))
+        dests[id(src)].append(receivers[shard].pop())
+    return [(src, dests[id(src)]) for src in interleave(senders) if dests[id(src)]]
+
+class Locality:
+    # Recipient picker for workloads where accounts may receive more than once
+    def __init__(self, accs, num_shards, intra_fraction, rng=random):
+        self.num_shards = num_shards
+        self.intra_fraction = intra_fraction
+        self.rng = rng
+        self.groups = {s: g for s, g in group_by_shard(accs, num_shards).items() if g}
+
+    def pick(self, src):
+        src_shard = shard_of(src.address, self.num_shards)
+        others = [s for s in self.groups if s != src_shard]
+        if src_shard in self.groups and (self.rng.random() < self.intra_fraction or not others):
+            return self.rng.choice(self.groups[src_shard])
+        return self.rng.choice(self.groups[self.rng.choice(others)])
+
+def locality_report(pairs, num_shards):
+    # pairs: (sender, recipient); recipients of None are not counted as either
+    per_shard = Counter()
+    intra = cross = 0
+    for src, dest in pairs:
+        s = shard_of(src.address, num_shards)
+        per_shard[s] += 1
+        if dest is None:
+            continue
+        if shard_of(dest.address, num_shards) == s:
+            intra += 1
+        else:
+            cross += 1
+    total = intra + cross
+    print("Locality: {} intra-shard, {} cross-shard ({:.1f}% intra); per shard: {}".format(
+        intra, cross, 100.0 * intra / total if total else 0.0,
+        ", ".join("{}={}".format(s, per_shard[s]) for s in range(num_shards))), flush=True)
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# Local stand-in for a sharded Zilliqa network, answering the JSON-RPC calls the
+# throughput tools make, so the load generators can be tested and their own
+# ceiling measured without building and running a network. Transactions are
+# assigned to shards as in the node (the sender's shard; contract calls go to
+# the contract's shard when it is the sender's, to the DS committee otherwise,
+# unless CoSplit's _sharding_input lists the transition called), queued per shard, and every epoch each shard takes up to its capacity in
+# nonce order. Signatures are not checked.
+#
+# The server is one asyncio event loop with a minimal keep-alive HTTP/1.1
+# parser and JSON-RPC batch support, so the client saturates before it does.
+#
+#   ./simulator.py --shards 3 --epoch-time 5 --capacity 2000
+#   ./simulator.py --latency 20 --jitter 10 --error-rate 0.01
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import deque
+
+from txparams import txn_hash
+
+PORT = 4201
+NUM_SHARDS = 3
+EPOCH_TIME = 5.0
+# Transactions per shard micro-block, and for the DS micro-block
+SHARD_CAPACITY = 2000
+DS_CAPACITY = 2000
+TX_BLOCKS_PER_DS_BLOCK = 100
+PEERS_PER_SHARD = 10
+GENESIS_BALANCE = 10 ** 12
+MIN_GAS_PRICE = "100"
+DEPLOY_ADDRESS = "0" * 40
+CONFIG_FILE = "config.json"
+
+def norm_address(address):
+    address = address.lower()
+    return address[2:] if address.startswith("0x") else address
+
+def address_of(pubkey):
+    return hashlib.sha256(bytes.fromhex(norm_address(pubkey))).hexdigest()[24:]
+
+def shard_of(address, num_shards):
+    return int(address[-8:], 16) % num_shards
+
+def contract_address(sender, nonce):
+    # As in the node: SHA-256 of the sender address and its nonce before the deployment
+    return hashlib.sha256(bytes.fromhex(sender) + (nonce - 1).to_bytes(8, 'big')).hexdigest()[24:]
+
+class RPCError(Exception):
+    pass
+
+class Txn:
+    __slots__ = ("id", "params", "sender", "nonce", "to", "queue", "status", "block", "success", "contract")
+
+class Chain:
+    def __init__(self, num_shards=NUM_SHARDS, capacity=SHARD_CAPACITY, ds_capacity=DS_CAPACITY,
+                 default_balance=0, error_rate=0.0, seed=None):
+        self.num_shards = num_shards
+        self.capacity = capacity
+        self.ds_capacity = ds_capacity
+        self.default_balance = default_balance
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        # address -> [balance in Qa, nonce]
+        self.accounts = {}
+        # address -> {"code", "init", "state"}
+        self.contracts = {}
+        self.txns = {}
+        # One queue per shard, then the DS committee
+        self.queues = [deque() for _ in range(num_shards + 1)]
+        # Hash lists of every TxBlock, shards first and DS last; block 0 is genesis
+        self.blocks = [None]
+        self.block_times = [time.time()]
+        self.num_txns = 0
+        self.pubkeys = {}
+
+    def fund(self, address, qa):
+        self.accounts[norm_address(address)] = [int(qa), 0]
+
+    def account(self, address):
+        acc = self.accounts.get(address)
+        if acc is None and self.default_balance:
+            acc = self.accounts[address] = [self.default_balance, 0]
+        return acc
+
+    def sender_of(self, pubkey):
+        address = self.pubkeys.get(pubkey)
+        if address is None:
+            address = self.pubkeys[pubkey] = address_of(pubkey)
+        return address
+
+    # Lookup side: checks made before a transaction is accepted
+
+    def create_transaction(self, params):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise RPCError("Injected error")
+        try:
+            sender = self.sender_of(params["pubKey"])
+            nonce = int(params["nonce"])
+            to = norm_address(params["toAddr"])
+            cost = int(params["amount"]) + int(params["gasPrice"]) * int(params["gasLimit"])
+            # The node's TranID, so clients can work it out before they hear back
+            txn_id = txn_hash(params)
+        except (KeyError, ValueError, TypeError) as e:
+            raise RPCError("Invalid transaction: {}".format(e))
+        acc = self.account(sender)
+        if acc is None:
+            raise RPCError("The sender of the txn has no balance")
+        if nonce <= acc[1]:
+            raise RPCError("Nonce ({}) lower than current ({})".format(nonce, acc[1]))
+        if cost > acc[0]:
+            raise RPCError("Insufficient balance")
+        if txn_id in self.txns:
+            raise RPCError("Txn already present")
+
+        t = Txn()
+        t.id = txn_id
+        t.params = params
+        t.sender = sender
+        t.nonce = nonce
+        t.to = to
+        t.status = "pending"
+        t.block = None
+        t.success = None
+        t.contract = None
+        shard = shard_of(sender, self.num_shards)
+        info = {"TranID": txn_id, "num_shards": self.num_shards}
+        if to == DEPLOY_ADDRESS:
+            t.contract = contract_address(sender, nonce)
+            t.queue = self.num_shards
+            info["Info"] = "Contract Creation txn, sent to shard"
+            info["ContractAddress"] = t.contract
+        elif to in self.contracts:
+            local = shard_of(to, self.num_shards) == shard or self.sharded_call(to, params)
+            t.queue = shard if local else self.num_shards
+            info["Info"] = "Contract Txn, Sent To Ds" if t.queue == self.num_shards else "Contract Txn, Shards Match of the sender and receiver"
+        else:
+            t.queue = shard
+            info["Info"] = "Non-contract txn, sent to shard"
+        info["proc_shard"] = t.queue
+        self.txns[txn_id] = t
+        self.queues[t.queue].append(t)
+        return info
+
+    def sharded_call(self, address, params):
+        # CoSplit: the transitions in the contract's _sharding_input run in the sender's shard
+        try:
+            tag = json.loads(params.get("data") or "{}").get("_tag")
+        except (ValueError, AttributeError):
+            return False
+        return tag in self.contracts[address]["sharded"]
+
+    # Epoch side: every shard takes up to its capacity, in nonce order per sender
+
+    def next_block(self):
+        block = len(self.blocks)
+        hash_lists = []
+        for q, queue in enumerate(self.queues):
+            capacity = self.ds_capacity if q == self.num_shards else self.capacity
+            included = []
+            waiting = deque()
+            # One pass over the queue; a nonce gap keeps a transaction waiting for the next epoch
+            while queue and len(included) < capacity:
+                t = queue.popleft()
+                acc = self.account(t.sender)
+                if t.nonce <= acc[1]:
+                    t.status = "dropped"
+                elif t.nonce == acc[1] + 1:
+                    self.apply(t, acc, block)
+                    included.append(t.id)
+                else:
+                    waiting.append(t)
+            queue.extendleft(reversed(waiting))
+            hash_lists.append(included or None)
+        self.blocks.append(hash_lists)
+        self.block_times.append(time.time())
+        self.num_txns += sum(len(h) for h in hash_lists if h)
+        return block
+
+    def apply(self, t, acc, block):
+        p = t.params
+        amount = int(p["amount"])
+        acc[1] = t.nonce
+        acc[0] -= int(p["gasPrice"]) * int(p["gasLimit"])
+        t.status = "confirmed"
+        t.block = block
+        t.success = acc[0] >= amount
+        if not t.success:
+            return
+        acc[0] -= amount
+        if t.contract is not None:
+            init = json.loads(p.get("data") or "[]")
+            self.contracts[t.contract] = {"code": p.get("code", ""), "init": init, "state": initial_state(init),
+                "sharded": sharded_transitions(init)}
+            self.accounts.setdefault(t.contract, [0, 0])
+            return
+        self.accounts.setdefault(t.to, [0, 0])[0] += amount
+        contract = self.contracts.get(t.to)
+        if contract is not None and p.get("data"):
+            transition(contract["state"], "0x" + t.sender, json.loads(p["data"]))
+
+    def blockchain_info(self, epoch_time):
+        last = self.blocks[-1] or []
+        in_last = sum(len(h) for h in last if h)
+        return {
+            "CurrentDSEpoch": str(len(self.blocks) // TX_BLOCKS_PER_DS_BLOCK + 1),
+            "CurrentMiniEpoch": str(len(self.blocks)),
+            "NumDSBlocks": str(len(self.blocks) // TX_BLOCKS_PER_DS_BLOCK + 1),
+            "NumPeers": PEERS_PER_SHARD * (self.num_shards + 1),
+            "NumTransactions": str(self.num_txns),
+            "NumTxBlocks": str(len(self.blocks)),
+            "NumTxnsDSEpoch": str(self.num_txns),
+            "NumTxnsTxEpoch": str(in_last),
+            "ShardingStructure": {"NumPeers": [PEERS_PER_SHARD] * self.num_shards},
+            "TransactionRate": in_last / epoch_time,
+            "TxBlockRate": 1.0 / epoch_time,
+        }
+
+def initial_state(init):
+    # FungibleToken-style contracts start with the whole supply held by the owner
+    values = {v["vname"]: v["value"] for v in init if isinstance(v, dict) and "vname" in v}
+    state = {"_balance": "0"}
+    supply = values.get("init_supply", values.get("total_tokens"))
+    if supply is not None:
+        owner = values.get("contract_owner", values.get("owner", "")).lower()
+        state["balances"] = {owner: supply}
+    return state
+
+def sharded_transitions(init):
+    # Transitions named in a CoSplit deployment's _sharding_input
+    for v in init:
+        if isinstance(v, dict) and v.get("vname") == "_sharding_input":
+            try:
+                return set(json.loads(v["value"]).get("transitions", []))
+            except ValueError:
+                return set()
+    return set()
+
+def transition(state, sender, data):
+    # Token transfers move balances; every other transition succeeds without effect
+    params = {p["vname"]: p["value"] for p in data.get("params", [])}
+    balances = state.get("balances")
+    if balances is None or data.get("_tag") not in ("Transfer", "TransferFrom"):
+        return
+    src = params.get("from", sender).lower()
+    to = params["to"].lower()
+    tokens = int(params.get("tokens", params.get("amount", 0)))
+    if int(balances.get(src, 0)) >= tokens:
+        balances[src] = str(int(balances.get(src, 0)) - tokens)
+        balances[to] = str(int(balances.get(to, 0)) + tokens)
+
+class Simulator:
+    def __init__(self, chain, epoch_time=EPOCH_TIME, latency=0.0, jitter=0.0):
+        self.chain = chain
+        self.epoch_time = epoch_time
+        self.latency = latency
+        self.jitter = jitter
+        self.methods = {
+            "CreateTransaction": self.create_transaction,
+            "GetBalance": self.get_balance,
+            "GetBlockchainInfo": lambda: self.chain.blockchain_info(self.epoch_time),
+            "GetContractAddressFromTransactionID": self.get_contract_address,
+            "GetCurrentDSEpoch": lambda: str(len(self.chain.blocks) // TX_BLOCKS_PER_DS_BLOCK + 1),
+            "GetCurrentMiniEpoch": lambda: str(len(self.chain.blocks)),
+            "GetLatestTxBlock": lambda: self.get_tx_block(len(self.chain.blocks) - 1),
+            "GetMinimumGasPrice": lambda: MIN_GAS_PRICE,
+            "GetNetworkId": lambda: "1",
+            "GetNumTxBlocks": lambda: str(len(self.chain.blocks)),
+            "GetPendingTxn": self.get_pending_txn,
+            "GetSmartContractCode": lambda address: {"code": self.contract(address)["code"]},
+            "GetSmartContractInit": lambda address: self.contract(address)["init"],
+            "GetSmartContractState": lambda address: self.contract(address)["state"],
+            "GetSmartContractSubState": self.get_sub_state,
+            "GetTransaction": self.get_transaction,
+            "GetTransactionsForTxBlock": self.get_transactions_for_tx_block,
+            "GetTxBlock": self.get_tx_block,
+        }
+
+    def create_transaction(self, params):
+        return self.chain.create_transaction(params)
+
+    def get_balance(self, address):
+        acc = self.chain.accounts.get(norm_address(address))
+        if acc is None:
+            raise RPCError("Account is not created")
+        return {"balance": str(acc[0]), "nonce": acc[1]}
+
+    def txn(self, txn_id):
+        t = self.chain.txns.get(norm_address(txn_id))
+        if t is None:
+            raise RPCError("Txn Hash not Present")
+        return t
+
+    def get_transaction(self, txn_id):
+        t = self.txn(txn_id)
+        if t.status != "confirmed":
+            raise RPCError("Txn Hash not Present")
+        p = t.params
+        return {"ID": t.id, "amount": str(p["amount"]), "gasLimit": str(p["gasLimit"]), "gasPrice": str(p["gasPrice"]),
+            "nonce": str(t.nonce), "senderPubKey": "0x" + norm_address(p["pubKey"]), "signature": p.get("signature", ""),
+            "toAddr": t.to, "version": str(p.get("version", "")), "data": p.get("data", ""), "code": p.get("code", ""),
+            "receipt": {"success": t.success, "cumulative_gas": str(p["gasLimit"]), "epoch_num": str(t.block)}}
+
+    def get_pending_txn(self, txn_id):
+        t = self.txn(txn_id)
+        if t.status == "confirmed":
+            return {"confirmed": True, "code": 0, "info": "Txn processed"}
+        if t.status == "dropped":
+            return {"confirmed": False, "code": 3, "info": "Nonce too low"}
+        acc = self.chain.account(t.sender)
+        if t.nonce > acc[1] + 1:
+            return {"confirmed": False, "code": 2, "info": "Nonce too high"}
+        return {"confirmed": False, "code": 1, "info": "Txn pending"}
+
+    def get_contract_address(self, txn_id):
+        t = self.txn(txn_id)
+        if t.contract is None:
+            raise RPCError("ID is not a contract txn")
+        return t.contract
+
+    def contract(self, address):
+        contract = self.chain.contracts.get(norm_address(address))
+        if contract is None:
+            raise RPCError("Address not contract address")
+        return contract
+
+    def get_sub_state(self, address, field, indices=None):
+        value = self.contract(address)["state"].get(field)
+        if value is None:
+            return None
+        for key in indices or []:
+            if not isinstance(value, dict) or key.lower() not in value:
+                return None
+            value = value[key.lower()]
+        for key in reversed(indices or []):
+            value = {key.lower(): value}
+        return {field: value}
+
+    def get_transactions_for_tx_block(self, block):
+        block = int(block)
+        if not 0 <= block < len(self.chain.blocks):
+            raise RPCError("TxBlock does not exist")
+        hash_lists = self.chain.blocks[block]
+        if not hash_lists or not any(hash_lists):
+            raise RPCError("TxBlock has no transactions")
+        return hash_lists
+
+    def get_tx_block(self, block):
+        block = int(block)
+        if not 0 <= block < len(self.chain.blocks):
+            raise RPCError("TxBlock does not exist")
+        hash_lists = self.chain.blocks[block] or []
+        return {
+            "header": {"BlockNum": str(block), "NumTxns": sum(len(h) for h in hash_lists if h),
+                "NumMicroBlocks": len(hash_lists), "Timestamp": str(int(self.chain.block_times[block] * 1e6))},
+            "body": {"MicroBlockInfos": [{"MicroBlockShardId": i, "MicroBlockTxnRootHash": ""}
+                for i in range(len(hash_lists))]},
+        }
+
+    def call(self, req):
+        if not isinstance(req, dict) or "method" not in req:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid request"}}
+        fn = self.methods.get(req["method"])
+        if fn is None:
+            return {"jsonrpc": "2.0", "id": req.get("id"), "error": {"code": -32601, "message": "METHOD_NOT_FOUND: The method being requested is not available on this server"}}
+        try:
+            return {"jsonrpc": "2.0", "id": req.get("id"), "result": fn(*req.get("params", []))}
+        except (RPCError, TypeError, ValueError) as e:
+            return {"jsonrpc": "2.0", "id": req.get("id"), "error": {"code": -8, "message": str(e)}}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                length = 0
+                keep_alive = True
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    name = name.strip().lower()
+                    if name == b"content-length":
+                        length = int(value)
+                    elif name == b"connection" and value.strip().lower() == b"close":
+                        keep_alive = False
+                body = await reader.readexactly(length)
+                if self.latency or self.jitter:
+                    await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)) / 1000.0)
+                try:
+                    req = json.loads(body)
+                    resp = [self.call(r) for r in req] if isinstance(req, list) else self.call(req)
+                except ValueError:
+                    resp = {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}}
+                out = json.dumps(resp).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: "
+                    + str(len(out)).encode() + b"\r\n\r\n" + out)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def epochs(self):
+        loop = asyncio.get_running_loop()
+        next_time = loop.time() + self.epoch_time
+        while True:
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+            next_time += self.epoch_time
+            block = self.chain.next_block()
+            sizes = [len(h or []) for h in self.chain.blocks[block]]
+            queued = sum(len(q) for q in self.chain.queues)
+            print("Block {}: {} txns, micro-blocks {}, {} queued".format(block, sum(sizes), sizes, queued), flush=True)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        print("Simulating {} shards on http://{}:{}, epoch {}s, capacity {}/shard, {} DS".format(
+            self.chain.num_shards, host or "localhost", port, self.epoch_time, self.chain.capacity, self.chain.ds_capacity), flush=True)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.epochs())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a sharded Zilliqa JSON-RPC endpoint")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--shards", type=int, default=NUM_SHARDS)
+    parser.add_argument("--epoch-time", type=float, default=EPOCH_TIME, help="seconds per TxBlock")
+    parser.add_argument("--capacity", type=int, default=SHARD_CAPACITY, help="transactions per shard micro-block")
+    parser.add_argument("--ds-capacity", type=int, default=DS_CAPACITY, help="transactions per DS micro-block")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean delay added to every request, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of that delay, in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of CreateTransaction calls rejected")
+    parser.add_argument("--default-balance", type=int, default=0,
+            help="Qa given to unknown senders, so traces of unfunded accounts can be replayed")
+    parser.add_argument("--genesis-balance", type=int, default=GENESIS_BALANCE, help="ZILs of the genesis account in {}".format(CONFIG_FILE))
+    parser.add_argument("--fund", action="append", default=[], metavar="ADDRESS:ZILS", help="more accounts to start with")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    chain = Chain(args.shards, args.capacity, args.ds_capacity, args.default_balance, args.error_rate, args.seed)
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE) as f:
+            chain.fund(json.load(f)["genesis"]["address"], args.genesis_balance * 10 ** 12)
+    for spec in args.fund:
+        address, zils = spec.split(":")
+        chain.fund(address, int(zils) * 10 ** 12)
+    try:
+        asyncio.run(Simulator(chain, args.epoch_time, args.latency, args.jitter).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
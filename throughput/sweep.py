@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# Throughput sweep: the with/without-CoSplit comparison as one command. For
+# every workload x deployment trace variant x shard count x offered rate, and
+# several trials of each, a run starts a fresh network (its own simulator.py),
+# replays the variant's deployment trace, then sends the workload open-loop at
+# the rate and records confirmed TPS and inclusion latency. Runs with their
+# own simulator are independent and go in parallel. The report gives the mean
+# TPS of every configuration and the speedup of each variant over the
+# baseline, with bootstrap confidence intervals.
+#
+# Workload traces are signed once per variant with presign.py, calling the
+# contract addresses the variant's deployment will have.
+#
+#   ./sweep.py sweeps/cosplit.json --parallel 4 --plot fig
+#   ./sweep.py sweeps/cosplit.json --endpoint http://localhost:4201 --reset ./restart.sh
+import argparse
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import requests
+
+import loadgen
+from keystore import get_keystore
+from presign import load_genesis
+from simulator import address_of, contract_address
+from tracefile import iter_trace, read_records
+
+DEFAULT_SWEEP = "sweeps/cosplit.json"
+REPORT_FILE = "sweep-report.json"
+RUN_DIR = "sweep"
+TRIALS = 3
+# Deployment transactions are few; they are sent slowly and waited for
+DEPLOY_RATE = 10
+REPORT_INTERVAL = 30.0
+START_TIMEOUT = 10.0
+BOOTSTRAP_SAMPLES = 10000
+CONFIDENCE = 0.95
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_sweep(path):
+    with open(path) as f:
+        sw = json.load(f)
+    sw.setdefault("baseline", next(iter(sw["variants"])))
+    sw.setdefault("shards", [3])
+    sw.setdefault("trials", TRIALS)
+    sw.setdefault("simulator", {})
+    sw.setdefault("seed", 0)
+    for name, w in sw["workloads"].items():
+        w.setdefault("workload", name)
+        w.setdefault("txs_per_account", 1)
+        w.setdefault("amount", 1)
+    if sw["baseline"] not in sw["variants"]:
+        raise ValueError("baseline {} is not one of the variants".format(sw["baseline"]))
+    return sw
+
+def renumber():
+    # Nonces from 1 per sender, as replay-trace.py numbers them on a fresh network
+    nonces = Counter()
+    def new_nonce(sender):
+        nonces[sender] += 1
+        return nonces[sender]
+    return new_nonce
+
+def deployed_contracts(deploy_trace):
+    # Contract name -> address, and sender address -> transactions sent, for a
+    # deployment trace replayed on a fresh network
+    contracts = {}
+    new_nonce = renumber()
+    sent = Counter()
+    for record in read_records(deploy_trace):
+        if "meta" in record:
+            continue
+        tx = record.get("tx", record)
+        sender = address_of(tx["pubKey"])
+        nonce = new_nonce(tx["pubKey"])
+        sent[sender] += 1
+        m = re.search(r"^\s*contract\s+(\w+)", tx.get("code", ""), re.M)
+        if m:
+            contracts[m.group(1)] = "0x" + contract_address(sender, nonce)
+    return contracts, sent
+
+def presign_command(w, contract, genesis_nonce, seed):
+    cmd = [sys.executable, os.path.join(HERE, "presign.py"), w["workload"], "--accounts", str(w["accounts"]),
+        "--txs-per-account", str(w["txs_per_account"]), "--amount", str(w["amount"]),
+        "--genesis-nonce", str(genesis_nonce), "--seed", str(seed)]
+    if contract is not None:
+        cmd += ["--contract", contract]
+    return cmd
+
+def workload_traces(sw, run_dir):
+    # (variant, workload) -> signed trace, generated unless already there
+    genesis = load_genesis().address
+    os.makedirs(os.path.join(run_dir, "traces"), exist_ok=True)
+    # presign.py signs with keystore accounts #1 onwards; generate any that are missing
+    get_keystore().extend_to(1 + max(w["accounts"] for w in sw["workloads"].values()))
+    traces = {}
+    for variant, deploy in sw["variants"].items():
+        contracts, sent = deployed_contracts(deploy)
+        for name, w in sw["workloads"].items():
+            contract = None
+            if w.get("contract") is not None:
+                if w["contract"] not in contracts:
+                    raise ValueError("{} does not deploy {}".format(deploy, w["contract"]))
+                contract = contracts[w["contract"]]
+            cmd = presign_command(w, contract, sent[genesis] + 1, sw["seed"])
+            key = hashlib.sha1(json.dumps(cmd[2:]).encode()).hexdigest()[:8]
+            out = os.path.join(run_dir, "traces", "{}.{}.{}.trace.gz".format(variant, name, key))
+            if not os.path.exists(out):
+                print("Signing {} for {}".format(name, variant), flush=True)
+                tmp = os.path.join(run_dir, "traces", "partial.trace.gz")
+                subprocess.run(cmd + ["-o", tmp], check=True)
+                os.rename(tmp, out)
+            traces[variant, name] = out
+    return traces
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+def simulator_args(options):
+    # {"epoch_time": 1} -> ["--epoch-time", "1"]
+    args = []
+    for k, v in options.items():
+        args += ["--" + k.replace("_", "-"), str(v)]
+    return args
+
+def wait_ready(endpoint, timeout=START_TIMEOUT):
+    deadline = time.time() + timeout
+    payload = {"jsonrpc": "2.0", "id": "1", "method": "GetBlockchainInfo", "params": []}
+    while True:
+        try:
+            info = requests.post(endpoint, json=payload, timeout=1).json()["result"]
+            return len(info["ShardingStructure"]["NumPeers"])
+        except Exception:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+def replay(trace, endpoint, rate, label, new_nonce=None):
+    gen = loadgen.OpenLoop(endpoint, rate, report_interval=REPORT_INTERVAL, label=label)
+    stats = asyncio.run(gen.run(iter_trace([trace], new_nonce)))
+    return stats, gen.results.summary()
+
+def run_key(run):
+    return (run["workload"], run["variant"], run["shards"], run["rate"], run["trial"])
+
+def run_one(run):
+    # One run, in a pool process; its output goes to the run's log file
+    with open(run["log"], 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        sim = None
+        endpoint = run["endpoint"]
+        if endpoint is None:
+            port = free_port()
+            sim = subprocess.Popen([sys.executable, os.path.join(HERE, "simulator.py"), "--port", str(port),
+                "--shards", str(run["shards"]), "--seed", str(run["trial"])] + simulator_args(run["simulator"]),
+                stdout=log, stderr=subprocess.STDOUT)
+            endpoint = "http://localhost:{}".format(port)
+        elif run["reset"]:
+            subprocess.run(run["reset"], shell=True, check=True, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_ready(endpoint)
+            replay(run["deploy"], endpoint, DEPLOY_RATE, "deploy", renumber())
+            start = time.time()
+            stats, rows = replay(run["trace"], endpoint, run["rate"], "measure")
+        finally:
+            if sim is not None:
+                sim.terminate()
+                sim.wait()
+    all_rows = rows["all"]
+    latency = all_rows["latency"]
+    p50, p99 = latency.percentile(50), latency.percentile(99)
+    return dict(run, seconds=round(time.time() - start, 1), sent=stats.sent, accepted=stats.accepted,
+        rejected=dict(stats.rejected), confirmed=all_rows["confirmed"], tps=all_rows["tps"],
+        latency_p50=None if p50 is None else p50 / 1e6, latency_p99=None if p99 is None else p99 / 1e6,
+        ds_fraction=rows["DS"]["confirmed"] / all_rows["confirmed"] if "DS" in rows and all_rows["confirmed"] else 0.0)
+
+def plan(sw, traces, run_dir, endpoint=None, reset=None):
+    # Against a real network the shard count is the one it has
+    runs = []
+    shard_counts = [wait_ready(endpoint)] if endpoint is not None else sw["shards"]
+    for trial in range(sw["trials"]):
+        for name in sw["workloads"]:
+            for variant, deploy in sw["variants"].items():
+                for shards in shard_counts:
+                    for rate in sw["rates"]:
+                        runs.append({"workload": name, "variant": variant, "shards": shards, "rate": rate, "trial": trial,
+                            "deploy": deploy, "trace": traces[variant, name], "simulator": sw["simulator"],
+                            "endpoint": endpoint, "reset": reset,
+                            "log": os.path.join(run_dir, "logs", "{}.{}.{}.{}.{}.log".format(
+                                name, variant, shards, rate, trial))})
+    return runs
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+def bootstrap(groups, stat, rng, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE):
+    # Percentile interval of stat over resamples (with replacement) of each group
+    values = sorted(stat(*[[rng.choice(g) for _ in g] for g in groups]) for _ in range(samples))
+    tail = (1 - confidence) / 2 * 100
+    return [percentile(values, tail), percentile(values, 100 - tail)]
+
+def mean(values):
+    return sum(values) / len(values)
+
+def ratio_of_means(a, b):
+    return mean(a) / mean(b) if mean(b) else float("nan")
+
+def aggregate(sw, runs, seed=0):
+    rng = random.Random(seed)
+    groups = {}
+    for r in runs:
+        groups.setdefault((r["workload"], r["variant"], r["shards"], r["rate"]), []).append(r)
+    configs = []
+    for (workload, variant, shards, rate), rs in sorted(groups.items()):
+        tps = [r["tps"] for r in rs]
+        p50 = [r["latency_p50"] for r in rs if r["latency_p50"] is not None]
+        configs.append({"workload": workload, "variant": variant, "shards": shards, "rate": rate, "trials": len(rs),
+            "tps": mean(tps), "tps_ci": bootstrap([tps], mean, rng),
+            "latency_p50": mean(p50) if p50 else None, "ds_fraction": mean([r["ds_fraction"] for r in rs])})
+
+    speedups = []
+    for c in configs:
+        if c["variant"] == sw["baseline"]:
+            continue
+        base = groups.get((c["workload"], sw["baseline"], c["shards"], c["rate"]))
+        if not base:
+            continue
+        tps = [r["tps"] for r in groups[c["workload"], c["variant"], c["shards"], c["rate"]]]
+        base_tps = [r["tps"] for r in base]
+        speedups.append({"workload": c["workload"], "variant": c["variant"], "baseline": sw["baseline"],
+            "shards": c["shards"], "rate": c["rate"], "speedup": ratio_of_means(tps, base_tps),
+            "ci": bootstrap([tps, base_tps], ratio_of_means, rng)})
+    return configs, speedups
+
+def print_report(configs, speedups):
+    print("{:<20} {:<18} {:>6} {:>8} {:>6} {:>10} {:>21} {:>8} {:>6}".format(
+        "workload", "variant", "shards", "rate", "trials", "TPS", "CI", "p50 (s)", "DS"))
+    for c in configs:
+        print("{:<20} {:<18} {:>6} {:>8} {:>6} {:>10.1f} {:>21} {:>8} {:>5.0f}%".format(
+            c["workload"], c["variant"], c["shards"], c["rate"], c["trials"], c["tps"],
+            "[{:.1f}, {:.1f}]".format(*c["tps_ci"]), "-" if c["latency_p50"] is None else "{:.2f}".format(c["latency_p50"]),
+            100 * c["ds_fraction"]))
+    print()
+    print("{:<20} {:<18} {:>6} {:>8} {:>8} {:>17}".format("workload", "speedup of", "shards", "rate", "speedup", "CI"))
+    for s in speedups:
+        print("{:<20} {:<18} {:>6} {:>8} {:>7.2f}x {:>17}".format(s["workload"], s["variant"], s["shards"], s["rate"],
+            s["speedup"], "[{:.2f}, {:.2f}]".format(*s["ci"])))
+
+def plot(configs, speedups, directory):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed; no plots")
+        return
+    os.makedirs(directory, exist_ok=True)
+    for workload in sorted({c["workload"] for c in configs}):
+        for rate in sorted({c["rate"] for c in configs}):
+            fig, (ax, ax2) = plt.subplots(1, 2, figsize=(10, 4))
+            for variant in sorted({c["variant"] for c in configs}):
+                cs = sorted((c for c in configs if c["workload"] == workload and c["rate"] == rate and c["variant"] == variant),
+                    key=lambda c: c["shards"])
+                if not cs:
+                    continue
+                x = [c["shards"] for c in cs]
+                ax.errorbar(x, [c["tps"] for c in cs], marker="o", label=variant, capsize=3,
+                    yerr=[[c["tps"] - c["tps_ci"][0] for c in cs], [c["tps_ci"][1] - c["tps"] for c in cs]])
+                ss = sorted((s for s in speedups if s["workload"] == workload and s["rate"] == rate and s["variant"] == variant),
+                    key=lambda s: s["shards"])
+                if ss:
+                    ax2.errorbar([s["shards"] for s in ss], [s["speedup"] for s in ss], marker="o", label=variant, capsize=3,
+                        yerr=[[s["speedup"] - s["ci"][0] for s in ss], [s["ci"][1] - s["speedup"] for s in ss]])
+            ax.set(xlabel="shards", ylabel="confirmed TPS", title="{} at {} TPS offered".format(workload, rate))
+            ax2.set(xlabel="shards", ylabel="speedup")
+            ax2.axhline(1, color="grey", linewidth=0.5)
+            ax.legend()
+            path = os.path.join(directory, "sweep-{}-{}.pdf".format(workload, rate))
+            fig.tight_layout()
+            fig.savefig(path)
+            plt.close(fig)
+            print("Wrote {}".format(path))
+
+def write_report(path, sw, runs):
+    configs, speedups = aggregate(sw, runs, sw["seed"])
+    with open(path + ".tmp", 'w') as f:
+        json.dump({"time": datetime.datetime.now().isoformat(), "sweep": sw, "runs": runs,
+            "configs": configs, "speedups": speedups}, f, indent=1)
+    os.replace(path + ".tmp", path)
+    return configs, speedups
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep throughput over workloads, CoSplit variants, shard counts and rates")
+    parser.add_argument("sweep", nargs="?", default=DEFAULT_SWEEP)
+    parser.add_argument("--parallel", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+            help="runs at a time, each with its own simulator")
+    parser.add_argument("--endpoint", default=None,
+            help="run against this network instead of simulators, one run at a time, with its shard count")
+    parser.add_argument("--reset", default=None, help="shell command that restarts the --endpoint network before every run")
+    parser.add_argument("--dir", default=RUN_DIR, help="directory for signed traces and run logs")
+    parser.add_argument("--report", default=REPORT_FILE)
+    parser.add_argument("--plot", default=None, help="write PDF plots to this directory (needs matplotlib)")
+    parser.add_argument("--fresh", action="store_true", help="ignore the runs already in the report")
+    args = parser.parse_args()
+
+    sw = load_sweep(args.sweep)
+    traces = workload_traces(sw, args.dir)
+    os.makedirs(os.path.join(args.dir, "logs"), exist_ok=True)
+    runs = plan(sw, traces, args.dir, args.endpoint, args.reset)
+
+    # Runs already in the report are kept, so an interrupted sweep resumes
+    done = []
+    if not args.fresh and os.path.exists(args.report):
+        with open(args.report) as f:
+            planned = {run_key(r) for r in runs}
+            done = [r for r in json.load(f)["runs"] if run_key(r) in planned]
+    finished = {run_key(r) for r in done}
+    todo = [r for r in runs if run_key(r) not in finished]
+    print("{} runs, {} already done".format(len(runs), len(runs) - len(todo)), flush=True)
+
+    start = datetime.datetime.now()
+    parallel = 1 if args.endpoint is not None else args.parallel
+    with ProcessPoolExecutor(max_workers=parallel) as pool:
+        pending = {pool.submit(run_one, r): r for r in todo}
+        for future in as_completed(pending):
+            r = pending[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print("Run {} failed: {} (see {})".format(run_key(r), e, r["log"]), flush=True)
+                continue
+            done.append(result)
+            write_report(args.report, sw, done)
+            print("[{}/{}] {} {} shards={} rate={} trial={}: {:.1f} TPS confirmed".format(len(done), len(runs),
+                result["workload"], result["variant"], result["shards"], result["rate"], result["trial"], result["tps"]), flush=True)
+
+    configs, speedups = write_report(args.report, sw, done)
+    print("Sweep took {}; report in {}".format(datetime.datetime.now() - start, args.report))
+    print_report(configs, speedups)
+    if args.plot is not None:
+        plot(configs, speedups, args.plot)
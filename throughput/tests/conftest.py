@@ -0,0 +1,8 @@
+# The throughput scripts import each other as top-level modules, the way they
+# are run from the throughput directory; make the tests see them the same way.
+#
+#   cd throughput && python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
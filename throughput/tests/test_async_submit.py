@@ -0,0 +1,131 @@
+# KeepAliveConnection against canned HTTP replies from a local asyncio server,
+# and submit_all's per-sender ordering against a server with random delays.
+import asyncio
+import json
+import random
+import time
+
+import pytest
+
+from async_submit import KeepAliveConnection, HTTPStatusError, submit_all
+
+async def exchange(replies, requests=1):
+    # Serves replies, one per request, on a single connection; returns the
+    # bodies post() returned and whether the connection was left open
+    async def handle(reader, writer):
+        for reply in replies:
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            writer.write(reply)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    conn = KeepAliveConnection('127.0.0.1', port, '/')
+    try:
+        bodies = [await conn.post(b'{}') for _ in range(requests)]
+        return bodies, conn.writer is not None
+    finally:
+        conn.close()
+        server.close()
+        await server.wait_closed()
+
+def run(replies, requests=1):
+    return asyncio.run(exchange(replies, requests))
+
+def test_content_length_keeps_connection():
+    reply = b'HTTP/1.1 200 OK\r\nContent-Length: 13\r\n\r\n{"result": 1}'
+    bodies, open_ = run([reply, reply], requests=2)
+    assert bodies == [b'{"result": 1}'] * 2
+    assert open_
+
+def test_chunked_body():
+    reply = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+             b'5\r\n{"res\r\n8;ext=1\r\nult": 1}\r\n0\r\n\r\n')
+    bodies, open_ = run([reply])
+    assert bodies == [b'{"result": 1}']
+    assert open_
+
+def test_body_until_close_without_length():
+    reply = b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{"result": 1}'
+    bodies, open_ = run([reply])
+    assert bodies == [b'{"result": 1}']
+    assert not open_
+
+def test_connection_close_header():
+    reply = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}'
+    assert run([reply]) == ([b'{}'], False)
+
+def test_http10_closes_unless_keep_alive():
+    assert run([b'HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\n{}']) == ([b'{}'], False)
+    assert run([b'HTTP/1.0 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\n{}']) == ([b'{}'], True)
+
+def test_error_status():
+    reply = b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 4\r\n\r\nbusy'
+    with pytest.raises(HTTPStatusError, match="503"):
+        run([reply])
+
+def test_closed_before_reply():
+    with pytest.raises(ConnectionResetError):
+        run([])
+
+async def replay(txs, max_in_flight, num_connections):
+    # A keep-alive JSON-RPC server that answers CreateTransaction after a random
+    # delay; returns (pubKey, nonce) in the order requests arrived
+    arrived = []
+    rng = random.Random(0)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                length = None
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        return
+                    if line == b'\r\n':
+                        break
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':')[1])
+                request = json.loads(await reader.readexactly(length))
+                tx = request["params"][0]
+                arrived.append((tx["pubKey"], tx["nonce"]))
+                await asyncio.sleep(rng.random() * 0.01)
+                body = json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": {"TranID": str(tx["nonce"])}}).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        stats = await submit_all(txs, "http://127.0.0.1:{}".format(port), max_in_flight, num_connections)
+    finally:
+        server.close()
+        await server.wait_closed()
+    return stats, arrived
+
+def test_submit_all_keeps_each_sender_in_nonce_order():
+    senders = ["02{:064x}".format(i) for i in range(4)]
+    txs = [{"pubKey": s, "nonce": n} for n in range(1, 31) for s in senders]
+    stats, arrived = asyncio.run(replay(txs, max_in_flight=16, num_connections=8))
+    assert stats == {"sent": len(txs), "failed": 0}
+    assert sorted(arrived) == sorted((tx["pubKey"], tx["nonce"]) for tx in txs)
+    for s in senders:
+        assert [n for p, n in arrived if p == s] == list(range(1, 31))
+
+def test_submit_all_runs_senders_concurrently():
+    # One transaction each from many senders: all of them can be in flight at once
+    txs = [{"pubKey": "02{:064x}".format(i), "nonce": 1} for i in range(64)]
+    start = time.time()
+    stats, arrived = asyncio.run(replay(txs, max_in_flight=64, num_connections=64))
+    assert stats["sent"] == 64
+    assert time.time() - start < 64 * 0.005
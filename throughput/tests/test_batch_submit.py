@@ -0,0 +1,135 @@
+# BatchZilliqaAPI against a local HTTP server with scripted replies: per-item
+# results and errors are mapped back to their calls, and calls whose outcome
+# is unknown are reported under the TranID the node would give them.
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from pyzil.account import Account
+from pyzil.zilliqa import chain
+from pyzil.zilliqa.api import APIError
+
+import batch_submit
+from batch_submit import BatchZilliqaAPI, BatchNotSupported, OutcomeUnknown
+from txparams import transfer_params, txn_hash
+
+class Node:
+    # Answers each POST with the next scripted reply; a reply is a status and
+    # either a body or a function of the request
+    def __init__(self):
+        self.replies = []
+        self.requests = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                node.requests.append(request)
+                status, body = node.replies.pop(0)
+                data = json.dumps(body(request) if callable(body) else body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reply(self, body, status=200):
+        self.replies.append((status, body))
+
+@pytest.fixture
+def node(monkeypatch):
+    monkeypatch.setattr(batch_submit, "RETRY_DELAY", 0)
+    n = Node()
+    yield n
+    n.server.shutdown()
+    n.server.server_close()
+
+def answer(results):
+    # results[i]: ("result", value), ("error", message) or None for no answer
+    def body(request):
+        out = []
+        for item in request:
+            r = results[int(item["id"])]
+            if r is None:
+                continue
+            kind, value = r
+            out.append({"jsonrpc": "2.0", "id": item["id"], kind: {"message": value} if kind == "error" else value})
+        # The order of replies in a batch is not the order of the calls
+        return out[::-1]
+    return body
+
+def test_results_and_errors_map_to_their_calls(node):
+    node.reply(answer([("result", "a"), ("error", "Nonce too high"), ("result", "c"), None]))
+    results = BatchZilliqaAPI(node.url).batch_call("GetBalance", ["x", "y", "z", "w"])
+    assert results[0] == ("a", None)
+    assert isinstance(results[1][1], APIError) and str(results[1][1]) == "Nonce too high"
+    assert results[2] == ("c", None)
+    assert isinstance(results[3][1], OutcomeUnknown)
+    assert [item["params"] for item in node.requests[0]] == [["x"], ["y"], ["z"], ["w"]]
+
+def test_list_params_are_passed_as_is(node):
+    node.reply(answer([("result", 1), ("result", 2)]))
+    BatchZilliqaAPI(node.url).batch_call("GetSmartContractSubState", [["a", "b", []], "c"])
+    assert [item["params"] for item in node.requests[0]] == [["a", "b", []], ["c"]]
+
+def test_client_error_means_no_batches(node):
+    node.reply({"error": "batch requests not allowed"}, status=400)
+    with pytest.raises(BatchNotSupported):
+        BatchZilliqaAPI(node.url).batch_call("GetBalance", ["x", "y"])
+
+def test_single_object_reply_means_no_batches(node):
+    node.reply({"jsonrpc": "2.0", "id": None, "error": {"message": "Invalid request"}})
+    with pytest.raises(BatchNotSupported):
+        BatchZilliqaAPI(node.url).batch_call("GetBalance", ["x", "y"])
+
+def test_server_error_is_retried(node):
+    node.reply({}, status=502)
+    node.reply(answer([("result", "a"), ("result", "b")]))
+    assert BatchZilliqaAPI(node.url).batch_call("GetBalance", ["x", "y"]) == [("a", None), ("b", None)]
+    assert len(node.requests) == 2
+
+def test_error_after_a_retry_is_of_unknown_outcome(node):
+    # The first attempt may have gone through; "already exists" can be about it
+    node.reply({}, status=503)
+    node.reply(answer([("error", "Txn already present"), ("result", "b")]))
+    results = BatchZilliqaAPI(node.url).batch_call("CreateTransaction", ["x", "y"])
+    assert isinstance(results[0][1], OutcomeUnknown)
+    assert results[1] == ("b", None)
+
+def test_server_errors_exhaust_retries(node):
+    for _ in range(batch_submit.BATCH_RETRIES + 1):
+        node.reply({}, status=500)
+    with pytest.raises(Exception):
+        BatchZilliqaAPI(node.url).batch_call("GetBalance", ["x", "y"])
+    assert len(node.requests) == batch_submit.BATCH_RETRIES + 1
+
+@pytest.fixture
+def signed():
+    chain.set_active_chain(chain.BlockChain("http://localhost", version=1, network_id=0))
+    acc = Account.generate()
+    return [transfer_params(acc, Account.generate().address, 1, nonce, gas_price=100) for nonce in range(1, 4)]
+
+def test_create_transactions(node, signed):
+    node.reply(answer([("result", {"TranID": "t1"}), ("error", "Insufficient balance"), None]))
+    out = list(BatchZilliqaAPI(node.url).create_transactions(signed))
+    assert [params for params, _, _ in out] == signed
+    assert out[0][1:] == ({"TranID": "t1"}, None)
+    # Rejected: the nonce may be handed out again
+    assert out[1][1] is None and isinstance(out[1][2], APIError)
+    # Unknown: reported as sent, under its hash
+    assert out[2][2] is None
+    assert out[2][1]["unknown"] and out[2][1]["TranID"] == txn_hash(signed[2])
+
+def test_failed_batch_is_of_unknown_outcome(node, signed):
+    for _ in range(batch_submit.BATCH_RETRIES + 1):
+        node.reply({}, status=500)
+    out = list(BatchZilliqaAPI(node.url).create_transactions(signed))
+    assert [(info["TranID"], error) for _, info, error in out] == [(txn_hash(p), None) for p in signed]
@@ -0,0 +1,142 @@
+# NonceAllocator: shared counters and reused rejected nonces, within one
+# process and across forked workers.
+import multiprocessing
+
+import pytest
+
+import nonce_alloc
+from nonce_alloc import NonceAllocator
+
+GENESIS = "1c2c7516dac2140c47cbae264e8349bb7c07a534"
+
+class Acc:
+    # What the allocator uses of a keystore account handle
+    def __init__(self, index, chain_nonce=0, address=None):
+        self.index = index
+        self.address = address or "{:040x}".format(index + 1)
+        self.chain_nonce = chain_nonce
+
+    def get_nonce(self):
+        return self.chain_nonce
+
+class Genesis(Acc):
+    def __init__(self, chain_nonce=0):
+        super().__init__(None, chain_nonce, GENESIS.upper())
+        del self.index
+
+def fork():
+    return multiprocessing.get_context("fork")
+
+def test_reserve_starts_after_chain_nonce():
+    alloc = NonceAllocator(4, GENESIS)
+    acc = Acc(1, chain_nonce=7)
+    assert alloc.next(acc) == 8
+    assert alloc.reserve(acc, 3) == 9
+    assert alloc.next(acc) == 12
+    assert alloc.get(acc) == 12
+    assert alloc.get(Acc(2)) is None
+
+def test_genesis_uses_the_extra_slot():
+    alloc = NonceAllocator(4, GENESIS)
+    assert alloc.slot(Genesis()) == 4
+    assert alloc.next(Genesis(chain_nonce=3)) == 4
+    assert alloc.next(Acc(3)) == 1
+
+def test_other_accounts_need_an_index():
+    alloc = NonceAllocator(4, GENESIS)
+    stray = Genesis()
+    stray.address = "ab" * 20
+    with pytest.raises(ValueError):
+        alloc.slot(stray)
+    with pytest.raises(IndexError):
+        alloc.slot(Acc(4))
+
+def test_released_nonces_are_reused_lowest_first():
+    alloc = NonceAllocator(4, GENESIS)
+    acc, other = Acc(0), Acc(1)
+    assert [alloc.next(acc) for _ in range(5)] == [1, 2, 3, 4, 5]
+    assert alloc.release(acc, 4)
+    assert alloc.release(acc, 2)
+    # Holes belong to their account
+    assert alloc.next(other) == 1
+    assert alloc.next(acc) == 2
+    assert alloc.next(acc) == 4
+    assert alloc.next(acc) == 6
+    # A batch of nonces is always fresh
+    assert alloc.release(acc, 3)
+    assert alloc.reserve(acc, 2) == 7
+    assert alloc.next(acc) == 3
+
+def test_release_of_nonce_never_handed_out_is_ignored():
+    alloc = NonceAllocator(4, GENESIS)
+    acc = Acc(0)
+    assert alloc.release(acc, 1)
+    alloc.next(acc)
+    assert alloc.release(acc, 5)
+    assert alloc.num_holes.value == 0
+    assert alloc.next(acc) == 2
+
+def test_set_forgets_holes():
+    alloc = NonceAllocator(4, GENESIS)
+    acc, other = Acc(0), Acc(1)
+    for _ in range(3):
+        alloc.next(acc)
+        alloc.next(other)
+    alloc.release(acc, 2)
+    alloc.release(other, 2)
+    alloc.set(acc, 10)
+    assert alloc.next(acc) == 11
+    assert alloc.next(other) == 2
+
+def test_hole_table_full(monkeypatch):
+    monkeypatch.setattr(nonce_alloc, "MAX_HOLES", 2)
+    alloc = NonceAllocator(4, GENESIS)
+    acc = Acc(0)
+    for _ in range(5):
+        alloc.next(acc)
+    assert alloc.release(acc, 1)
+    assert alloc.release(acc, 2)
+    assert not alloc.release(acc, 3)
+
+def reserve_many(alloc, accs, rounds, out):
+    nonces = []
+    for _ in range(rounds):
+        for acc in accs:
+            nonces.append((acc.index, alloc.next(acc)))
+    out.put(nonces)
+
+def test_processes_never_share_a_nonce():
+    ctx = fork()
+    alloc = NonceAllocator(8, GENESIS)
+    accs = [Acc(i, chain_nonce=i) for i in range(8)]
+    out = ctx.Queue()
+    procs = [ctx.Process(target=reserve_many, args=(alloc, accs, 200, out)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    results = [out.get(timeout=60) for _ in procs]
+    for p in procs:
+        p.join(timeout=60)
+    by_acc = {}
+    for nonces in results:
+        for index, nonce in nonces:
+            by_acc.setdefault(index, []).append(nonce)
+    for acc in accs:
+        assert sorted(by_acc[acc.index]) == list(range(acc.chain_nonce + 1, acc.chain_nonce + 801))
+
+def release_then_report(alloc, acc, nonces, done):
+    for nonce in nonces:
+        alloc.release(acc, nonce)
+    done.set()
+
+def test_holes_released_in_one_process_are_reused_in_another():
+    ctx = fork()
+    alloc = NonceAllocator(2, GENESIS)
+    acc = Acc(0)
+    for _ in range(10):
+        alloc.next(acc)
+    done = ctx.Event()
+    p = ctx.Process(target=release_then_report, args=(alloc, acc, [7, 3, 9], done))
+    p.start()
+    assert done.wait(timeout=60)
+    p.join(timeout=60)
+    assert [alloc.next(acc) for _ in range(4)] == [3, 7, 9, 11]
@@ -0,0 +1,64 @@
+# Shard assignment as in the node (last four address bytes, big-endian, modulo
+# the shard count) and the intra-shard fraction of generated transaction maps.
+import random
+
+import pytest
+
+import simulator
+from sharding import shard_of, group_by_shard, locality_txn_map
+
+GENESIS = "1c2c7516dac2140c47cbae264e8349bb7c07a534"
+
+@pytest.mark.parametrize("address, num_shards, shard", [
+    # ...7c07a534 = 2080875828
+    (GENESIS, 2, 0),
+    (GENESIS, 3, 0),
+    (GENESIS, 5, 3),
+    # ...ecdcf9ad = 3973904813
+    ("983e2ac93b88531c8bae5e35f26fcc08ecdcf9ad", 2, 1),
+    ("983e2ac93b88531c8bae5e35f26fcc08ecdcf9ad", 3, 2),
+    ("983e2ac93b88531c8bae5e35f26fcc08ecdcf9ad", 4, 1),
+    # Only the last four bytes count
+    ("ffffffffffffffffffffffffffffffff00000003", 4, 3),
+    ("0000000000000000000000000000000000000003", 4, 3),
+    ("0000000000000000000000000000000000000000", 3, 0),
+])
+def test_known_addresses(address, num_shards, shard):
+    assert shard_of(address, num_shards) == shard
+
+def test_prefix_and_case_do_not_matter():
+    for address in ("0x" + GENESIS, GENESIS.upper(), "0X" + GENESIS.upper(), "0x1C2c7516DaC2140c47CBaE264E8349Bb7c07a534"):
+        assert shard_of(address, 5) == 3
+
+def test_simulator_agrees():
+    rng = random.Random(1)
+    for _ in range(1000):
+        address = "{:040x}".format(rng.getrandbits(160))
+        for n in (1, 2, 3, 7):
+            assert simulator.shard_of(address, n) == shard_of(address, n)
+
+class Acc:
+    def __init__(self, address):
+        self.address = address
+
+def accounts(n, seed):
+    rng = random.Random(seed)
+    return [Acc("{:040x}".format(rng.getrandbits(160))) for _ in range(n)]
+
+def test_group_by_shard():
+    accs = accounts(200, 2)
+    groups = group_by_shard(accs, 3)
+    assert sorted(groups) == [0, 1, 2]
+    assert sum(len(g) for g in groups.values()) == 200
+    for s, g in groups.items():
+        assert all(shard_of(acc.address, 3) == s for acc in g)
+
+@pytest.mark.parametrize("fraction", [0.0, 0.5, 1.0])
+def test_locality_txn_map_fraction(fraction):
+    senders, receivers = accounts(120, 3), accounts(600, 4)
+    txn_map = locality_txn_map(senders, receivers, 3, fraction, random.Random(5))
+    pairs = [(src, dest) for src, dests in txn_map for dest in dests]
+    # Every recipient receives exactly once
+    assert sorted(id(dest) for _, dest in pairs) == sorted(map(id, receivers))
+    intra = sum(shard_of(src.address, 3) == shard_of(dest.address, 3) for src, dest in pairs)
+    assert abs(intra / len(pairs) - fraction) < 0.05
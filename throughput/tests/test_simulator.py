@@ -0,0 +1,126 @@
+# End to end against simulator.py: transactions built and sent the way the
+# load generators do are accepted under the TranIDs computed locally, and are
+# found in blocks by the confirmation tracker.
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+from pyzil.account import Account
+from pyzil.zilliqa import chain
+from pyzil.zilliqa.api import ZilliqaAPI, APIError
+
+import tracker
+from async_submit import submit_all
+from batch_submit import BatchZilliqaAPI
+from nonce_alloc import NonceAllocator, chain_nonces
+from tracker import ConfirmationTracker
+from txparams import transfer_params, txn_hash
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EPOCH_TIME = 0.2
+BALANCE = 10 ** 15
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def endpoint(tmp_path_factory):
+    port = free_port()
+    # Run away from config.json, so no genesis account is set up
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "simulator.py"), "--host", "127.0.0.1", "--port", str(port),
+            "--epoch-time", str(EPOCH_TIME), "--shards", "2", "--default-balance", str(BALANCE)],
+            cwd=str(tmp_path_factory.mktemp("simulator")), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = "http://127.0.0.1:{}".format(port)
+    try:
+        for _ in range(100):
+            try:
+                ZilliqaAPI(url).GetBlockchainInfo()
+                break
+            except Exception:
+                time.sleep(0.1)
+        else:
+            pytest.fail("simulator did not start")
+        chain.set_active_chain(chain.BlockChain(url, version=1, network_id=0))
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def transfers(senders, per_sender, first_nonce=1):
+    to = Account.generate().address
+    return [transfer_params(acc, to, 1, nonce, gas_price=100)
+            for nonce in range(first_nonce, first_nonce + per_sender) for acc in senders]
+
+def confirm(endpoint, txn_ids, start_block):
+    t = ConfirmationTracker(start_block=start_block)
+    for txn_id in txn_ids:
+        t.add(txn_id)
+    return t.wait(ZilliqaAPI(endpoint), timeout=30, sleep=EPOCH_TIME)
+
+def latest_block(endpoint):
+    return ConfirmationTracker().latest_block(ZilliqaAPI(endpoint))
+
+def test_batched_sends_confirm_under_local_hashes(endpoint):
+    params = transfers([Account.generate() for _ in range(5)], 4)
+    start = latest_block(endpoint)
+    out = list(BatchZilliqaAPI(endpoint, batch_size=8).create_transactions(params))
+    assert all(error is None for _, _, error in out)
+    assert [info["TranID"] for _, info, _ in out] == [txn_hash(p) for p in params]
+    assert confirm(endpoint, [txn_hash(p) for p in params], start)
+
+def test_async_replay_confirms(endpoint):
+    params = transfers([Account.generate() for _ in range(10)], 5)
+    start = latest_block(endpoint)
+    accepted = []
+    stats = asyncio.run(submit_all(params, endpoint, max_in_flight=16, num_connections=4,
+            on_result=lambda tx, info, error: accepted.append(info["TranID"]) if error is None else None))
+    assert stats == {"sent": 50, "failed": 0}
+    assert sorted(accepted) == sorted(txn_hash(p) for p in params)
+    assert confirm(endpoint, accepted, start)
+
+def test_rejections_are_per_item(endpoint):
+    acc = Account.generate()
+    params = transfers([acc], 3)
+    poor = transfer_params(acc, Account.generate().address, BALANCE, 4, gas_price=100)
+    out = list(BatchZilliqaAPI(endpoint).create_transactions(params + [poor, params[0]]))
+    assert [error is None for _, _, error in out] == [True, True, True, False, False]
+    assert "Insufficient balance" in str(out[3][2])
+    assert "already present" in str(out[4][2])
+
+def test_chain_nonces_and_release(endpoint):
+    senders = [Account.generate() for _ in range(3)]
+    for i, acc in enumerate(senders):
+        acc.index = i
+    params = transfers(senders, 2)
+    start = latest_block(endpoint)
+    list(BatchZilliqaAPI(endpoint).create_transactions(params))
+    assert confirm(endpoint, [txn_hash(p) for p in params], start)
+    unknown = Account.generate()
+    unknown.index = 3
+    assert chain_nonces(senders + [unknown], endpoint, batch_size=2) == [2, 2, 2, 0]
+
+    alloc = NonceAllocator(4, "00" * 20)
+    alloc.sync(senders, endpoint)
+    for acc in senders:
+        alloc.reserve(acc, 3)
+    # Nonce 2 is used up on the chain; nonce 4 was never taken
+    assert alloc.release_rejected([(senders[0], 2), (senders[1], 4)], endpoint) == []
+    assert alloc.next(senders[0]) == 6
+    assert alloc.next(senders[1]) == 4
+
+def test_empty_blocks_and_fetch_errors(endpoint, monkeypatch):
+    monkeypatch.setattr(tracker, "POLL_SLEEP", 0)
+    api = ZilliqaAPI(endpoint)
+    t = ConfirmationTracker()
+    latest = t.latest_block(api)
+    # Nothing has been sent for a while, so the last blocks are empty
+    time.sleep(3 * EPOCH_TIME)
+    assert t.fetch_block(api, t.latest_block(api)) == []
+    with pytest.raises(APIError):
+        t.fetch_block(api, latest + 10 ** 6)
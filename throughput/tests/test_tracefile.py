@@ -0,0 +1,128 @@
+# Compact (.ztrace) traces: what is written is read back record for record,
+# and the column and dictionary encodings are the ones the header promises.
+import json
+import os
+import random
+
+import pytest
+
+import tracefile
+from tracefile import CompactWriter, read_compact, read_records, convert, COMPACT_MAGIC, BLOCK_HEADER
+
+PUBKEYS = ["02" + "{:064x}".format(i) for i in range(5)]
+CODE = "scilla_version 0\n\n(* repeated in every deploy *)\ncontract C ()\n"
+
+def records(n, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        r = {
+            "version": 1,
+            "nonce": i + 1,
+            "toAddr": "0x{:040X}".format(rng.randrange(8)),
+            "amount": str(rng.randrange(10 ** 12)),
+            "pubKey": rng.choice(PUBKEYS),
+            "gasPrice": "100",
+            "gasLimit": "10000",
+            "code": CODE if i % 3 == 0 else None,
+            "data": json.dumps({"_tag": "Transfer", "params": [{"value": str(i)}]}) if i % 3 == 1 else None,
+            "signature": "{:0128x}".format(rng.getrandbits(512)),
+            "priority": i % 2 == 0,
+        }
+        if i % 5 == 0:
+            # A key only some records have
+            r["submitted"] = 1600000000.5 + i
+        out.append(r)
+    return out
+
+def write(path, items, block_records=tracefile.BLOCK_RECORDS):
+    w = CompactWriter(str(path), block_records=block_records)
+    for r in items:
+        w.write(r)
+    w.close()
+    return w
+
+def blocks(path):
+    # The JSON header of every block
+    data = open(path, 'rb').read()
+    end, _ = tracefile.FOOTER.unpack_from(data, len(data) - tracefile.FOOTER.size)
+    pos = len(COMPACT_MAGIC)
+    headers = []
+    while pos < end:
+        (size,) = BLOCK_HEADER.unpack_from(data, pos)
+        header = json.loads(data[pos + BLOCK_HEADER.size:pos + BLOCK_HEADER.size + size])
+        headers.append(header)
+        pos += BLOCK_HEADER.size + size
+        for key, kind, *extra in header["columns"]:
+            pos += header["count"] * (extra[0] if kind == "hex" else tracefile.COLUMN_TYPES[kind][0])
+    return headers
+
+def test_round_trip(tmp_path):
+    items = records(250)
+    path = tmp_path / "t.ztrace"
+    write(path, items, block_records=64)
+    assert list(read_compact(str(path))) == items
+    assert len(blocks(path)) == 4
+
+def test_meta_records_keep_their_place(tmp_path):
+    items = records(10)
+    items.insert(0, {"meta": {"phase": "funding"}})
+    items.insert(6, {"meta": {"phase": "transfer"}})
+    items.append({"meta": {"phase": "end"}})
+    path = tmp_path / "t.ztrace"
+    write(path, items, block_records=4)
+    assert list(read_compact(str(path))) == items
+
+def test_column_kinds(tmp_path):
+    path = tmp_path / "t.ztrace"
+    write(path, records(100))
+    kinds = {key: kind for key, kind, *_ in blocks(path)[0]["columns"]}
+    assert kinds["nonce"] == "u64"
+    assert kinds["priority"] == "bool"
+    assert kinds["signature"] == "hex"
+    for key in ("pubKey", "toAddr", "code", "data", "gasPrice", "submitted"):
+        assert kinds[key] == "ref"
+
+def test_repeated_strings_stored_once(tmp_path):
+    path = tmp_path / "t.ztrace"
+    w = write(path, records(300))
+    data = open(path, 'rb').read()
+    assert data.count(json.dumps(CODE)[1:-1].encode()) == 1
+    for pubkey in PUBKEYS:
+        assert data.count(pubkey.encode()) == 1
+    # Entry 0 is the missing key; every other entry is distinct
+    assert w.values[0] is None
+    assert len(w.values) - 1 == len({(type(v), json.dumps(v)) for v in w.values[1:]})
+
+def test_hex_case_and_none_survive(tmp_path):
+    items = [{"signature": "{:0128X}".format(i * 7919), "code": None, "toAddr": "0xAb"} for i in range(50)]
+    path = tmp_path / "t.ztrace"
+    write(path, items)
+    assert list(read_compact(str(path))) == items
+
+def test_unclosed_file(tmp_path):
+    path = tmp_path / "t.ztrace"
+    w = CompactWriter(str(path))
+    for r in records(10):
+        w.write(r)
+    w.flush()
+    w.file.close()
+    with pytest.raises(ValueError, match="not closed"):
+        list(read_compact(str(path)))
+
+def test_not_a_compact_trace(tmp_path):
+    path = tmp_path / "t.ztrace"
+    path.write_bytes(b"{}\n" * 10)
+    with pytest.raises(ValueError, match="not a compact trace"):
+        list(read_compact(str(path)))
+
+def test_convert_both_ways(tmp_path):
+    items = records(120)
+    src = tmp_path / "t.trace"
+    src.write_text("".join(json.dumps(r) + "\n" for r in items))
+    compact = tmp_path / "t.ztrace"
+    back = tmp_path / "back.trace"
+    assert convert([str(src)], str(compact)) == len(items)
+    assert convert([str(compact)], str(back)) == len(items)
+    assert list(read_records(str(back))) == items
+    assert os.path.getsize(compact) < os.path.getsize(src)
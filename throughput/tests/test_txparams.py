@@ -0,0 +1,50 @@
+# Locally built transactions: the hand-encoded core fields are the bytes pyzil
+# serializes and signs, so txn_hash is the TranID the node hands out.
+import hashlib
+import json
+
+import pytest
+from pyzil.account import Account
+from pyzil.common import utils
+from pyzil.zilliqa import chain
+from pyzil.zilliqa.proto import messages_pb2 as pb2
+
+from txparams import transfer_params, call_params, core_fields, txn_hash
+
+def reference(params):
+    # The protobuf pyzil builds, from the same params
+    proto = pb2.ProtoTransactionCoreInfo()
+    proto.version = params["version"]
+    proto.nonce = params["nonce"]
+    proto.toaddr = utils.hex_str_to_bytes(params["toAddr"])
+    proto.senderpubkey.data = utils.hex_str_to_bytes(params["pubKey"])
+    proto.amount.data = utils.int_to_bytes(int(params["amount"]), n_bytes=16)
+    proto.gasprice.data = utils.int_to_bytes(int(params["gasPrice"]), n_bytes=16)
+    proto.gaslimit = int(params["gasLimit"])
+    if params["code"]:
+        proto.code = params["code"].encode()
+    if params["data"]:
+        proto.data = params["data"].encode()
+    return proto.SerializeToString()
+
+@pytest.fixture(scope="module")
+def acc():
+    chain.set_active_chain(chain.BlockChain("http://localhost", version=1, network_id=0))
+    return Account.generate()
+
+def transactions(acc):
+    to = Account.generate().address
+    yield transfer_params(acc, to, 1, 1, gas_price=100)
+    yield transfer_params(acc, to, 0, 2 ** 40 + 1, gas_price=2 ** 70, gas_limit=2 ** 33)
+    yield call_params(acc, to, "Transfer", [{"vname": "to", "type": "ByStr20", "value": "0x" + to}], 300, zils=5, gas_price=100)
+    yield transfer_params(acc, "0" * 40, 0, 7, gas_price=100, gas_limit=20000,
+            code="scilla_version 0\ncontract C ()\n", data=json.dumps([{"vname": "_scilla_version", "type": "Uint32", "value": "0"}]))
+
+def test_core_fields_match_protobuf(acc):
+    for params in transactions(acc):
+        assert core_fields(params) == reference(params)
+
+def test_signature_covers_core_fields(acc):
+    for params in transactions(acc):
+        assert acc.zil_key.verify(params["signature"], core_fields(params))
+        assert txn_hash(params) == hashlib.sha256(reference(params)).hexdigest()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# Reading and writing transaction traces: one JSON-encoded CreateTransaction
+# parameter object per line, plus {"meta": ...} records (e.g. the start of a
+# phase) that replaying skips. Files ending in .gz or .zst are compressed.
+#
+# fund.py has every worker process write its own buffered, compressed file; the
+# merge step below puts them back into one replayable trace, phase by phase:
+#
+#   ./tracefile.py merge trace/20210301-120000 -o run.trace.gz --split
+#
+# Files ending in .ztrace are compact traces: blocks of records stored column
+# by column (nonces as integers, signatures as raw bytes), with every string
+# that repeats across transactions (contract code, pubkeys, addresses, gas
+# fields) stored once in a dictionary at the end of the file. They are read
+# through a memory map, a whole column at a time.
+#
+#   ./tracefile.py convert traces/with-cosplit/ss-deploy.trace ss-deploy.ztrace
+#   ./tracefile.py convert ss-deploy.ztrace ss-deploy.trace
+import argparse
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from itertools import repeat
+from multiprocessing import util
+
+# Compression -> file suffix of per-worker traces
+SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst", None: ".jsonl"}
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+# Records kept in memory before they are compressed and written
+BUFFER_RECORDS = 1000
+FLUSH_INTERVAL = 5.0
+
+COMPACT_SUFFIX = ".ztrace"
+COMPACT_MAGIC = b"ZTR1"
+BLOCK_HEADER = struct.Struct("<I")
+# Offset of the dictionary, then the magic again; missing if never closed
+FOOTER = struct.Struct("<Q4s")
+BLOCK_RECORDS = 65536
+# Bytes per value of each fixed-width column kind, and its array typecode
+COLUMN_TYPES = {"bool": (1, 'B'), "u64": (8, 'Q'), "f64": (8, 'd'), "ref": (4, 'I')}
+# Dictionary entry 0: the record does not have this key
+MISSING = object()
+
+def open_trace(path, mode='r'):
+    # Text stream, compressed according to the file suffix
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + 't', compresslevel=GZIP_LEVEL)
+    if path.endswith(".zst"):
+        import zstandard
+        if mode == 'r':
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')))
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb')))
+    return open(path, mode)
+
+def read_records(path):
+    # Yields every record of one file; a worker that died leaves a truncated
+    # file, which is read up to its last complete flush
+    if path.endswith(COMPACT_SUFFIX):
+        yield from read_compact(path)
+        return
+    with open_trace(path) as tf:
+        try:
+            for line in tf:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    print("Failed to parse record {}: {}".format(line, e))
+        except EOFError:
+            print("{} ends early; it was not closed".format(path))
+
+def iter_trace(paths, new_nonce=None, phases=None):
+    # Lazily yield transactions from each file in turn, optionally rewriting
+    # nonces so several traces can be replayed back to back, and optionally
+    # only those of the named phases
+    for path in paths:
+        phase = None
+        for record in read_records(path):
+            try:
+                if "meta" in record:
+                    if record["meta"] == "phase":
+                        phase = record["phase"]
+                    continue
+                if phases is not None and phase not in phases:
+                    continue
+                tx = record.get("tx", record)
+                if new_nonce is not None:
+                    tx["nonce"] = new_nonce(tx["pubKey"])
+                yield tx
+            except Exception as e:
+                print("Failed to parse transaction {}: {}".format(record, e))
+
+def sender_bucket(tx, num_buckets):
+    # Stable across processes and runs, unlike hash()
+    return zlib.crc32(tx["pubKey"].encode('ascii')) % num_buckets
+
+class TraceWriter:
+    # One per process. Transactions are wrapped as {"time", "sender", "tx"} so
+    # the merge can order them across workers; phases are meta records.
+    def __init__(self, directory, compression="gzip", buffer_records=BUFFER_RECORDS, flush_interval=FLUSH_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "worker-{}{}".format(os.getpid(), SUFFIXES[compression]))
+        self.file = open_trace(self.path, 'w')
+        self.buffer_records = buffer_records
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.time()
+        self.phase = None
+
+    def meta(self, kind, **fields):
+        record = {"meta": kind, "time": time.time(), "pid": os.getpid()}
+        record.update(fields)
+        self.buffer.append(json.dumps(record))
+
+    def set_phase(self, phase):
+        if phase is not None and phase != self.phase:
+            self.phase = phase
+            self.meta("phase", phase=phase)
+
+    def write(self, params, sender=None):
+        now = time.time()
+        self.buffer.append(json.dumps({"time": now, "sender": sender, "tx": params}))
+        if len(self.buffer) >= self.buffer_records or now - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+        self.file.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+# Per process, so forked workers open their own file
+_writers = {}
+
+def get_writer(directory, compression="gzip"):
+    key = (os.getpid(), directory)
+    writer = _writers.get(key)
+    if writer is None:
+        writer = _writers[key] = TraceWriter(directory, compression)
+        # Runs when a pool worker or the main process exits
+        util.Finalize(writer, writer.close, exitpriority=10)
+    return writer
+
+class JsonWriter:
+    def __init__(self, path):
+        self.file = open_trace(path, 'w')
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.file.close()
+
+def hex_column(values):
+    # (width, case, raw bytes) if every value is a hex string of one even
+    # length and one case, e.g. signatures; None otherwise
+    n = len(values[0])
+    if n < 32 or n % 2 or any(len(v) != n for v in values):
+        return None
+    joined = "".join(values)
+    try:
+        raw = bytes.fromhex(joined)
+    except ValueError:
+        return None
+    lower = raw.hex()
+    if joined == lower:
+        return n // 2, "lower", raw
+    if joined == lower.upper():
+        return n // 2, "upper", raw
+    return None
+
+def column_bytes(values, typecode):
+    # Little-endian on disk
+    a = array(typecode, values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tobytes()
+
+def column_values(view, typecode):
+    # A whole column at once: a cast of the mapped bytes, not a copy
+    if sys.byteorder == "little":
+        return view.cast(typecode).tolist()
+    a = array(typecode, bytes(view))
+    a.byteswap()
+    return a.tolist()
+
+class CompactWriter:
+    def __init__(self, path, block_records=BLOCK_RECORDS):
+        self.file = open(path, 'wb')
+        self.file.write(COMPACT_MAGIC)
+        self.block_records = block_records
+        self.records = []
+        self.meta = []
+        # Interned values; entry 0 stands for a missing key
+        self.values = [None]
+        self.index = {}
+
+    def intern(self, value):
+        if value is MISSING:
+            return 0
+        if isinstance(value, (dict, list)):
+            key = (type(value), json.dumps(value))
+        else:
+            key = (type(value), value)
+        i = self.index.get(key)
+        if i is None:
+            i = self.index[key] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def encode(self, values):
+        # Picks the most compact kind the whole column fits
+        types = set(map(type, values))
+        if types == {bool}:
+            return ["bool"], column_bytes(values, 'B')
+        if types == {int} and min(values) >= 0 and max(values) < 2 ** 64:
+            return ["u64"], column_bytes(values, 'Q')
+        if types == {float}:
+            return ["f64"], column_bytes(values, 'd')
+        # Strings that repeat (pubkeys, addresses, code) go to the dictionary
+        if types == {str} and len(set(values)) > len(values) // 2:
+            h = hex_column(values)
+            if h is not None:
+                return ["hex", h[0], h[1]], h[2]
+        return ["ref"], column_bytes([self.intern(v) for v in values], 'I')
+
+    def write(self, record):
+        if "meta" in record:
+            self.meta.append([len(self.records), record])
+        else:
+            self.records.append(record)
+        if len(self.records) >= self.block_records:
+            self.flush()
+
+    def flush(self):
+        if not self.records and not self.meta:
+            return
+        keys = OrderedDict()
+        for record in self.records:
+            for key in record:
+                keys[key] = None
+        columns = []
+        data = []
+        for key in keys:
+            kind, raw = self.encode([record.get(key, MISSING) for record in self.records])
+            columns.append([key] + kind)
+            data.append(raw)
+        header = json.dumps({"count": len(self.records), "columns": columns, "meta": self.meta}).encode()
+        self.file.write(BLOCK_HEADER.pack(len(header)) + header + b"".join(data))
+        self.records = []
+        self.meta = []
+
+    def close(self):
+        self.flush()
+        offset = self.file.tell()
+        self.file.write(json.dumps(self.values).encode())
+        self.file.write(FOOTER.pack(offset, COMPACT_MAGIC))
+        self.file.close()
+
+def read_compact(path):
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        if mm[:len(COMPACT_MAGIC)] != COMPACT_MAGIC or len(mm) < len(COMPACT_MAGIC) + FOOTER.size:
+            raise ValueError("{} is not a compact trace".format(path))
+        end, magic = FOOTER.unpack_from(mm, len(mm) - FOOTER.size)
+        if magic != COMPACT_MAGIC:
+            raise ValueError("{} was not closed".format(path))
+        values = json.loads(mm[end:len(mm) - FOOTER.size])
+        values[0] = MISSING
+        pos = len(COMPACT_MAGIC)
+        while pos < end:
+            (size,) = BLOCK_HEADER.unpack_from(mm, pos)
+            block = json.loads(mm[pos + BLOCK_HEADER.size:pos + BLOCK_HEADER.size + size])
+            pos += BLOCK_HEADER.size + size
+            n = block["count"]
+            keys = []
+            columns = []
+            missing = False
+            for key, kind, *extra in block["columns"]:
+                if kind == "hex":
+                    width, case = extra
+                    digits = view[pos:pos + n * width].hex()
+                    if case == "upper":
+                        digits = digits.upper()
+                    column = [digits[i:i + 2 * width] for i in range(0, len(digits), 2 * width)]
+                    pos += n * width
+                else:
+                    width, typecode = COLUMN_TYPES[kind]
+                    column = column_values(view[pos:pos + n * width], typecode)
+                    pos += n * width
+                    if kind == "bool":
+                        column = list(map(bool, column))
+                    elif kind == "ref":
+                        missing = missing or 0 in column
+                        column = list(map(values.__getitem__, column))
+                keys.append(key)
+                columns.append(column)
+            rows = list(map(dict, map(zip, repeat(keys), zip(*columns)))) if columns else []
+            if missing:
+                rows = [{k: v for k, v in row.items() if v is not MISSING} for row in rows]
+            meta = block["meta"]
+            if not meta:
+                yield from rows
+                continue
+            m = 0
+            for i, row in enumerate(rows):
+                while m < len(meta) and meta[m][0] <= i:
+                    yield meta[m][1]
+                    m += 1
+                yield row
+            for _, record in meta[m:]:
+                yield record
+    finally:
+        view.release()
+        mm.close()
+
+def record_writer(path):
+    if path.endswith(COMPACT_SUFFIX):
+        return CompactWriter(path)
+    return JsonWriter(path)
+
+def convert(paths, out):
+    # Record for record, in either direction between JSON lines and compact
+    w = record_writer(out)
+    n = 0
+    for path in paths:
+        for record in read_records(path):
+            w.write(record)
+            n += 1
+    w.close()
+    return n
+
+def trace_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                if any(name.endswith(s) for s in SUFFIXES.values()))
+        else:
+            files.append(path)
+    return files
+
+def merge(paths, out, split=False):
+    # Orders the transactions of all worker files by phase, then by the time
+    # they were accepted, keeping every sender's nonces increasing within a
+    # phase; writes one trace with a meta record per phase and an index
+    phases = OrderedDict()
+    start = {}
+    for path in trace_files(paths):
+        phase = None
+        for record in read_records(path):
+            if record.get("meta") == "phase":
+                # Worker files time their phase records; merged traces give the start
+                phase = record["phase"]
+                t = record.get("time", record.get("start", 0))
+                start[phase] = min(start.get(phase, t), t)
+            elif "meta" not in record:
+                tx = record.get("tx", record)
+                phases.setdefault(phase, []).append((record.get("time", 0), tx))
+                start.setdefault(phase, record.get("time", 0))
+
+    index = []
+    line = 0
+    outputs = []
+    w = record_writer(out)
+    for phase in sorted(phases, key=lambda p: start[p]):
+        records = sorted(phases[phase], key=lambda r: r[0])
+        txs = [tx for _, tx in records]
+        by_sender = OrderedDict()
+        for i, tx in enumerate(txs):
+            by_sender.setdefault(tx["pubKey"], []).append(i)
+        for positions in by_sender.values():
+            ordered = sorted((txs[i] for i in positions), key=lambda tx: int(tx["nonce"]))
+            for i, tx in zip(positions, ordered):
+                txs[i] = tx
+        entry = {"phase": phase, "line": line + 1, "count": len(txs), "senders": len(by_sender),
+            "start": records[0][0], "end": records[-1][0]}
+        w.write(dict(meta="phase", **entry))
+        for tx in txs:
+            w.write(tx)
+        line += 1 + len(txs)
+        index.append(entry)
+        if split:
+            name = split_name(out, phase)
+            pw = record_writer(name)
+            for tx in txs:
+                pw.write(tx)
+            pw.close()
+            outputs.append(name)
+    w.close()
+    with open(out + ".index.json", 'w') as f:
+        json.dump(index, f, indent=1)
+    return index, outputs
+
+def split_name(out, phase):
+    base, ext = out, ""
+    for suffix in (".gz", ".zst"):
+        if base.endswith(suffix):
+            base, ext = base[:-len(suffix)], suffix
+    if base.endswith(COMPACT_SUFFIX):
+        base, ext = base[:-len(COMPACT_SUFFIX)], COMPACT_SUFFIX
+    elif base.endswith(".trace"):
+        base, ext = base[:-len(".trace")], ".trace" + ext
+    return "{}.{}{}".format(base, re.sub(r"[^A-Za-z0-9_.-]+", "_", str(phase)), ext)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge and convert transaction traces")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("merge", help="merge per-worker trace files into one replayable trace")
+    m.add_argument("paths", nargs="+", help="trace directories or files")
+    m.add_argument("-o", "--output", required=True, help="merged trace (.gz, .zst or .ztrace to compress)")
+    m.add_argument("--split", action="store_true", help="also write one trace per phase")
+    c = sub.add_parser("convert", help="convert between JSON lines and compact (.ztrace) traces")
+    c.add_argument("paths", nargs="+", help="input traces")
+    c.add_argument("output")
+    args = parser.parse_args()
+
+    if args.cmd == "convert":
+        start = time.time()
+        n = convert(args.paths, args.output)
+        size = sum(os.path.getsize(p) for p in args.paths)
+        print("Wrote {} records to {} in {:.2f}s: {} bytes, was {}".format(
+            n, args.output, time.time() - start, os.path.getsize(args.output), size))
+    else:
+        index, outputs = merge(args.paths, args.output, args.split)
+        for entry in index:
+            print("{phase}: {count} transactions from {senders} senders, line {line}".format(**entry))
+        print("Wrote {} ({} transactions) and {}".format(args.output, sum(e["count"] for e in index), args.output + ".index.json"))
+        for name in outputs:
+            print("Wrote {}".format(name))
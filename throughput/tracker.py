@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Block-driven confirmation tracking. Instead of polling every transaction, follow
+# new TxBlocks and pull each block's transaction hashes in bulk with
+# GetTransactionsForTxBlock, matching them against an in-memory pending set.
+# RPC cost is one call per block, independent of the number of transactions.
+import asyncio
+import time
+
+from pyzil.zilliqa.api import APIError
+
+from async_submit import RPCError
+
+TX_TIMEOUT = 300
+POLL_SLEEP = 2
+# What GetTransactionsForTxBlock answers for a block without transactions;
+# any other error is retried FETCH_RETRIES times and then raised
+NO_TRANSACTIONS = "TxBlock has no transactions"
+FETCH_RETRIES = 3
+
+def norm_hash(h):
+    h = h.lower()
+    return h[2:] if h.startswith("0x") else h
+
+class ConfirmationTracker:
+    def __init__(self, start_block=None):
+        # TranID -> submit timestamp (or None)
+        self.pending = {}
+        # TranID -> (block, micro-block index, confirmation timestamp)
+        self.confirmed = {}
+        self.next_block = start_block
+        self.listeners = []
+
+    def add(self, txn_id, submitted=None):
+        txn_id = norm_hash(txn_id)
+        if txn_id not in self.confirmed:
+            self.pending[txn_id] = submitted
+
+    def on_confirm(self, fn):
+        # fn(txn_id, submitted, block, mb_index, now) is called for every matched transaction
+        self.listeners.append(fn)
+
+    def process_block(self, block, hash_lists):
+        # hash_lists has one entry per micro-block, indexed by shard id; the last
+        # one belongs to the DS committee. Empty micro-blocks show up as None.
+        now = time.time()
+        total = 0
+        matched = 0
+        for mb_index, hashes in enumerate(hash_lists or []):
+            for h in hashes or []:
+                total += 1
+                h = norm_hash(h)
+                if h in self.pending:
+                    submitted = self.pending.pop(h)
+                    self.confirmed[h] = (block, mb_index, now)
+                    matched += 1
+                    for fn in self.listeners:
+                        fn(h, submitted, block, mb_index, now)
+        return total, matched
+
+    def report(self, block, total, matched, start):
+        done = len(self.confirmed)
+        print("Block {}: {} transactions, {} of ours; confirmed {}/{} after {:.1f}s".format(
+            block, total, matched, done, done + len(self.pending), time.time() - start), flush=True)
+
+    # Synchronous API (pyzil ZilliqaAPI)
+
+    def latest_block(self, api):
+        return int(api.GetBlockchainInfo()["NumTxBlocks"]) - 1
+
+    def fetch_block(self, api, block):
+        for attempt in range(FETCH_RETRIES):
+            try:
+                return api.GetTransactionsForTxBlock(str(block))
+            except APIError as e:
+                if NO_TRANSACTIONS in str(e):
+                    return []
+                if attempt == FETCH_RETRIES - 1:
+                    raise
+                print("Could not fetch block {}: {}; retrying".format(block, e))
+                time.sleep(POLL_SLEEP)
+
+    def poll(self, api, start=None):
+        latest = self.latest_block(api)
+        if self.next_block is None:
+            self.next_block = latest
+        while self.next_block <= latest:
+            total, matched = self.process_block(self.next_block, self.fetch_block(api, self.next_block))
+            if start is not None:
+                self.report(self.next_block, total, matched, start)
+            self.next_block += 1
+        return latest
+
+    def wait(self, api, cutoff_block=None, timeout=TX_TIMEOUT, sleep=POLL_SLEEP):
+        start = time.time()
+        while self.pending and time.time() - start <= timeout:
+            latest = self.poll(api, start)
+            if cutoff_block is not None and latest > cutoff_block:
+                break
+            time.sleep(sleep)
+        return len(self.pending) == 0
+
+    # Asynchronous API (async_submit.AsyncZilliqaAPI)
+
+    async def fetch_block_async(self, api, block):
+        for attempt in range(FETCH_RETRIES):
+            try:
+                return await api.call("GetTransactionsForTxBlock", str(block))
+            except RPCError as e:
+                if NO_TRANSACTIONS in str(e):
+                    return []
+                if attempt == FETCH_RETRIES - 1:
+                    raise
+                print("Could not fetch block {}: {}; retrying".format(block, e))
+                await asyncio.sleep(POLL_SLEEP)
+
+    async def poll_async(self, api, start=None):
+        latest = int((await api.call("GetBlockchainInfo"))["NumTxBlocks"]) - 1
+        if self.next_block is None:
+            self.next_block = latest
+        while self.next_block <= latest:
+            hash_lists = await self.fetch_block_async(api, self.next_block)
+            total, matched = self.process_block(self.next_block, hash_lists)
+            if start is not None:
+                self.report(self.next_block, total, matched, start)
+            self.next_block += 1
+        return latest
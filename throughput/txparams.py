@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Build signed CreateTransaction parameters without sending them, mirroring
+# what pyzil's Account.transfer and Contract.call put into acc.last_params.
+import hashlib
+import json
+
+from pyzil.crypto import zilkey
+from pyzil.zilliqa import chain
+from pyzil.zilliqa.units import Zil, Qa
+
+# Gas price for offline signing (presign.py); otherwise the chain's minimum
+GAS_PRICE = 100
+TRANSFER_GAS_LIMIT = 1
+CALL_GAS_LIMIT = 10000
+
+def to_qa(zils):
+    if isinstance(zils, Qa):
+        return zils
+    if not isinstance(zils, Zil):
+        zils = Zil(zils)
+    return zils.toQa()
+
+_min_gas_price = None
+
+def min_gas_price():
+    # Read from the node once per process, as pyzil's Account.transfer would on every call
+    global _min_gas_price
+    if _min_gas_price is None:
+        _min_gas_price = int(chain.active_chain.api.GetMinimumGasPrice())
+    return _min_gas_price
+
+def transfer_params(acc, to_addr, zils, nonce, gas_price=None, gas_limit=TRANSFER_GAS_LIMIT, code="", data="", priority=False):
+    if gas_price is None:
+        gas_price = min_gas_price()
+    to_addr = zilkey.to_checksum_address(to_addr)
+    if not to_addr:
+        raise ValueError("invalid to address")
+    return chain.active_chain.build_transaction_params(acc.zil_key, to_addr, to_qa(zils), nonce,
+            gas_price, gas_limit, code, data, priority)
+
+def varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def length_delimited(number, data):
+    return varint(number << 3 | 2) + varint(len(data)) + data
+
+def byte_array(number, data):
+    # A ByteArray message holding data as its field 1
+    return length_delimited(number, length_delimited(1, data))
+
+def core_fields(params):
+    # The serialized ProtoTransactionCoreInfo that was signed, rebuilt from the
+    # params. Encoded by hand: the pure-Python protobuf runtime takes ~40us.
+    to_addr = params["toAddr"]
+    parts = [
+        varint(1 << 3) + varint(int(params["version"])),
+        varint(2 << 3) + varint(int(params["nonce"])),
+        length_delimited(3, bytes.fromhex(to_addr[2:] if to_addr[:2] in ("0x", "0X") else to_addr)),
+        byte_array(4, bytes.fromhex(params["pubKey"])),
+        byte_array(5, int(params["amount"]).to_bytes(16, 'big')),
+        byte_array(6, int(params["gasPrice"]).to_bytes(16, 'big')),
+        varint(7 << 3) + varint(int(params["gasLimit"])),
+    ]
+    if params.get("code"):
+        parts.append(length_delimited(8, params["code"].encode("utf-8")))
+    if params.get("data"):
+        parts.append(length_delimited(9, params["data"].encode("utf-8")))
+    return b"".join(parts)
+
+def txn_hash(params):
+    # The TranID the node gives the transaction: SHA-256 of its core fields
+    return hashlib.sha256(core_fields(params)).hexdigest()
+
+def call_params(acc, contract_addr, method, params, nonce, zils=0, gas_price=None, gas_limit=CALL_GAS_LIMIT, priority=True):
+    data = json.dumps({"_tag": method, "params": params})
+    return transfer_params(acc, contract_addr, zils, nonce, gas_price, gas_limit, data=data, priority=priority)
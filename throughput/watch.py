@@ -1,8 +1,26 @@
 #!/usr/bin/env python3
+# Chain and mempool sampler. Once per TxBlock it records the block number, the
+# number of transactions, the size of every micro-block, the peers per shard and
+# the status of the transactions we are still waiting for, and appends a row to
+# a CSV time series that throughput curves can be plotted from afterwards.
+# Pending lookups are batched and spread over a bounded thread pool.
+#
+#   ./watch.py                          # sample into watch.csv until interrupted
+#   ./watch.py --journal journal.db     # follow the journal's unconfirmed transactions
+#   ./watch.py --once                   # print GetBlockchainInfo and exit
+import argparse
+import csv
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
+
 from pyzil.zilliqa import chain
 from pyzil.zilliqa.api import ZilliqaAPI, APIError
-from collections import Counter
+
+from batch_submit import BatchZilliqaAPI, BatchNotSupported
+from tracker import norm_hash, NO_TRANSACTIONS
 
 API_ENDPOINT = "http://localhost:4201"
 
@@ -11,6 +29,13 @@ chain.set_active_chain(LocalNet)
 api = ZilliqaAPI(API_ENDPOINT)
 
 PENDING_FILE = "pending.txt"
+SAMPLES_FILE = "watch.csv"
+POLL_SLEEP = 2
+# Concurrent GetPendingTxn batches; each carries BatchZilliqaAPI.batch_size lookups
+LOOKUP_THREADS = 8
+
+COLUMNS = ["time", "block", "ds_block", "num_txns", "tx_rate", "shard_peers", "mb_sizes",
+    "tracked", "confirmed", "unconfirmed", "lookup_errors", "pending_info"]
 
 def pp_blockchaininfo():
     print("---")
@@ -24,21 +49,151 @@ def pp_gettxblock():
     pprint(info)
     print("---")
 
-def pp_getpending():
+def lookup_pending(hashes, threads=LOOKUP_THREADS):
+    # Yields (hash, GetPendingTxn result, error), one batch per pool task
+    batch_api = BatchZilliqaAPI(API_ENDPOINT)
+    step = max(1, batch_api.batch_size)
+
+    def lookup(chunk):
+        try:
+            return chunk, batch_api.batch_call("GetPendingTxn", chunk)
+        except BatchNotSupported:
+            return chunk, batch_api.single_calls("GetPendingTxn", chunk)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for chunk, results in pool.map(lookup, [hashes[i:i + step] for i in range(0, len(hashes), step)]):
+            for h, (r, error) in zip(chunk, results):
+                yield h, r, error
+
+def pp_getpending(threads=LOOKUP_THREADS):
+    with open(PENDING_FILE, 'r') as f:
+        hashes = [line.strip() for line in f if line.strip()]
     c = Counter()
     conf = Counter()
-    with open(PENDING_FILE, 'r') as f:
-        for line in f:
-            h = line.strip()
-            r = api.GetPendingTxn(h)
-            # if r["confirmed"] == False and r["code"] == 0:
-            #     print(h, r)
-            c.update([r["info"]])
-            conf.update([r["confirmed"]])
+    for h, r, error in lookup_pending(hashes, threads):
+        if error is not None:
+            c.update(["error: {}".format(error)])
+            continue
+        c.update([r["info"]])
+        conf.update([r["confirmed"]])
     pprint(c)
     pprint(conf)
 
+class Sampler:
+    def __init__(self, out=SAMPLES_FILE, pending_file=PENDING_FILE, journal_path=None, threads=LOOKUP_THREADS):
+        self.out = out
+        self.pending_file = pending_file
+        self.journal = None
+        if journal_path is not None:
+            from journal import Journal
+            self.journal = Journal(journal_path)
+        self.threads = threads
+        self.pending_mtime = None
+        # Hashes listed in the pending file or journal, and those still to look up
+        self.listed = set()
+        self.tracked = set()
+        # Listed hashes already seen in a block, so they are not looked up again;
+        # never more than are listed
+        self.seen = set()
+
+    def refresh_tracked(self):
+        listed = None
+        if self.journal is not None:
+            listed = set(self.journal.unconfirmed())
+        elif self.pending_file is not None and os.path.exists(self.pending_file):
+            # fund.py rewrites the file for every wait; reread it only when it changes
+            mtime = os.path.getmtime(self.pending_file)
+            if mtime != self.pending_mtime:
+                self.pending_mtime = mtime
+                with open(self.pending_file) as f:
+                    listed = {norm_hash(line.strip()) for line in f if line.strip()}
+        if listed is not None:
+            self.listed = listed
+            self.seen &= listed
+        self.tracked = self.listed - self.seen
+
+    def fetch_block(self, block):
+        try:
+            return api.GetTransactionsForTxBlock(str(block)) or []
+        except APIError as e:
+            if NO_TRANSACTIONS not in str(e):
+                # Sampled as empty, but not silently
+                print("Could not fetch block {}: {}".format(block, e))
+            return []
+
+    def sample(self, block, info, lookups=True):
+        hash_lists = self.fetch_block(block)
+        sizes = [len(hashes or []) for hashes in hash_lists]
+        for hashes in hash_lists:
+            self.seen.update(h for h in map(norm_hash, hashes or []) if h in self.listed)
+
+        self.refresh_tracked()
+        status = Counter()
+        confirmed = errors = 0
+        for h, r, error in lookup_pending(sorted(self.tracked) if lookups else [], self.threads):
+            if error is not None or r is None:
+                errors += 1
+            elif r.get("confirmed"):
+                confirmed += 1
+                self.seen.add(h)
+            else:
+                status.update([r.get("info", "?")])
+        return {
+            "time": "{:.3f}".format(time.time()),
+            "block": block,
+            "ds_block": info.get("NumDSBlocks"),
+            "num_txns": sum(sizes),
+            "tx_rate": info.get("TransactionRate"),
+            "shard_peers": ";".join(str(p) for p in info.get("ShardingStructure", {}).get("NumPeers", [])),
+            "mb_sizes": ";".join(str(s) for s in sizes),
+            "tracked": len(self.tracked),
+            "confirmed": confirmed if lookups else "",
+            "unconfirmed": sum(status.values()) if lookups else "",
+            "lookup_errors": errors if lookups else "",
+            "pending_info": ";".join("{}={}".format(k, v) for k, v in status.most_common()),
+        }
+
+    def run(self, start_block=None, interval=POLL_SLEEP, count=None):
+        new_file = not os.path.exists(self.out) or os.path.getsize(self.out) == 0
+        with open(self.out, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            if new_file:
+                writer.writeheader()
+            next_block = start_block
+            written = 0
+            while count is None or written < count:
+                info = api.GetBlockchainInfo()
+                latest = int(info["NumTxBlocks"]) - 1
+                if next_block is None:
+                    next_block = latest
+                # One row per block, catching up if a sample took longer than an
+                # epoch; pending transactions are only looked up for the latest
+                while next_block <= latest and (count is None or written < count):
+                    row = self.sample(next_block, info, next_block == latest)
+                    writer.writerow(row)
+                    f.flush()
+                    print("Block {block}: {num_txns} txns, micro-blocks {mb_sizes}, tracked {tracked}, "
+                        "confirmed {confirmed}, unconfirmed {unconfirmed} {pending_info}".format(**row), flush=True)
+                    next_block += 1
+                    written += 1
+                time.sleep(interval)
+
 if __name__ == "__main__":
-    pp_blockchaininfo()
-    # pp_gettxblock()
-    # pp_getpending()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sample chain and mempool state once per TxBlock")
+    parser.add_argument("--once", action="store_true", help="print GetBlockchainInfo and exit")
+    parser.add_argument("--out", default=SAMPLES_FILE, help="CSV file to append samples to")
+    parser.add_argument("--pending", default=PENDING_FILE, help="file of transaction hashes to follow")
+    parser.add_argument("--journal", default=None, help="follow the unconfirmed transactions of this run journal instead")
+    parser.add_argument("--threads", type=int, default=LOOKUP_THREADS, help="concurrent GetPendingTxn batches")
+    parser.add_argument("--start", type=int, default=None, help="first TxBlock to sample; default the latest")
+    parser.add_argument("--count", type=int, default=None, help="stop after this many samples")
+    parser.add_argument("--interval", type=float, default=POLL_SLEEP, help="seconds between checks for a new TxBlock")
+    args = parser.parse_args()
+
+    if args.once:
+        pp_blockchaininfo()
+    else:
+        try:
+            Sampler(args.out, args.pending, args.journal, args.threads).run(args.start, args.interval, args.count)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Persistent pool of sender processes. Each worker sets up its chain, HTTP
+# session and nonce allocator once in the initializer and keeps loaded contracts
+# around, so consecutive phases (e.g. bestow, then configureResolver) reuse the
+# same processes. Work is cut into a few chunks per worker instead of one task
+# per account.
+import math
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+
+from pyzil.contract import Contract
+from pyzil.zilliqa import chain
+
+import metrics
+import nonce_alloc
+from batch_submit import get_session
+
+CHAIN_VERSION = 1
+TASKS_PER_WORKER = 4
+MIN_CHUNK_SIZE = 50
+
+# Contract address -> Contract, per worker process
+_contracts = {}
+
+def init_worker(endpoint, chain_version, allocator, shared_metrics=None):
+    chain.set_active_chain(chain.BlockChain(endpoint, version=chain_version, network_id=0))
+    get_session(endpoint)
+    if allocator is not None:
+        nonce_alloc.attach(allocator)
+    metrics.attach(shared_metrics)
+
+def get_contract(address):
+    contract = _contracts.get(address)
+    if contract is None:
+        contract = _contracts[address] = Contract.load_from_address(address, load_state=False)
+    return contract
+
+class WorkerPool:
+    def __init__(self, endpoint, max_workers, allocator=None, chain_version=CHAIN_VERSION, shared_metrics=None):
+        self.endpoint = endpoint
+        self.max_workers = max_workers
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                initargs=(endpoint, chain_version, allocator, shared_metrics))
+
+    def chunk_size(self, n):
+        return max(MIN_CHUNK_SIZE, math.ceil(n / (self.max_workers * TASKS_PER_WORKER)))
+
+    def map_chunks(self, fn, items, *args):
+        # Calls fn(chunk, *args) in the workers and yields results as they complete
+        size = self.chunk_size(len(items))
+        tasks = [self.executor.submit(fn, items[i:i + size], *args) for i in range(0, len(items), size)]
+        for future in futures.as_completed(tasks):
+            try:
+                yield future.result()
+            except Exception as e:
+                print("Worker error: {}".format(e), flush=True)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
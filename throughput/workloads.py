@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Transition parameters for the throughput workloads. Shared by fund.py, which
+# signs and sends them live, and presign.py, which signs them offline.
+import hashlib
+
+from pyzil.contract import Contract
+
+rootNode = "0x0000000000000000000000000000000000000000000000000000000000000000"
+nullAddress = "0x0000000000000000000000000000000000000000"
+
+def get_token_id(owner):
+    return str(int(hashlib.md5(owner.encode('utf-8')).hexdigest(), 16))
+
+def parentLabelToNode(parentNode, label):
+    label_hash = hashlib.sha256(label.encode('utf-8')).hexdigest()
+    parentNode = parentNode[2:]
+    concat = bytes.fromhex(parentNode + label_hash)
+    node = hashlib.sha256(concat).hexdigest()
+    return '0x' + node
+
+# Each builder takes (src, dest, amount) and returns (transition, params, zils).
+# Single-account workloads ignore dest.
+
+def ft_transfer(src, dest, amount):
+    return "Transfer", [
+        Contract.value_dict("to", "ByStr20", dest.address0x),
+        Contract.value_dict("tokens", "Uint128", str(amount))], 0
+
+def nft_mint(src, dest, amount):
+    return "mint", [
+        Contract.value_dict("to", "ByStr20", dest.address0x),
+        Contract.value_dict("tokenId", "Uint256", get_token_id(dest.address0x))], 0
+
+def nft_transfer(src, dest, amount):
+    return "transfer", [
+        Contract.value_dict("tokenOwner", "ByStr20", src.address0x),
+        Contract.value_dict("to", "ByStr20", dest.address0x),
+        Contract.value_dict("tokenId", "Uint256", get_token_id(src.address0x))], 0
+
+def bestow(src, dest, amount):
+    label = dest.bech32_address
+    return "bestow", [
+        Contract.value_dict("node", "ByStr32", parentLabelToNode(rootNode, label)),
+        Contract.value_dict("label", "String", label),
+        Contract.value_dict("owner", "ByStr20", dest.address0x),
+        Contract.value_dict("resolver", "ByStr20", nullAddress)], 0
+
+def configure_resolver(src, dest, amount):
+    label = src.bech32_address
+    return "configureResolver", [
+        Contract.value_dict("recordOwner", "ByStr20", src.address0x),
+        Contract.value_dict("node", "ByStr32", parentLabelToNode(rootNode, label)),
+        Contract.value_dict("resolver", "ByStr20", src.address0x)], 0
+
+def register_ownership(src, dest, amount):
+    return "registerOwnership", [
+        Contract.value_dict("ipfs_cid", "String", src.bech32_address)], 0
+
+def donate(src, dest, amount):
+    return "Donate", [], amount
+
+# name -> (builder, who sends: 'genesis' fans out to every account, 'accounts'
+# has each account send to a shuffled peer, 'self' has each account call once).
+# A builder of None is a native ZIL transfer.
+WORKLOADS = {
+    "fund": (None, "genesis"),
+    "transfer": (None, "accounts"),
+    "ft-transfer": (ft_transfer, "accounts"),
+    "nft-mint": (nft_mint, "genesis"),
+    "nft-transfer": (nft_transfer, "accounts"),
+    "bestow": (bestow, "genesis"),
+    "configureResolver": (configure_resolver, "self"),
+    "registerOwnership": (register_ownership, "self"),
+    "donate": (donate, "self"),
+}